@@ -0,0 +1,262 @@
+import os
+import io
+import csv
+import logging
+import threading
+from contextlib import contextmanager
+
+import pandas as pd
+
+from grafo_agua import ARCHIVOS_DATOS
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se serializan los hilos del proceso
+    fcntl = None
+
+COLUMNAS_NODOS = ['id_nodo', 'latitud', 'longitud', 'tipo', 'estado']
+COLUMNAS_PUNTOS = ['nombre', 'latitud', 'longitud', 'tipo', 'prioridad', 'poblacion_afectada']
+COLUMNAS_ARISTAS = ['origen', 'destino', 'distancia', 'estado', 'capacidad']
+
+# Bytes del final del archivo que se recuerdan para detectar reescrituras externas
+_TESTIGO_BYTES = 64
+
+class ArchivoCSV:
+    """Append-only writer for one data CSV with an in-memory index of its keys.
+
+    Inserts append a single line under a thread lock and an exclusive
+    ``flock`` on ``<ruta>.lock``, so concurrent requests and processes never
+    interleave or lose rows. Uniqueness is checked against the key index; when
+    another process appends, only the new tail of the file is parsed. Rewrites
+    (or shrinking files) trigger a full reload of the key column. Every
+    ``umbral_compactacion`` appends the file is compacted: duplicate keys are
+    collapsed to their last row, keeping first-appearance order.
+
+    ``actualizar`` and ``quitar`` edit or delete rows with an atomic rewrite
+    (temporary file and ``os.replace``) under the same locks, so no
+    concurrent append is lost. A file without a single key column
+    (``clave=None``, e.g. the edges) only supports those two.
+    """
+
+    def __init__(self, ruta, columnas, clave, umbral_compactacion=1000):
+        self.ruta = ruta
+        self.columnas = list(columnas)
+        self.clave = clave
+        self.umbral_compactacion = umbral_compactacion
+        self._lock = threading.Lock()
+        self._claves = None
+        self._firma = None
+        self._testigo = b''
+        self._anexadas = 0
+
+    @contextmanager
+    def _bloqueo(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.ruta + '.lock', 'a') as candado:
+                fcntl.flock(candado, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(candado, fcntl.LOCK_UN)
+
+    def _encabezado(self):
+        try:
+            with open(self.ruta, newline='') as f:
+                return next(csv.reader(f), None)
+        except FileNotFoundError:
+            return None
+
+    def _columna_clave(self, encabezado):
+        """Position of the key column, matched case-insensitively (``nombre``/``Nombre``)."""
+        return self._posicion(encabezado, self.clave) if self.clave is not None else None
+
+    @staticmethod
+    def _posicion(encabezado, nombre):
+        for i, columna in enumerate(encabezado or []):
+            if columna.lower() == nombre.lower():
+                return i
+        return None
+
+    def _recordar_estado(self):
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            self._firma, self._testigo = None, b''
+            return
+        self._firma = (st.st_mtime_ns, st.st_size)
+        with open(self.ruta, 'rb') as f:
+            f.seek(max(0, st.st_size - _TESTIGO_BYTES))
+            self._testigo = f.read()
+
+    def _recargar(self):
+        encabezado = self._encabezado()
+        posicion = self._columna_clave(encabezado)
+        if posicion is None:
+            self._claves = set()
+        else:
+            claves = pd.read_csv(self.ruta, usecols=[posicion], dtype=str).iloc[:, 0]
+            self._claves = set(claves.dropna())
+        self._recordar_estado()
+
+    def _sincronizar(self):
+        """Bring the key index up to date with changes made by others."""
+        if self._claves is None:
+            self._recargar()
+            return
+        try:
+            st = os.stat(self.ruta)
+        except FileNotFoundError:
+            self._claves, self._firma, self._testigo = set(), None, b''
+            return
+        if self._firma == (st.st_mtime_ns, st.st_size):
+            return
+
+        tamano_previo = self._firma[1] if self._firma else 0
+        if st.st_size > tamano_previo:
+            with open(self.ruta, 'rb') as f:
+                f.seek(max(0, tamano_previo - len(self._testigo)))
+                testigo = f.read(len(self._testigo))
+                if testigo == self._testigo:
+                    # Solo se anexaron filas: se lee únicamente la cola nueva
+                    posicion = self._columna_clave(self._encabezado())
+                    cola = f.read().decode('utf-8', errors='replace')
+                    for fila in csv.reader(io.StringIO(cola)):
+                        if posicion is not None and len(fila) > posicion and fila[posicion]:
+                            self._claves.add(fila[posicion])
+                    self._recordar_estado()
+                    return
+        self._recargar()
+
+    def existe(self, clave):
+        """True if ``clave`` is already present in the file."""
+        with self._bloqueo():
+            self._sincronizar()
+            return str(clave) in self._claves
+
+    def agregar(self, fila):
+        """Append ``fila`` (a dict) unless its key already exists; returns False on duplicates."""
+        with self._bloqueo():
+            self._sincronizar()
+            clave = str(fila[self.clave])
+            if clave in self._claves:
+                return False
+
+            encabezado = self._encabezado()
+            nuevo = not encabezado
+            if nuevo:
+                encabezado = self.columnas
+            por_nombre = {k.lower(): v for k, v in fila.items()}
+
+            with open(self.ruta, 'a+b') as f:
+                f.seek(0, os.SEEK_END)
+                salida = io.StringIO()
+                escritor = csv.writer(salida, lineterminator='\n')
+                if nuevo:
+                    escritor.writerow(encabezado)
+                elif f.tell() > 0:
+                    f.seek(-1, os.SEEK_END)
+                    if f.read(1) != b'\n':
+                        salida.write('\n')
+                escritor.writerow([por_nombre.get(c.lower(), '') for c in encabezado])
+                f.write(salida.getvalue().encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+
+            self._claves.add(clave)
+            self._recordar_estado()
+            self._anexadas += 1
+            if self._anexadas >= self.umbral_compactacion:
+                self._compactar()
+            return True
+
+    def _coincidentes(self, coincidencias, otras=()):
+        """The file as text, the mask of rows matching ``coincidencias`` and the column positions.
+
+        ``None`` for an empty file. Must run under ``_bloqueo()``.
+        """
+        self._sincronizar()
+        encabezado = self._encabezado()
+        if not encabezado:
+            return None
+        posiciones = {}
+        for nombre in (*coincidencias, *otras):
+            posicion = self._posicion(encabezado, nombre)
+            if posicion is None:
+                raise KeyError(f"Columna inexistente en {self.ruta}: {nombre}")
+            posiciones[nombre] = posicion
+
+        df = pd.read_csv(self.ruta, dtype=str, keep_default_na=False)
+        filas = pd.Series(True, index=df.index)
+        for nombre, valor in coincidencias.items():
+            filas &= df.iloc[:, posiciones[nombre]] == str(valor)
+        return df, filas, posiciones
+
+    def _reescribir(self, df):
+        temporal = self.ruta + '.tmp'
+        df.to_csv(temporal, index=False)
+        os.replace(temporal, self.ruta)
+
+    def actualizar(self, coincidencias, cambios):
+        """Set ``cambios`` on every row whose columns equal all of ``coincidencias``.
+
+        Both are ``{columna: valor}`` dicts, matched case-insensitively
+        against the header. Values are compared and written as text, so the
+        other cells keep their exact formatting. Returns the rows changed;
+        the file is only rewritten if there is at least one.
+        """
+        with self._bloqueo():
+            leido = self._coincidentes(coincidencias, cambios)
+            if leido is None:
+                return 0
+            df, filas, posiciones = leido
+            cantidad = int(filas.sum())
+            if cantidad:
+                for nombre, valor in cambios.items():
+                    df.loc[filas, df.columns[posiciones[nombre]]] = str(valor)
+                self._reescribir(df)
+                self._recordar_estado()
+            return cantidad
+
+    def quitar(self, coincidencias):
+        """Delete every row whose columns equal all of ``coincidencias``; returns the rows deleted."""
+        with self._bloqueo():
+            leido = self._coincidentes(coincidencias)
+            if leido is None:
+                return 0
+            df, filas, _ = leido
+            cantidad = int(filas.sum())
+            if cantidad:
+                self._reescribir(df[~filas])
+                # Otra fila aún puede tener la misma clave: se relee la columna
+                self._recargar()
+            return cantidad
+
+    def compactar(self):
+        """Collapse duplicate keys to their last row and rewrite the file atomically."""
+        with self._bloqueo():
+            self._compactar()
+
+    def _compactar(self):
+        self._anexadas = 0
+        encabezado = self._encabezado()
+        posicion = self._columna_clave(encabezado)
+        if posicion is None:
+            return
+        df = pd.read_csv(self.ruta, dtype=str, keep_default_na=False)
+        columna = df.columns[posicion]
+        # Último valor de cada clave, en el orden de su primera aparición
+        ultimos = df.drop_duplicates(columna, keep='last').set_index(columna)
+        orden = df[columna].drop_duplicates(keep='first')
+        compacto = ultimos.loc[orden].reset_index()[df.columns]
+
+        self._reescribir(compacto)
+        self._claves = set(compacto[columna]) - {''}
+        self._recordar_estado()
+        logging.info(f"Compacted {self.ruta}: {len(df)} -> {len(compacto)} rows")
+
+nodos = ArchivoCSV(ARCHIVOS_DATOS['nodos'], COLUMNAS_NODOS, 'id_nodo')
+puntos_criticos = ArchivoCSV(ARCHIVOS_DATOS['puntos_criticos'], COLUMNAS_PUNTOS, 'nombre')
+aristas = ArchivoCSV(ARCHIVOS_DATOS['aristas'], COLUMNAS_ARISTAS, None)
@@ -1,11 +1,22 @@
 import os
+import math
 import logging
 import json
 import time
+import threading
+import multiprocessing
+from datetime import datetime, timedelta, timezone
 import pandas as pd
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, render_template, jsonify, request, url_for, Response, stream_with_context
 from extensions import db  # Importa db desde extensions.py
-from grafo_agua import cargar_datos, construir_grafo, calcular_rutas_y_flujos
+from grafo_agua import cargar_datos, calcular_rutas_y_flujos, MODOS_FLUJO, MOTORES
+from cache_grafo import cache as cache_grafo
+from cache_resultados import CacheResultados
+from exportacion import lineas_ndjson, grafo_columnar, comprimir
+from trabajos import GestorTrabajos
+from teselas import ZOOM_MAXIMO
+import almacen_datos
+from perfil_db import opciones_motor, aplicar_perfil_sqlite, crear_indices
 
 logging.basicConfig(level=logging.DEBUG)
 
@@ -13,230 +24,503 @@ app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-for-water-system")
 
 app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///sumaq_yaku.db"
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = opciones_motor(app.config["SQLALCHEMY_DATABASE_URI"])
 
 db.init_app(app)
 
+ESTADOS_NODO = ('transitable', 'obstaculo', 'mantenimiento')
+ESTADOS_ARISTA = ('transitable', 'bloqueado', 'mantenimiento')
+
+TRABAJADORES_PARALELOS = int(os.environ.get("TRABAJADORES_PARALELOS", 0)) or None
+
+# Resultados de /procesar; CACHE_RESULTADOS_DIR activa el nivel en disco
+cache_resultados = CacheResultados(
+    max_bytes=int(os.environ.get("CACHE_RESULTADOS_MB", 64)) * 2**20,
+    directorio=os.environ.get("CACHE_RESULTADOS_DIR") or None,
+)
+cache_grafo.suscribir(lambda: cache_resultados.purgar(cache_grafo.firma_archivos()))
+
+gestor_trabajos = GestorTrabajos(max_trabajadores=int(os.environ.get("TRABAJADORES_PROCESAMIENTO", 2)))
+
 # Importa los modelos después de inicializar db
-from models import Embalse, PuntoCritico, Nodo, Arista, Procesamiento, HistorialRuta
+from models import Embalse, PuntoCritico, Nodo, Arista, Procesamiento
+from historial import (filas_historial, guardar_procesamiento, EscritorHistorial, contadores as contadores_historial,
+                       decodificar_cursor, pagina_procesamientos, pagina_rutas, tiempo_promedio, flujo_por_dia,
+                       destinos_inalcanzables)
+from importacion import importar_tablas, completar_distancias
+from grafo_db import CargadorGrafoDB
+
+# Los procesos de EvaluadorParalelo (forkserver/spawn) vuelven a importar el módulo
+# principal: solo el proceso servidor prepara la base de datos, el grafo y los hilos
+ARRANQUE = multiprocessing.parent_process() is None
+
+# HISTORIAL_DIFERIDO=1 guarda el historial en segundo plano, fuera de la petición
+escritor_historial = EscritorHistorial(app) if os.environ.get("HISTORIAL_DIFERIDO") else None
+
+if ARRANQUE:
+    with app.app_context():
+        aplicar_perfil_sqlite(db.engine)
+        db.create_all()
+        crear_indices(db.engine, db.metadata)
+        contadores_historial.contar()
+
+# FUENTE_GRAFO=db construye el grafo desde las tablas en lugar de los CSV;
+# REFRESCO_GRAFO_S > 0 aplica cada tantos segundos las filas modificadas
+if os.environ.get("FUENTE_GRAFO") == "db":
+    cache_grafo.usar_cargador(CargadorGrafoDB(app))
+
+def _refrescar_grafo_periodicamente(intervalo):
+    while True:
+        time.sleep(intervalo)
+        try:
+            cache_grafo.refrescar()
+        except Exception as e:
+            logging.warning(f"Graph refresh from database failed: {e}")
+
+if ARRANQUE and cache_grafo.cargador is not None and float(os.environ.get("REFRESCO_GRAFO_S", 0)) > 0:
+    threading.Thread(target=_refrescar_grafo_periodicamente, args=(float(os.environ["REFRESCO_GRAFO_S"]),),
+                     name='refresco-grafo', daemon=True).start()
 
-with app.app_context():
-    db.create_all()
+if ARRANQUE:
+    cache_grafo.calentar()
 
 @app.route("/")
 def home():
     """Render the main interface for the water distribution system."""
     return render_template("index.html")
 
-@app.route("/procesar", methods=["POST"])
-def procesar():
-    """Process water distribution data and calculate optimal routes and flows."""
+def _opciones_procesamiento(params):
+    """Validate the processing options of a request body; returns ``(opciones, error)``."""
+    modo_flujo = params.get('modo_flujo', 'por_destino')
+    if modo_flujo not in MODOS_FLUJO:
+        return None, f"modo_flujo debe ser uno de: {', '.join(MODOS_FLUJO)}"
+    motor = params.get('motor', 'networkx')
+    if motor not in MOTORES:
+        return None, f"motor debe ser uno de: {', '.join(MOTORES)}"
+    paralelo = params.get('paralelo', False)
+    if not isinstance(paralelo, bool):
+        return None, "paralelo debe ser true o false"
+    return {'modo_flujo': modo_flujo, 'motor': motor, 'paralelo': paralelo}, None
+
+def _sin_progreso(etapa, avance=0.0):
+    pass
+
+def _url_grafo(version_grafo):
+    # Ruta fija: también se arma fuera de una petición (trabajos en segundo plano)
+    return f"/api/grafo?version={version_grafo}"
+
+def _agregar_coordenadas(rutas_destacadas, G):
+    # El mapa dibuja las rutas sin tener todos los nodos cargados
+    for ruta in rutas_destacadas:
+        posiciones = (G.nodes[n].get('pos') for n in ruta['ruta'] if n in G)
+        ruta['coordenadas'] = [list(p) for p in posiciones if p and all(math.isfinite(c) for c in p)]
+
+def ejecutar_procesamiento(modo_flujo='por_destino', motor='networkx', paralelo=False, progreso=None):
+    """Run the routing/flow pipeline and store it in the history.
+
+    Unchanged data with the same source and options is answered from
+    ``cache_resultados`` without recomputing or adding a history row.
+    Returns ``(respuesta, codigo)``. ``progreso(etapa, avance)`` is called as
+    each stage starts and advances. ``paralelo`` evaluates destinations on
+    the process pool (``TRABAJADORES_PARALELOS`` workers, default one per core).
+
+    The run and its routes are saved in one transaction; with
+    ``HISTORIAL_DIFERIDO`` they are queued instead and ``procesamiento_id``
+    is ``None``.
+    """
     start_time = time.time()
-    
-    try:
-        embalses, puntos, nodos, aristas = cargar_datos()
-        
-        G = construir_grafo(embalses, puntos, nodos, aristas)
+    progreso = progreso or _sin_progreso
+    # En modo super-sumidero se evalúan todos los nodos de distribución
+    max_destinos = None if modo_flujo == 'super_sumidero' else 10
 
-        # Usar solo el primer embalse como fuente, como antes
-        if len(embalses) > 0:
-            fuente = embalses.iloc[0]['Nombre'] if 'Nombre' in embalses.columns else embalses.iloc[0]['nombre']
-        else:
-            return jsonify({"error": "No reservoirs found in data"}), 400
+    try:
+        # La firma se toma antes de cargar: un cambio posterior nunca queda bajo esta clave
+        firma = cache_grafo.firma_archivos()
+        with cache_grafo.lectura():
+            progreso('grafo', 0.0)
+            datos = cache_grafo.obtener()
+            embalses = datos.embalses
+            G = datos.grafo
+
+            # Usar solo el primer embalse como fuente, como antes
+            if len(embalses) > 0:
+                fuente = embalses.iloc[0]['Nombre'] if 'Nombre' in embalses.columns else embalses.iloc[0]['nombre']
+            else:
+                return {"error": "No reservoirs found in data"}, 400
+
+            # Mismos datos, fuente y parámetros: se devuelve el resultado anterior
+            clave = cache_resultados.clave(firma, fuente=fuente, modo_flujo=modo_flujo, motor=motor,
+                                           paralelo=paralelo)
+            respuesta, nivel = cache_resultados.obtener(clave)
+            if respuesta is not None:
+                # El resultado vale para los datos actuales; la referencia al grafo se renueva
+                respuesta.update(version_datos=datos.version, version_grafo=datos.version_grafo,
+                                 grafo_url=_url_grafo(datos.version_grafo))
+                _agregar_coordenadas(respuesta["rutas_destacadas"], G)
+                respuesta["cache_resultado"] = nivel
+                respuesta["tiempo_procesamiento_ms"] = int((time.time() - start_time) * 1000)
+                return respuesta, 200
+
+            rutas, flujos, rutas_destacadas, distancias = calcular_rutas_y_flujos(
+                G, fuente, modo_flujo=modo_flujo, max_destinos=max_destinos,
+                G_transitable=datos.transitable, motor=cache_grafo.motor(datos, motor),
+                progreso=progreso,
+                paralelo=cache_grafo.paralelo(datos, motor, TRABAJADORES_PARALELOS) if paralelo else None
+            )
 
-        rutas, flujos, rutas_destacadas = calcular_rutas_y_flujos(G, fuente)
-        
-        processing_time_ms = int((time.time() - start_time) * 1000)
-        
-        nodos_json = []
-        for n, d in G.nodes(data=True):
-            node_data = {"id": n}
-            node_data.update(d)
-            nodos_json.append(node_data)
-        
-        aristas_json = []
-        for u, v, d in G.edges(data=True):
-            edge_data = {"origen": u, "destino": v}
-            edge_data.update(d)
-            aristas_json.append(edge_data)
+            _agregar_coordenadas(rutas_destacadas, G)
+            processing_time_ms = int((time.time() - start_time) * 1000)
+            nodos_count, aristas_count = G.number_of_nodes(), G.number_of_edges()
 
         total_rutas_calculadas = len([r for r in rutas.values() if r is not None])
         total_flujo_maximo = sum(flujos.values())
 
-        try:
-            procesamiento = Procesamiento(
-                fuente_principal=fuente,
-                total_rutas_calculadas=total_rutas_calculadas,
-                total_flujo_maximo=total_flujo_maximo,
-                tiempo_procesamiento_ms=processing_time_ms,
-                estado='exitoso',
-                detalles_json=json.dumps({
-                    "rutas_optimas": rutas,
-                    "flujos_maximos": flujos,
-                    "nodos_count": len(nodos_json),
-                    "aristas_count": len(aristas_json)
-                })
-            )
-            db.session.add(procesamiento)
-            db.session.commit()
-
-            for destino, ruta in rutas.items():
-                if ruta is not None:
-                    distancia_total = 0
-                    for i in range(len(ruta) - 1):
-                        edge_data = G.get_edge_data(ruta[i], ruta[i+1])
-                        if edge_data and 'distancia' in edge_data:
-                            distancia_total += edge_data['distancia']
-                    
-                    historial_ruta = HistorialRuta(
-                        procesamiento_id=procesamiento.id,
-                        origen=fuente,
-                        destino=destino,
-                        ruta_json=json.dumps(ruta),
-                        flujo_maximo=flujos.get(destino, 0),
-                        distancia_total=distancia_total,
-                        tiempo_estimado_h=distancia_total / 50.0 if distancia_total > 0 else 0  
-                    )
-                    db.session.add(historial_ruta)
-            
-            db.session.commit()
-            logging.info(f"Processing results saved to database (ID: {procesamiento.id})")
-            
-        except Exception as db_error:
-            logging.warning(f"Failed to save to database: {db_error}")
-            db.session.rollback()
-        
+        progreso('guardado', 0.0)
+        procesamiento = {
+            "fuente_principal": fuente,
+            "total_rutas_calculadas": total_rutas_calculadas,
+            "total_flujo_maximo": total_flujo_maximo,
+            "tiempo_procesamiento_ms": processing_time_ms,
+            "estado": 'exitoso',
+            "detalles_json": json.dumps({
+                "rutas_optimas": rutas,
+                "flujos_maximos": flujos,
+                "modo_flujo": modo_flujo,
+                "motor": motor,
+                "paralelo": paralelo,
+                "nodos_count": nodos_count,
+                "aristas_count": aristas_count
+            })
+        }
+        filas = filas_historial(fuente, rutas, flujos, distancias)
+        procesamiento_id = None
+        if escritor_historial is not None:
+            escritor_historial.encolar(procesamiento, filas)
+        else:
+            try:
+                procesamiento_id = guardar_procesamiento(procesamiento, filas)
+                logging.info(f"Processing results saved to database (ID: {procesamiento_id})")
+            except Exception as db_error:
+                logging.warning(f"Failed to save to database: {db_error}")
+
         # Solo mostrar en el panel los flujos de los destinos de rutas destacadas
         flujos_panel = {r['fin']: r['flujo_maximo'] for r in rutas_destacadas}
         rutas_panel = {r['fin']: r['ruta'] for r in rutas_destacadas}
-        return jsonify({
+        respuesta = {
             "rutas_optimas": rutas_panel,
             "flujos_maximos": flujos_panel,
-            "nodos": nodos_json,
-            "aristas": aristas_json,
             "fuente": fuente,
-            "procesamiento_id": procesamiento.id if 'procesamiento' in locals() else None,
+            "modo_flujo": modo_flujo,
+            "motor": motor,
+            "paralelo": paralelo,
+            "version_datos": datos.version,
+            "version_grafo": datos.version_grafo,
+            "grafo_url": _url_grafo(datos.version_grafo),
+            "flujo_total": total_flujo_maximo,
+            "procesamiento_id": procesamiento_id,
             "tiempo_procesamiento_ms": processing_time_ms,
             "rutas_destacadas": rutas_destacadas
-        })
+        }
+        cache_resultados.guardar(clave, respuesta)
+        respuesta["cache_resultado"] = "fallo"
+        return respuesta, 200
         
     except Exception as e:
         logging.error(f"Error processing water distribution data: {str(e)}")
-        return jsonify({"error": f"Error processing data: {str(e)}"}), 500
+        return {"error": f"Error processing data: {str(e)}"}, 500
+
+@app.route("/procesar", methods=["POST"])
+def procesar():
+    """Process water distribution data and calculate optimal routes and flows."""
+    opciones, error = _opciones_procesamiento(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+    respuesta, codigo = ejecutar_procesamiento(**opciones)
+    return jsonify(respuesta), codigo
+
+@app.route("/api/jobs/procesar", methods=["POST"])
+def enviar_trabajo_procesar():
+    """Queue a processing run and return its job id right away."""
+    opciones, error = _opciones_procesamiento(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    def tarea(trabajo):
+        with app.app_context():
+            return ejecutar_procesamiento(progreso=trabajo.avanzar, **opciones)
+
+    # Trabajos idénticos sobre la misma versión de datos se comparten
+    clave = ('procesar', cache_grafo.version(), opciones['modo_flujo'], opciones['motor'], opciones['paralelo'])
+    trabajo, nuevo = gestor_trabajos.enviar('procesar', clave, opciones, tarea)
+    return jsonify({
+        "id": trabajo.id,
+        "estado": trabajo.estado,
+        "duplicado": not nuevo,
+        "url": url_for('estado_trabajo', id_trabajo=trabajo.id)
+    }), 202
+
+@app.route("/api/jobs/<id_trabajo>")
+def estado_trabajo(id_trabajo):
+    """Report status, per-stage progress and, once finished, the result of a job."""
+    trabajo = gestor_trabajos.obtener(id_trabajo)
+    if trabajo is None:
+        return jsonify({"error": f"El trabajo {id_trabajo} no existe"}), 404
+    return jsonify(trabajo.to_dict())
+
+FORMATOS_GRAFO = ('ndjson', 'columnar')
+
+def _json_comprimido(datos):
+    """JSON response compressed with brotli or gzip when the client accepts it."""
+    cuerpo = json.dumps(datos, separators=(',', ':'), ensure_ascii=False).encode()
+    cuerpo, codificacion = comprimir(cuerpo, request.accept_encodings)
+    respuesta = Response(cuerpo, mimetype='application/json')
+    respuesta.vary.add('Accept-Encoding')
+    if codificacion:
+        respuesta.headers['Content-Encoding'] = codificacion
+    return respuesta
+
+@app.route("/api/grafo")
+def exportar_grafo():
+    """Export the current graph.
+
+    ``formato=ndjson`` (default) streams newline-delimited JSON, nodes then
+    edges; ``formato=columnar`` returns the compact parallel-array encoding,
+    compressed with brotli or gzip when the client accepts it.
+
+    The web map reads ``/api/teselas`` instead; this endpoint is kept for
+    external consumers that need the whole graph at once.
+    """
+    formato = request.args.get('formato', 'ndjson')
+    if formato not in FORMATOS_GRAFO:
+        return jsonify({"error": f"formato debe ser uno de: {', '.join(FORMATOS_GRAFO)}"}), 400
+    version = request.args.get('version', type=int)
+    with cache_grafo.lectura():
+        datos = cache_grafo.obtener()
+    if version is not None and version != datos.version_grafo:
+        return jsonify({
+            "error": f"La versión {version} del grafo ya no está disponible",
+            "version_grafo": datos.version_grafo
+        }), 409
+    if formato == 'ndjson':
+        return Response(stream_with_context(lineas_ndjson(cache_grafo, datos)), mimetype='application/x-ndjson')
+
+    return _json_comprimido(grafo_columnar(cache_grafo, datos))
+
+@app.route("/api/teselas/<int:z>/<int:x>/<int:y>")
+def tesela_grafo(z, x, y):
+    """Map tile ``z/x/y`` of the graph, in the base map's XYZ scheme.
+
+    Below ``ZOOM_DETALLE`` nodes are clustered into 64 px cells and edges
+    merged per pair of cells; from it on the tile carries its own nodes and
+    edges. With ``version`` the tile never changes and browsers may cache it.
+    """
+    if z > ZOOM_MAXIMO or x >= 2 ** z or y >= 2 ** z:
+        return jsonify({"error": f"La tesela {z}/{x}/{y} no existe (zoom máximo {ZOOM_MAXIMO})"}), 400
+    version = request.args.get('version', type=int)
+    with cache_grafo.lectura():
+        datos = cache_grafo.obtener()
+        if version is not None and version != datos.version_grafo:
+            return jsonify({
+                "error": f"La versión {version} del grafo ya no está disponible",
+                "version_grafo": datos.version_grafo
+            }), 409
+        tesela = cache_grafo.teselas(datos).tesela(z, x, y)
+    tesela.update(z=z, x=x, y=y, version_grafo=datos.version_grafo)
+    respuesta = _json_comprimido(tesela)
+    if version is not None:
+        respuesta.headers['Cache-Control'] = 'public, max-age=86400, immutable'
+    return respuesta
 
 @app.route("/status")
 def status():
-    """Check system status and data availability."""
-    try:
-        embalses, puntos, nodos, aristas = cargar_datos()
-
-        db_status = "ok"
-        db_counts = {}
-        try:
-            db_counts = {
-                "procesamientos": Procesamiento.query.count(),
-                "historial_rutas": HistorialRuta.query.count()
-            }
-        except Exception as db_error:
-            db_status = f"Database error: {db_error}"
-        
-        return jsonify({
-            "status": "ok",
-            "data_summary": {
-                "embalses": len(embalses),
-                "puntos_criticos": len(puntos),
-                "nodos": len(nodos),
-                "aristas": len(aristas)
-            },
-            "database_status": db_status,
-            "database_counts": db_counts
-        })
-    except Exception as e:
+    """Check system status and data availability.
+
+    Served from the cached snapshot and the in-memory history counters:
+    it never loads the data files, and only queries the database to retry
+    a history count that failed.
+    """
+    datos = cache_grafo.ultima()
+    if datos is None:
         return jsonify({
             "status": "error",
-            "message": str(e)
-        }), 500
+            "message": "Los datos de la red aún no se han cargado"
+        }), 503
+
+    contadores_historial.listos()
+    return jsonify({
+        "status": "ok",
+        "data_summary": datos.conteos,
+        "version_datos": datos.version,
+        "version_grafo": datos.version_grafo,
+        "database_status": "ok" if contadores_historial.error is None else f"Database error: {contadores_historial.error}",
+        "database_counts": contadores_historial.resumen(),
+        "cache_resultados": cache_resultados.resumen(),
+        "historial_pendiente": escritor_historial.pendientes() if escritor_historial else 0
+    })
+
+@app.route("/health/live")
+def salud_vivo():
+    """Liveness probe: the process is up and serving requests."""
+    return jsonify({"status": "ok"})
+
+@app.route("/health/ready")
+def salud_listo():
+    """Readiness probe: the graph has been built and the history counters loaded.
+
+    Reads in-memory state only, never the data files; the database is
+    only queried to retry a history count that failed.
+    """
+    pendientes = []
+    if cache_grafo.ultima() is None:
+        pendientes.append("grafo")
+    if not contadores_historial.listos():
+        pendientes.append("base_de_datos")
+    if pendientes:
+        return jsonify({"status": "no_listo", "pendientes": pendientes}), 503
+    return jsonify({"status": "ok"})
+
+def _filtros_historial(args):
+    """Validate the ``fuente``, ``desde`` and ``hasta`` filters of a history query; returns ``(filtros, error)``.
+
+    Dates are ISO 8601; a ``hasta`` without time includes that whole day.
+    Dates with an offset are converted to UTC, the time the database stores.
+    """
+    filtros = {'fuente': args.get('fuente') or None}
+    for nombre in ('desde', 'hasta'):
+        valor = args.get(nombre)
+        if not valor:
+            filtros[nombre] = None
+            continue
+        try:
+            fecha = datetime.fromisoformat(valor)
+        except ValueError:
+            return None, f"{nombre} debe ser una fecha ISO 8601 (AAAA-MM-DD o AAAA-MM-DDTHH:MM:SS)"
+        if fecha.tzinfo is not None:
+            fecha = fecha.astimezone(timezone.utc).replace(tzinfo=None)
+        if nombre == 'hasta' and len(valor) == 10:
+            fecha += timedelta(days=1)
+        filtros[nombre] = fecha
+    return filtros, None
+
+def _limite(args, defecto, maximo):
+    """Validate the ``limite`` page size; returns ``(limite, error)``."""
+    try:
+        limite = int(args.get('limite', defecto))
+    except ValueError:
+        return None, "limite debe ser un número entero"
+    if not 1 <= limite <= maximo:
+        return None, f"limite debe estar entre 1 y {maximo}"
+    return limite, None
 
 @app.route("/api/procesamientos")
 def get_procesamientos():
-    """Get all processing history records."""
+    """Get processing history records, newest first, one keyset page at a time.
+
+    Query parameters: ``limite`` (default 10), ``cursor`` (the ``siguiente``
+    of the previous page) and the ``fuente``/``desde``/``hasta`` filters.
+    """
+    filtros, error = _filtros_historial(request.args)
+    if error is None:
+        limite, error = _limite(request.args, 10, 1000)
+    if error:
+        return jsonify({"error": error}), 400
     try:
-        procesamientos = Procesamiento.query.order_by(Procesamiento.fecha_procesamiento.desc()).limit(10).all()
+        cursor = decodificar_cursor(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    try:
+        procesamientos, siguiente = pagina_procesamientos(limite, cursor, **filtros)
         return jsonify({
-            "procesamientos": [p.to_dict() for p in procesamientos]
+            "procesamientos": procesamientos,
+            "siguiente": siguiente
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 @app.route("/api/procesamiento/<int:procesamiento_id>/rutas")
 def get_rutas_procesamiento(procesamiento_id):
-    """Get route details for a specific processing run."""
+    """Get route details for a specific processing run, one keyset page at a time.
+
+    Query parameters: ``limite`` (default 500) and ``cursor`` (the
+    ``siguiente`` of the previous page).
+    """
+    limite, error = _limite(request.args, 500, 5000)
+    if error:
+        return jsonify({"error": error}), 400
     try:
-        procesamiento = Procesamiento.query.get_or_404(procesamiento_id)
-        rutas = HistorialRuta.query.filter_by(procesamiento_id=procesamiento_id).all()
-        
+        despues = int(request.args['cursor']) if request.args.get('cursor') else None
+    except ValueError:
+        return jsonify({"error": "cursor debe ser un número entero"}), 400
+    try:
+        procesamiento = db.session.get(Procesamiento, procesamiento_id)
+        if procesamiento is None:
+            return jsonify({"error": f"El procesamiento {procesamiento_id} no existe"}), 404
+        rutas, siguiente = pagina_rutas(procesamiento_id, limite, despues)
+
         return jsonify({
             "procesamiento": procesamiento.to_dict(),
-            "rutas": [r.to_dict() for r in rutas]
+            "rutas": rutas,
+            "siguiente": siguiente
         })
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/procesamientos/tiempo-promedio")
+def get_tiempo_promedio():
+    """Average, minimum and maximum processing time, computed in SQL over the filtered runs."""
+    filtros, error = _filtros_historial(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        return jsonify(tiempo_promedio(**filtros))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/procesamientos/flujo-diario")
+def get_flujo_diario():
+    """Total maximum flow and run count per day, computed in SQL over the filtered runs."""
+    filtros, error = _filtros_historial(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        return jsonify({"dias": flujo_por_dia(**filtros)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route("/api/procesamientos/destinos-inalcanzables")
+def get_destinos_inalcanzables():
+    """Destinations most often unreachable in the filtered runs (``limite``, default 20), computed in SQL."""
+    filtros, error = _filtros_historial(request.args)
+    if error is None:
+        limite, error = _limite(request.args, 20, 1000)
+    if error:
+        return jsonify({"error": error}), 400
+    try:
+        return jsonify({"destinos": destinos_inalcanzables(limite, **filtros)})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route("/api/data/import", methods=["POST"])
 def import_csv_to_db():
-    """Import CSV data to database tables."""
+    """Import CSV data to database tables.
+
+    Rows whose key already exists are skipped; the response reports, per
+    table, how many rows were inserted, skipped and dropped as invalid.
+    """
     try:
         embalses, puntos, nodos, aristas = cargar_datos()
+        aristas = completar_distancias(aristas, ('embalses', embalses), ('puntos_criticos', puntos),
+                                       ('nodos', nodos))
+        informe = importar_tablas({
+            'embalses': embalses,
+            'puntos_criticos': puntos,
+            'nodos': nodos,
+            'aristas': aristas,
+        })
 
-        for _, row in embalses.iterrows():
-            embalse = Embalse.query.filter_by(nombre=row['Nombre']).first()
-            if not embalse:
-                embalse = Embalse(
-                    nombre=row['Nombre'],
-                    latitud=row['Latitud'],
-                    longitud=row['Longitud'],
-                    volumen_almacenado_m3=row['Volumen_Almacenado_m3']
-                )
-                db.session.add(embalse)
-        
-        for _, row in puntos.iterrows():
-            punto = PuntoCritico.query.filter_by(nombre=row['Nombre']).first()
-            if not punto:
-                punto = PuntoCritico(
-                    nombre=row['Nombre'],
-                    latitud=row['Latitud'],
-                    longitud=row['Longitud'],
-                    tipo=row['Tipo']
-                )
-                db.session.add(punto)
-                
-        for _, row in nodos.iterrows():
-            nodo = Nodo.query.filter_by(id_nodo=row['id_nodo']).first()
-            if not nodo:
-                nodo = Nodo(
-                    id_nodo=row['id_nodo'],
-                    latitud=row['latitud'],
-                    longitud=row['longitud'],
-                    tipo=row['tipo'],
-                    estado=row['estado']
-                )
-                db.session.add(nodo)
-
-        for _, row in aristas.iterrows():
-            arista = Arista.query.filter_by(origen=row['origen'], destino=row['destino']).first()
-            if not arista:
-                arista = Arista(
-                    origen=row['origen'],
-                    destino=row['destino'],
-                    distancia=row['distancia'],
-                    estado=row['estado']
-                )
-                db.session.add(arista)
-        
-        db.session.commit()
+        # Con el grafo en la base de datos, las filas importadas entran como un delta
+        if cache_grafo.cargador is not None:
+            cache_grafo.refrescar()
 
         counts = {
             "embalses": Embalse.query.count(),
@@ -248,6 +532,7 @@ def import_csv_to_db():
         return jsonify({
             "status": "success",
             "message": "CSV data imported successfully",
+            "importacion": informe,
             "counts": counts
         })
         
@@ -256,9 +541,38 @@ def import_csv_to_db():
         logging.error(f"Error importing CSV data: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route("/api/grafo/refrescar", methods=["POST"])
+def refrescar_grafo():
+    """Apply the database rows changed since the last load to the cached graph."""
+    if cache_grafo.cargador is None:
+        return jsonify({"error": "El grafo se carga desde los CSV; use FUENTE_GRAFO=db"}), 409
+    try:
+        elementos = cache_grafo.refrescar()
+    except Exception as e:
+        logging.error(f"Error refreshing graph from database: {e}")
+        return jsonify({"error": f"Error refrescando el grafo: {str(e)}"}), 500
+    return jsonify({
+        "status": "success",
+        "reconstruido": elementos is None,
+        "cambios": len(elementos or []),
+        "version_grafo": cache_grafo.version_grafo
+    })
+
+def _rechazar_si_grafo_db():
+    """409 for the endpoints that edit the CSV files while the graph is built from the database."""
+    if cache_grafo.cargador is None:
+        return None
+    return jsonify({
+        "error": "El grafo se carga desde la base de datos (FUENTE_GRAFO=db); los cambios a los CSV "
+                 "no llegan al grafo. Modifique las tablas y use /api/grafo/refrescar"
+    }), 409
+
 @app.route("/api/agregar-nodo", methods=["POST"])
 def agregar_nodo():
     """Agregar un nuevo nodo al archivo CSV."""
+    rechazo = _rechazar_si_grafo_db()
+    if rechazo is not None:
+        return rechazo
     try:
         data = request.get_json()
         
@@ -267,13 +581,6 @@ def agregar_nodo():
             if field not in data:
                 return jsonify({"error": f"Campo requerido faltante: {field}"}), 400
 
-        try:
-            nodos_df = pd.read_csv('data/nodos.csv')
-            if data['id_nodo'] in nodos_df['id_nodo'].values:
-                return jsonify({"error": f"El ID {data['id_nodo']} ya existe"}), 400
-        except FileNotFoundError:
-            nodos_df = pd.DataFrame(columns=['id_nodo', 'latitud', 'longitud', 'tipo', 'estado'])
-
         nuevo_nodo = {
             'id_nodo': data['id_nodo'],
             'latitud': float(data['latitud']),
@@ -282,11 +589,11 @@ def agregar_nodo():
             'estado': data['estado']
         }
 
-        nuevo_nodo_df = pd.DataFrame([nuevo_nodo])
-        nodos_actualizado = pd.concat([nodos_df, nuevo_nodo_df], ignore_index=True)
+        with cache_grafo.escritura():
+            if not almacen_datos.nodos.agregar(nuevo_nodo):
+                return jsonify({"error": f"El ID {data['id_nodo']} ya existe"}), 400
+            cache_grafo.agregar_nodo(nuevo_nodo)
 
-        nodos_actualizado.to_csv('data/nodos.csv', index=False)
-        
         logging.info(f"Nuevo nodo agregado: {data['id_nodo']} en ({data['latitud']}, {data['longitud']})")
         
         return jsonify({
@@ -299,9 +606,41 @@ def agregar_nodo():
         logging.error(f"Error agregando nodo: {str(e)}")
         return jsonify({"error": f"Error agregando nodo: {str(e)}"}), 500
 
+@app.route("/api/quitar-nodo", methods=["POST"])
+def quitar_nodo():
+    """Quitar un nodo de distribución y sus conexiones del grafo en memoria."""
+    rechazo = _rechazar_si_grafo_db()
+    if rechazo is not None:
+        return rechazo
+    try:
+        data = request.get_json()
+
+        if 'id_nodo' not in data:
+            return jsonify({"error": "Campo requerido faltante: id_nodo"}), 400
+
+        with cache_grafo.escritura():
+            if not almacen_datos.nodos.quitar({'id_nodo': data['id_nodo']}):
+                return jsonify({"error": f"El nodo {data['id_nodo']} no existe"}), 404
+            cache_grafo.quitar_nodo(data['id_nodo'])
+
+        logging.info(f"Nodo {data['id_nodo']} quitado")
+
+        return jsonify({
+            "status": "success",
+            "message": f"Nodo {data['id_nodo']} quitado exitosamente",
+            "version_grafo": cache_grafo.version_grafo
+        })
+
+    except Exception as e:
+        logging.error(f"Error quitando nodo: {str(e)}")
+        return jsonify({"error": f"Error quitando nodo: {str(e)}"}), 500
+
 @app.route("/api/agregar-punto-critico", methods=["POST"])
 def agregar_punto_critico():
     """Agregar un nuevo punto crítico al archivo CSV."""
+    rechazo = _rechazar_si_grafo_db()
+    if rechazo is not None:
+        return rechazo
     try:
         data = request.get_json()
 
@@ -310,13 +649,6 @@ def agregar_punto_critico():
             if field not in data:
                 return jsonify({"error": f"Campo requerido faltante: {field}"}), 400
 
-        try:
-            puntos_df = pd.read_csv('data/puntos_criticos.csv')
-            if data['nombre'] in puntos_df['nombre'].values:
-                return jsonify({"error": f"El punto crítico {data['nombre']} ya existe"}), 400
-        except FileNotFoundError:
-            puntos_df = pd.DataFrame(columns=['nombre', 'latitud', 'longitud', 'tipo', 'prioridad', 'poblacion_afectada'])
-
         nuevo_punto = {
             'nombre': data['nombre'],
             'latitud': float(data['latitud']),
@@ -325,12 +657,12 @@ def agregar_punto_critico():
             'prioridad': data['prioridad'],
             'poblacion_afectada': int(data.get('poblacion_afectada', 0))
         }
-        
-        nuevo_punto_df = pd.DataFrame([nuevo_punto])
-        puntos_actualizado = pd.concat([puntos_df, nuevo_punto_df], ignore_index=True)
 
-        puntos_actualizado.to_csv('data/puntos_criticos.csv', index=False)
-        
+        with cache_grafo.escritura():
+            if not almacen_datos.puntos_criticos.agregar(nuevo_punto):
+                return jsonify({"error": f"El punto crítico {data['nombre']} ya existe"}), 400
+            cache_grafo.agregar_punto_critico(nuevo_punto)
+
         logging.info(f"Nuevo punto crítico agregado: {data['nombre']} en ({data['latitud']}, {data['longitud']})")
         
         return jsonify({
@@ -343,6 +675,71 @@ def agregar_punto_critico():
         logging.error(f"Error agregando punto crítico: {str(e)}")
         return jsonify({"error": f"Error agregando punto crítico: {str(e)}"}), 500
 
+@app.route("/api/cambiar-estado-nodo", methods=["POST"])
+def cambiar_estado_nodo():
+    """Cambiar el estado de un nodo y actualizar el grafo en memoria."""
+    rechazo = _rechazar_si_grafo_db()
+    if rechazo is not None:
+        return rechazo
+    try:
+        data = request.get_json()
+
+        for field in ['id_nodo', 'estado']:
+            if field not in data:
+                return jsonify({"error": f"Campo requerido faltante: {field}"}), 400
+        if data['estado'] not in ESTADOS_NODO:
+            return jsonify({"error": f"Estado inválido, use uno de: {', '.join(ESTADOS_NODO)}"}), 400
+
+        with cache_grafo.escritura():
+            if not almacen_datos.nodos.actualizar({'id_nodo': data['id_nodo']}, {'estado': data['estado']}):
+                return jsonify({"error": f"El nodo {data['id_nodo']} no existe"}), 404
+            cache_grafo.cambiar_estado_nodo(data['id_nodo'], data['estado'])
+
+        logging.info(f"Estado del nodo {data['id_nodo']} cambiado a {data['estado']}")
+
+        return jsonify({
+            "status": "success",
+            "message": f"Nodo {data['id_nodo']} ahora está {data['estado']}",
+            "version_grafo": cache_grafo.version_grafo
+        })
+
+    except Exception as e:
+        logging.error(f"Error cambiando estado de nodo: {str(e)}")
+        return jsonify({"error": f"Error cambiando estado de nodo: {str(e)}"}), 500
+
+@app.route("/api/cambiar-estado-arista", methods=["POST"])
+def cambiar_estado_arista():
+    """Cambiar el estado de una arista (p. ej. bloquearla) y actualizar el grafo en memoria."""
+    rechazo = _rechazar_si_grafo_db()
+    if rechazo is not None:
+        return rechazo
+    try:
+        data = request.get_json()
+
+        for field in ['origen', 'destino', 'estado']:
+            if field not in data:
+                return jsonify({"error": f"Campo requerido faltante: {field}"}), 400
+        if data['estado'] not in ESTADOS_ARISTA:
+            return jsonify({"error": f"Estado inválido, use uno de: {', '.join(ESTADOS_ARISTA)}"}), 400
+
+        with cache_grafo.escritura():
+            coincidencias = {'origen': data['origen'], 'destino': data['destino']}
+            if not almacen_datos.aristas.actualizar(coincidencias, {'estado': data['estado']}):
+                return jsonify({"error": f"La arista {data['origen']} -> {data['destino']} no existe"}), 404
+            cache_grafo.cambiar_estado_arista(data['origen'], data['destino'], data['estado'])
+
+        logging.info(f"Estado de la arista {data['origen']} -> {data['destino']} cambiado a {data['estado']}")
+
+        return jsonify({
+            "status": "success",
+            "message": f"Arista {data['origen']} -> {data['destino']} ahora está {data['estado']}",
+            "version_grafo": cache_grafo.version_grafo
+        })
+
+    except Exception as e:
+        logging.error(f"Error cambiando estado de arista: {str(e)}")
+        return jsonify({"error": f"Error cambiando estado de arista: {str(e)}"}), 500
+
 @app.route("/generar-red-completa", methods=["POST"])
 def generar_red_completa():
     """Genera una red completa de 100+ nodos de distribución para Arequipa"""
@@ -355,7 +752,8 @@ def generar_red_completa():
             text=True,
             cwd='.'
         )
-        
+        cache_grafo.invalidar()
+
         if result.returncode == 0:
             try:
                 nodos_df = pd.read_csv('data/nodos.csv')
@@ -0,0 +1,55 @@
+import sys
+import time
+import logging
+import numpy as np
+import pandas as pd
+from grafo_agua import construir_grafo
+
+def generar_datos_sinteticos(num_aristas, seed=0):
+    """Genera una red sintética con ~num_aristas/3 nodos dentro de Arequipa"""
+    rng = np.random.default_rng(seed)
+    num_nodos = max(10, num_aristas // 3)
+    ids = np.array([f'N{i:07d}' for i in range(num_nodos)], dtype=object)
+
+    embalses = pd.DataFrame({
+        'Nombre': ['Embalse_Chilina'],
+        'Latitud': [-16.3969],
+        'Longitud': [-71.5375],
+        'Volumen_Almacenado_m3': [1500000],
+    })
+    puntos = pd.DataFrame({
+        'nombre': [f'PC_{i:04d}' for i in range(250)],
+        'latitud': rng.uniform(-16.45, -16.30, 250),
+        'longitud': rng.uniform(-71.60, -71.45, 250),
+        'tipo': 'obra',
+    })
+    nodos = pd.DataFrame({
+        'id_nodo': ids,
+        'latitud': rng.uniform(-16.45, -16.30, num_nodos),
+        'longitud': rng.uniform(-71.60, -71.45, num_nodos),
+        'tipo': 'tubo',
+        'estado': rng.choice(['transitable', 'transitable', 'transitable', 'obstaculo'], num_nodos),
+    })
+    aristas = pd.DataFrame({
+        'origen': ids[rng.integers(0, num_nodos, num_aristas)],
+        'destino': ids[rng.integers(0, num_nodos, num_aristas)],
+        # Un tercio sin distancia para ejercitar el cálculo haversine
+        'distancia': np.where(rng.random(num_aristas) < 0.33, np.nan, rng.uniform(0.1, 5.0, num_aristas)),
+        'estado': rng.choice(['transitable'] * 9 + ['bloqueado'], num_aristas),
+        'capacidad': 1000,
+    })
+    return embalses, puntos, nodos, aristas
+
+def main(tamanos):
+    logging.basicConfig(level=logging.WARNING)
+    for num_aristas in tamanos:
+        datos = generar_datos_sinteticos(num_aristas)
+        inicio = time.perf_counter()
+        G = construir_grafo(*datos)
+        duracion = time.perf_counter() - inicio
+        print(f"{num_aristas:>9} aristas -> {G.number_of_nodes():>8} nodos, "
+              f"{G.number_of_edges():>9} arcos en {duracion:.2f} s")
+
+if __name__ == "__main__":
+    tamanos = [int(t) for t in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    main(tamanos)
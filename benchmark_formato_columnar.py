@@ -0,0 +1,55 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import tempfile
+
+import pandas as pd
+
+from grafo_agua import ARCHIVOS_DATOS
+from formato_columnar import aplicar_esquema, guardar_columnar, leer_columnar, ruta_columnar
+from benchmark_construir_grafo import generar_datos_sinteticos
+
+def _medir(funcion):
+    inicio = time.perf_counter()
+    resultado = funcion()
+    return resultado, time.perf_counter() - inicio
+
+def _mb(df):
+    return df.memory_usage(deep=True).sum() / 1e6
+
+def comparar_tabla(tabla, ruta_csv):
+    """Load time and memory of one table: plain CSV, typed CSV and ``.npz``; plus the ``.npz`` write time."""
+    df_crudo, t_crudo = _medir(lambda: pd.read_csv(ruta_csv))
+    df_tipado, t_tipado = _medir(lambda: aplicar_esquema(pd.read_csv(ruta_csv), tabla))
+    ruta_npz = ruta_columnar(ruta_csv)
+    _, t_escritura = _medir(lambda: guardar_columnar(df_tipado, ruta_npz))
+    df_npz, t_npz = _medir(lambda: leer_columnar(ruta_npz))
+    print(f"{tabla:>16} {len(df_npz):>9} filas | CSV {t_crudo * 1000:8.1f} ms {_mb(df_crudo):8.2f} MB | "
+          f"CSV tipado {t_tipado * 1000:8.1f} ms {_mb(df_tipado):8.2f} MB | "
+          f"npz {t_npz * 1000:8.1f} ms {_mb(df_npz):8.2f} MB | escritura npz {t_escritura * 1000:8.1f} ms")
+
+def main(tamanos):
+    logging.basicConfig(level=logging.WARNING)
+    directorio = tempfile.mkdtemp(prefix='benchmark_columnar_')
+    try:
+        print("Datos incluidos (data/)")
+        for tabla, ruta in ARCHIVOS_DATOS.items():
+            copia = os.path.join(directorio, os.path.basename(ruta))
+            shutil.copyfile(ruta, copia)
+            comparar_tabla(tabla, copia)
+
+        for num_aristas in tamanos:
+            print(f"Red sintética de {num_aristas} aristas")
+            datos = generar_datos_sinteticos(num_aristas)
+            for tabla, df in zip(ARCHIVOS_DATOS, datos):
+                ruta = os.path.join(directorio, f'{tabla}_{num_aristas}.csv')
+                df.to_csv(ruta, index=False)
+                comparar_tabla(tabla, ruta)
+    finally:
+        shutil.rmtree(directorio)
+
+if __name__ == "__main__":
+    tamanos = [int(t) for t in sys.argv[1:]] or [100_000, 1_000_000]
+    main(tamanos)
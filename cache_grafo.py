@@ -0,0 +1,461 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import deque, namedtuple
+from contextlib import contextmanager
+
+import pandas as pd
+
+from grafo_agua import (ARCHIVOS_DATOS, cargar_datos, construir_grafo, vista_transitable,
+                        agregar_aristas, crear_motor)
+from teselas import IndiceTeselas
+
+Instantanea = namedtuple(
+    'Instantanea',
+    ['version', 'version_grafo', 'embalses', 'puntos', 'nodos', 'aristas', 'conteos', 'grafo', 'transitable']
+)
+
+Cambio = namedtuple('Cambio', ['version_grafo', 'tipo', 'elementos'])
+
+class _BloqueoLecturaEscritura:
+    """Many concurrent readers or a single writer, preferring the writer.
+
+    Once a writer is waiting no new reader gets in, so a steady stream of
+    readers cannot starve writes. A thread that already reads may read
+    again (nested ``lectura``) even then, instead of deadlocking behind
+    the writer that waits for it.
+    """
+
+    def __init__(self):
+        self._condicion = threading.Condition(threading.Lock())
+        self._lectores = 0
+        self._escritores_esperando = 0
+        self._escribiendo = False
+        self._local = threading.local()
+
+    @contextmanager
+    def lectura(self):
+        if getattr(self._local, 'lecturas', 0):
+            self._local.lecturas += 1
+            try:
+                yield
+            finally:
+                self._local.lecturas -= 1
+            return
+
+        with self._condicion:
+            while self._escribiendo or self._escritores_esperando:
+                self._condicion.wait()
+            self._lectores += 1
+        self._local.lecturas = 1
+        try:
+            yield
+        finally:
+            self._local.lecturas = 0
+            with self._condicion:
+                self._lectores -= 1
+                self._condicion.notify_all()
+
+    @contextmanager
+    def escritura(self):
+        with self._condicion:
+            self._escritores_esperando += 1
+            try:
+                while self._escribiendo or self._lectores:
+                    self._condicion.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escribiendo = True
+        try:
+            yield
+        finally:
+            with self._condicion:
+                self._escribiendo = False
+                self._condicion.notify_all()
+
+class CacheGrafo:
+    """Process-wide cache of the loaded DataFrames and the built graphs.
+
+    Entries are keyed by a data version derived from the CSV mtimes/sizes plus
+    a local write counter, so edits made through the API and edits made by
+    other processes or by hand are both picked up.
+
+    Writes through the API apply a delta to the live graphs instead of
+    dropping them: run them inside ``escritura()`` and call the matching
+    delta method after persisting. Every change bumps ``version_grafo`` and is
+    recorded in ``cambios_desde`` so dependent caches can refresh selectively.
+    Code that walks the graphs must do so inside ``lectura()``.
+
+    Deltas keep insert cost independent of the network size: the ``puntos``,
+    ``nodos`` and ``aristas`` DataFrames stay as loaded by the last full
+    rebuild, while ``conteos`` and the graph reflect every change. Edge
+    state changes are kept in a small side dict, applied to the rows a
+    delta reads. ``transitable`` is a
+    zero-copy view of ``grafo``, so it follows the deltas by itself.
+
+    With a loader (``usar_cargador``) the graph comes from the database
+    instead: the data version follows the rows the loader has read, and
+    ``refrescar`` applies newer rows as a delta. Writes to the CSV files
+    are then ignored.
+    """
+
+    def __init__(self, archivos=None, max_cambios=1000, cargador=None):
+        self.archivos = dict(archivos or ARCHIVOS_DATOS)
+        self.cargador = cargador
+        self._lock = threading.RLock()
+        self._rw = _BloqueoLecturaEscritura()
+        self._escrituras = 0
+        self._instantanea = None
+        # Última instantánea construida o actualizada; invalidar no la descarta
+        self._ultima = None
+        self._aristas_por_nodo = None
+        # (origen, destino) -> estado cambiado desde la última reconstrucción
+        self._estados_aristas = {}
+        self._version_previa = None
+        self.version_grafo = 0
+        self._cambios = deque(maxlen=max_cambios)
+        self._motores = {}
+        self._evaluadores = {}
+        self._teselas = None
+        self._suscriptores = []
+        self._refresco = threading.Lock()
+
+    def usar_cargador(self, cargador):
+        """Build the graph with ``cargador`` (a ``CargadorGrafoDB``) instead of from the CSV files."""
+        with self._lock:
+            self.cargador = cargador
+            self._instantanea = None
+
+    def _estado_archivos(self):
+        if self.cargador is not None:
+            return [('db', self.cargador.firma())]
+        estado = []
+        for nombre, ruta in sorted(self.archivos.items()):
+            try:
+                st = os.stat(ruta)
+                estado.append((nombre, st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                estado.append((nombre, None, None))
+        return estado
+
+    def version(self):
+        """Current data version: a short hash of file stats and the write counter."""
+        firma = [self._escrituras] + self._estado_archivos()
+        return hashlib.sha1(repr(firma).encode()).hexdigest()[:12]
+
+    def firma_archivos(self):
+        """Short hash of the data files' stats alone, stable across restarts."""
+        return hashlib.sha1(repr(self._estado_archivos()).encode()).hexdigest()[:12]
+
+    def suscribir(self, funcion):
+        """Call ``funcion()`` after every write through the application."""
+        self._suscriptores.append(funcion)
+
+    def _notificar(self):
+        for funcion in self._suscriptores:
+            try:
+                funcion()
+            except Exception as e:
+                logging.warning(f"Graph cache subscriber failed: {e}")
+
+    def obtener(self):
+        """Return the snapshot for the current data version, rebuilding if stale."""
+        version = self.version()
+        instantanea = self._instantanea
+        if instantanea is not None and instantanea.version == version:
+            return instantanea
+
+        with self._lock:
+            version = self.version()
+            if self._instantanea is not None and self._instantanea.version == version:
+                return self._instantanea
+
+            if self.cargador is None:
+                embalses, puntos, nodos, aristas = cargar_datos()
+                grafo = construir_grafo(embalses, puntos, nodos, aristas)
+                conteos = {
+                    'embalses': len(embalses),
+                    'puntos_criticos': len(puntos),
+                    'nodos': len(nodos),
+                    'aristas': len(aristas),
+                }
+            else:
+                # Sin DataFrames de puntos, nodos ni aristas: el grafo sigue a la base de datos
+                grafo = self.cargador.construir()
+                embalses, puntos, nodos, aristas = self.cargador.embalses(), None, None, None
+                conteos = dict(self.cargador.conteos)
+                version = self.version()
+            self.version_grafo += 1
+            self._instantanea = Instantanea(
+                version, self.version_grafo, embalses, puntos, nodos, aristas, conteos,
+                grafo, vista_transitable(grafo)
+            )
+            self._ultima = self._instantanea
+            self._aristas_por_nodo = None
+            self._estados_aristas = {}
+            self._cambios.append(Cambio(self.version_grafo, 'reconstruccion', []))
+            logging.info(f"Graph cache rebuilt for data version {version} (graph v{self.version_grafo})")
+            return self._instantanea
+
+    def ultima(self):
+        """Last snapshot built or updated, possibly stale, or ``None`` before the first build.
+
+        Never checks or loads the data files, so it is safe for health checks.
+        """
+        return self._ultima
+
+    def invalidar(self):
+        """Mark the cached data as stale after a write through the application."""
+        with self._lock:
+            self._escrituras += 1
+            self._instantanea = None
+        self._notificar()
+
+    def refrescar(self):
+        """Apply the database rows changed since the last read as one delta.
+
+        Only with a loader. Changes are read without blocking readers and
+        applied inside ``escritura()``. Returns the changed nodes and edge
+        pairs, or ``None`` when the graph had to be rebuilt.
+        """
+        with self._refresco:
+            if self._instantanea is None:
+                self.obtener()
+                return None
+            cambios = self.cargador.leer_cambios()
+            if cambios is None:
+                self.invalidar()
+                self.obtener()
+                return None
+            if not cambios:
+                return []
+            with self.escritura():
+                instantanea = self._instantanea
+                if instantanea is None:
+                    return None
+                elementos = self.cargador.aplicar(cambios)
+                if elementos:
+                    instantanea = instantanea._replace(embalses=self.cargador.embalses(),
+                                                       conteos=dict(self.cargador.conteos))
+                    self._publicar(instantanea, 'refresco_db', elementos)
+                return elementos
+
+    def calentar(self):
+        """Load data and build the graph ahead of the first request."""
+        try:
+            self.obtener()
+        except Exception as e:
+            logging.warning(f"Graph cache warm-up failed: {e}")
+
+    def cambios_desde(self, version_grafo):
+        """Changes applied after ``version_grafo``, or ``None`` if the log no longer covers it."""
+        with self._lock:
+            cambios = [c for c in self._cambios if c.version_grafo > version_grafo]
+            if cambios and cambios[0].version_grafo != version_grafo + 1:
+                return None
+            return cambios
+
+    def motor(self, instantanea, nombre):
+        """Compute engine ``nombre`` over the snapshot's transitable graph, built once per graph version."""
+        clave = (instantanea.version_grafo, nombre)
+        motor = self._motores.get(clave)
+        if motor is None:
+            motor = crear_motor(instantanea.transitable, nombre)
+            # Solo se conservan los motores de la versión vigente del grafo
+            motores = {k: m for k, m in self._motores.items() if k[0] == instantanea.version_grafo}
+            motores[clave] = motor
+            self._motores = motores
+        return motor
+
+    def teselas(self, instantanea):
+        """Map tile index over the snapshot's graph, built once per graph version."""
+        indice = self._teselas
+        if indice is None or indice[0] != instantanea.version_grafo:
+            indice = (instantanea.version_grafo, IndiceTeselas(instantanea.grafo))
+            self._teselas = indice
+        return indice[1]
+
+    def paralelo(self, instantanea, nombre, trabajadores=None):
+        """Process-pool evaluator for engine ``nombre``, started once per graph version.
+
+        Evaluators of older graph versions are shut down; their queued tasks
+        still finish.
+        """
+        clave = (instantanea.version_grafo, nombre)
+        evaluador = self._evaluadores.get(clave)
+        if evaluador is not None:
+            return evaluador
+        with self._lock:
+            evaluador = self._evaluadores.get(clave)
+            if evaluador is None:
+                # Importación diferida: los procesos trabajadores no necesitan la caché
+                from paralelo import EvaluadorParalelo
+                evaluador = EvaluadorParalelo(instantanea.transitable, nombre, trabajadores)
+                evaluadores = {}
+                for k, e in self._evaluadores.items():
+                    if k[0] == instantanea.version_grafo:
+                        evaluadores[k] = e
+                    else:
+                        e.cerrar(esperar=False)
+                evaluadores[clave] = evaluador
+                self._evaluadores = evaluadores
+            return evaluador
+
+    @contextmanager
+    def lectura(self):
+        """Hold while reading the graphs so deltas never mutate them mid-walk."""
+        with self._rw.lectura():
+            yield
+
+    @contextmanager
+    def escritura(self):
+        """Hold while persisting a change and applying its delta."""
+        with self._rw.escritura(), self._lock:
+            self._version_previa = self.version()
+            try:
+                yield
+            finally:
+                self._version_previa = None
+
+    def _vigente(self):
+        """Snapshot the delta can be applied to, or ``None`` if it must be rebuilt."""
+        if self.cargador is not None:
+            # El grafo sigue a la base de datos: los cambios en los CSV no le aplican
+            return None
+        instantanea = self._instantanea
+        if instantanea is None or instantanea.version != self._version_previa:
+            self.invalidar()
+            return None
+        return instantanea
+
+    def _publicar(self, instantanea, tipo, elementos):
+        self._escrituras += 1
+        self.version_grafo += 1
+        self._instantanea = instantanea._replace(version=self.version(), version_grafo=self.version_grafo)
+        self._ultima = self._instantanea
+        self._cambios.append(Cambio(self.version_grafo, tipo, list(elementos)))
+        self._notificar()
+        logging.debug(f"Graph delta '{tipo}' applied (graph v{self.version_grafo})")
+
+    def _filas_de_nodo(self, instantanea, id_nodo):
+        """Rows of ``aristas`` touching ``id_nodo``, through a lazily built endpoint index.
+
+        Edge states changed since the last rebuild are applied to the rows returned.
+        """
+        if self._aristas_por_nodo is None:
+            aristas = instantanea.aristas
+            extremos = pd.concat([aristas['origen'], aristas['destino']])
+            self._aristas_por_nodo = extremos.groupby(extremos, sort=False).groups
+        etiquetas = self._aristas_por_nodo.get(id_nodo)
+        if etiquetas is None:
+            return instantanea.aristas.iloc[:0]
+        filas = instantanea.aristas.loc[sorted(set(etiquetas))]
+        if not self._estados_aristas:
+            return filas
+        filas = filas.astype({'estado': object})
+        estados = [self._estados_aristas.get(par, estado)
+                   for par, estado in zip(zip(filas['origen'], filas['destino']), filas['estado'])]
+        filas['estado'] = estados
+        return filas
+
+    def agregar_nodo(self, nodo):
+        """Delta for a new distribution node (a ``nodos.csv`` row as a dict)."""
+        instantanea = self._vigente()
+        if instantanea is None:
+            return
+        id_nodo = nodo['id_nodo']
+        if id_nodo in instantanea.grafo:
+            # Un nodo que reemplaza los atributos de otro existente: reconstruir
+            self.invalidar()
+            return
+
+        instantanea.grafo.add_node(
+            id_nodo, pos=(nodo['latitud'], nodo['longitud']), tipo=nodo['tipo'], estado=nodo['estado']
+        )
+
+        # Aristas del CSV que esperaban a este nodo
+        agregar_aristas(instantanea.grafo, self._filas_de_nodo(instantanea, id_nodo))
+
+        conteos = dict(instantanea.conteos, nodos=instantanea.conteos['nodos'] + 1)
+        self._publicar(instantanea._replace(conteos=conteos), 'nodo_agregado', [id_nodo])
+
+    def quitar_nodo(self, id_nodo):
+        """Delta for a distribution node deleted from ``nodos.csv``.
+
+        The node leaves the graph with every edge touching it; its rows stay
+        in ``aristas`` and come back if the node is added again.
+        """
+        instantanea = self._vigente()
+        if instantanea is None:
+            return
+        if id_nodo not in instantanea.grafo or self._es_embalse_o_punto(instantanea, id_nodo):
+            # Un nodo que ocultaba a un embalse o punto crítico homónimo: reconstruir
+            self.invalidar()
+            return
+
+        instantanea.grafo.remove_node(id_nodo)
+        conteos = dict(instantanea.conteos, nodos=instantanea.conteos['nodos'] - 1)
+        self._publicar(instantanea._replace(conteos=conteos), 'nodo_quitado', [id_nodo])
+
+    @staticmethod
+    def _es_embalse_o_punto(instantanea, nombre):
+        for df in (instantanea.embalses, instantanea.puntos):
+            for columna in ('Nombre', 'nombre'):
+                if columna in df.columns and (df[columna] == nombre).any():
+                    return True
+        return False
+
+    def agregar_punto_critico(self, punto):
+        """Delta for a new critical point (a ``puntos_criticos.csv`` row as a dict)."""
+        instantanea = self._vigente()
+        if instantanea is None:
+            return
+        nombre = punto['nombre']
+        if nombre in instantanea.grafo:
+            self.invalidar()
+            return
+
+        # Un punto crítico es un obstáculo: nunca entra al grafo transitable
+        instantanea.grafo.add_node(
+            nombre, pos=(punto['latitud'], punto['longitud']), tipo='punto_critico',
+            subtipo=punto['tipo'], estado='obstaculo'
+        )
+        conteos = dict(instantanea.conteos, puntos_criticos=instantanea.conteos['puntos_criticos'] + 1)
+        self._publicar(instantanea._replace(conteos=conteos), 'punto_critico_agregado', [nombre])
+
+    def cambiar_estado_nodo(self, id_nodo, estado):
+        """Delta for a node state change; an obstacle loses every edge touching it."""
+        instantanea = self._vigente()
+        if instantanea is None:
+            return
+        G = instantanea.grafo
+        if id_nodo not in G:
+            self.invalidar()
+            return
+
+        G.nodes[id_nodo]['estado'] = estado
+        G.remove_edges_from(list(G.in_edges(id_nodo)) + list(G.out_edges(id_nodo)))
+        agregar_aristas(G, self._filas_de_nodo(instantanea, id_nodo))
+        self._publicar(instantanea, 'estado_nodo', [id_nodo])
+
+    def cambiar_estado_arista(self, origen, destino, estado):
+        """Delta for an edge state change, e.g. flipping a pipe to ``bloqueado``."""
+        instantanea = self._vigente()
+        if instantanea is None:
+            return
+        G = instantanea.grafo
+
+        # Solo las filas del par: sin copiar ni recorrer la tabla de aristas
+        self._estados_aristas[(origen, destino)] = estado
+        filas = self._filas_de_nodo(instantanea, origen)
+        en_par = (((filas['origen'] == origen) & (filas['destino'] == destino))
+                  | ((filas['origen'] == destino) & (filas['destino'] == origen)))
+
+        # El par se recalcula desde todas sus filas, en ambos sentidos
+        par = [(origen, destino), (destino, origen)]
+        G.remove_edges_from(par)
+        agregar_aristas(G, filas[en_par])
+        self._publicar(instantanea, 'estado_arista', par)
+
+cache = CacheGrafo()
@@ -0,0 +1,133 @@
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+class CacheResultados:
+    """LRU cache of JSON results bounded by their serialized size in bytes.
+
+    Keys are built from a data signature plus the request parameters, so
+    results never outlive the data they were computed from; ``purgar``
+    drops entries of other signatures right after a write. With a
+    ``directorio`` every entry is also written to disk (bounded by
+    ``max_bytes_disco``) and survives restarts.
+    """
+
+    def __init__(self, max_bytes=64 * 2**20, directorio=None, max_bytes_disco=256 * 2**20):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self.estadisticas = {'aciertos_memoria': 0, 'aciertos_disco': 0, 'fallos': 0, 'descartes': 0}
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(firma, **parametros):
+        """Cache key for ``parametros`` under data signature ``firma``."""
+        resumen = hashlib.sha1(json.dumps(parametros, sort_keys=True, default=str).encode()).hexdigest()[:16]
+        return f"{firma}-{resumen}"
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.json")
+
+    def obtener(self, clave):
+        """Return ``(resultado, nivel)`` with ``nivel`` 'memoria' or 'disco', or ``(None, None)``."""
+        with self._lock:
+            datos = self._entradas.get(clave)
+            if datos is not None:
+                self._entradas.move_to_end(clave)
+                self.estadisticas['aciertos_memoria'] += 1
+                return json.loads(datos), 'memoria'
+
+        if self.directorio:
+            try:
+                with open(self._ruta(clave), 'rb') as f:
+                    datos = f.read()
+                resultado = json.loads(datos)
+            except (OSError, ValueError):
+                pass
+            else:
+                with self._lock:
+                    self._insertar(clave, datos)
+                    self.estadisticas['aciertos_disco'] += 1
+                return resultado, 'disco'
+
+        with self._lock:
+            self.estadisticas['fallos'] += 1
+        return None, None
+
+    def guardar(self, clave, resultado):
+        datos = json.dumps(resultado, separators=(',', ':'), default=str).encode()
+        with self._lock:
+            self._insertar(clave, datos)
+        if self.directorio:
+            try:
+                temporal = self._ruta(clave) + '.tmp'
+                with open(temporal, 'wb') as f:
+                    f.write(datos)
+                os.replace(temporal, self._ruta(clave))
+                self._recortar_disco()
+            except OSError as e:
+                logging.warning(f"Could not write result cache entry {clave}: {e}")
+
+    def _insertar(self, clave, datos):
+        if len(datos) > self.max_bytes:
+            return
+        previo = self._entradas.pop(clave, None)
+        if previo is not None:
+            self._bytes -= len(previo)
+        self._entradas[clave] = datos
+        self._bytes += len(datos)
+        while self._bytes > self.max_bytes:
+            _, viejo = self._entradas.popitem(last=False)
+            self._bytes -= len(viejo)
+            self.estadisticas['descartes'] += 1
+
+    def _archivos_disco(self):
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.endswith('.json'):
+                ruta = os.path.join(self.directorio, nombre)
+                try:
+                    st = os.stat(ruta)
+                except FileNotFoundError:
+                    continue
+                archivos.append((st.st_mtime, st.st_size, ruta))
+        return archivos
+
+    def _recortar_disco(self):
+        archivos = sorted(self._archivos_disco())
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in archivos:
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            total -= tamano
+
+    def purgar(self, firma_vigente):
+        """Drop every entry, in memory and on disk, not computed from ``firma_vigente``."""
+        prefijo = f"{firma_vigente}-"
+        with self._lock:
+            for clave in [c for c in self._entradas if not c.startswith(prefijo)]:
+                self._bytes -= len(self._entradas.pop(clave))
+        if self.directorio:
+            for _, _, ruta in self._archivos_disco():
+                if not os.path.basename(ruta).startswith(prefijo):
+                    try:
+                        os.remove(ruta)
+                    except FileNotFoundError:
+                        pass
+
+    def resumen(self):
+        """Counters and current size, for ``/status``."""
+        with self._lock:
+            return dict(self.estadisticas, entradas=len(self._entradas), bytes=self._bytes,
+                        max_bytes=self.max_bytes, disco=bool(self.directorio))
@@ -0,0 +1,142 @@
+import gzip
+import json
+import math
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él se negocia solo gzip
+    brotli = None
+
+def _json_valido(valor):
+    """Replace NaN/inf (not valid JSON) with ``None``, also inside tuples and lists."""
+    if isinstance(valor, float):
+        return valor if math.isfinite(valor) else None
+    if isinstance(valor, (tuple, list)):
+        return [_json_valido(v) for v in valor]
+    return valor
+
+def registro_nodo(nodo, datos):
+    registro = {'id': nodo}
+    registro.update((k, _json_valido(v)) for k, v in datos.items())
+    return registro
+
+def registro_arista(origen, destino, datos):
+    registro = {'origen': origen, 'destino': destino}
+    registro.update((k, _json_valido(v)) for k, v in datos.items())
+    return registro
+
+def _linea(registro):
+    return json.dumps(registro, separators=(',', ':'), ensure_ascii=False)
+
+def lineas_ndjson(cache, instantanea, tam_lote=1000):
+    """Yield the snapshot's graph as NDJSON, in chunks covering ``tam_lote`` nodes each.
+
+    Lines are ``{"grafo": {...}}``, then ``{"nodo": {...}}`` per node and
+    ``{"arista": {...}}`` per edge, and a closing ``{"fin": {...}}`` with the
+    counts. Only one chunk is held at a time and the read lock is taken per
+    chunk, so a slow client never blocks writers; if the graph changes
+    mid-stream the export ends with an ``{"error": ...}`` line.
+    """
+    version = instantanea.version_grafo
+    G = instantanea.grafo
+    with cache.lectura():
+        ids = list(G)
+    yield _linea({'grafo': {'version_grafo': version, 'version_datos': instantanea.version,
+                            'nodos': len(ids)}}) + '\n'
+
+    def vigente():
+        return cache.version_grafo == version
+
+    aristas = 0
+    for fase in ('nodo', 'arista'):
+        for inicio in range(0, len(ids), tam_lote):
+            with cache.lectura():
+                if not vigente():
+                    yield _linea({'error': 'El grafo cambió durante la exportación, vuelva a solicitarlo'}) + '\n'
+                    return
+                lote = ids[inicio:inicio + tam_lote]
+                if fase == 'nodo':
+                    lineas = [_linea({'nodo': registro_nodo(n, G.nodes[n])}) for n in lote]
+                else:
+                    lineas = [_linea({'arista': registro_arista(u, v, d)})
+                              for u in lote for v, d in G.adj[u].items()]
+                    aristas += len(lineas)
+            if lineas:
+                yield '\n'.join(lineas) + '\n'
+
+    yield _linea({'fin': {'nodos': len(ids), 'aristas': aristas}}) + '\n'
+
+def _redondear(valor, decimales):
+    valor = _json_valido(valor)
+    if valor is None:
+        return None
+    valor = round(valor, decimales)
+    return int(valor) if isinstance(valor, float) and valor.is_integer() else valor
+
+def _codigo(tabla, valor):
+    return tabla.setdefault(_json_valido(valor), len(tabla))
+
+def grafo_columnar(cache, instantanea):
+    """The snapshot's graph as parallel arrays instead of one object per record.
+
+    Nodes become ``id``/``lat``/``lng`` arrays plus ``tipo``/``estado`` codes
+    into the ``tipos``/``estados`` tables; the few nodes with ``capacidad``
+    or ``subtipo`` carry them in sparse ``{posición: valor}`` maps. Edges are
+    ``destino`` positions into the node arrays with ``distancia``,
+    ``capacidad`` and ``estado`` codes; ``weight`` (equal to ``distancia``)
+    and the constant ``color`` are left out.
+
+    Edges are stored CSR-style: the edges leaving node ``i`` are the slice
+    ``inicio[i]:inicio[i + 1]`` of ``destino`` and the other edge arrays, so
+    no origin array is sent. Coordinates keep 5 decimals (~1 m) and
+    distances 3 (1 m).
+    """
+    tipos, estados = {}, {}
+    with cache.lectura():
+        G = instantanea.grafo
+        ids = list(G)
+        posicion = {n: i for i, n in enumerate(ids)}
+        lat, lng, tipo, estado = [], [], [], []
+        capacidad_nodo, subtipo = {}, {}
+        for i, (n, d) in enumerate(G.nodes(data=True)):
+            pos = d.get('pos') or (None, None)
+            lat.append(_redondear(pos[0], 5))
+            lng.append(_redondear(pos[1], 5))
+            tipo.append(_codigo(tipos, d.get('tipo')))
+            estado.append(_codigo(estados, d.get('estado')))
+            if d.get('capacidad') is not None:
+                capacidad_nodo[i] = _redondear(d['capacidad'], 2)
+            if d.get('subtipo') is not None:
+                subtipo[i] = _json_valido(d['subtipo'])
+
+        inicio, destino, distancia, capacidad, estado_arista = [0], [], [], [], []
+        for u in ids:
+            for v, d in G.adj[u].items():
+                destino.append(posicion[v])
+                distancia.append(_redondear(d.get('distancia'), 3))
+                capacidad.append(_redondear(d.get('capacidad'), 2))
+                estado_arista.append(_codigo(estados, d.get('estado')))
+            inicio.append(len(destino))
+
+    return {
+        'version_grafo': instantanea.version_grafo,
+        'version_datos': instantanea.version,
+        'tipos': list(tipos),
+        'estados': list(estados),
+        'nodos': {
+            'id': ids, 'lat': lat, 'lng': lng, 'tipo': tipo, 'estado': estado,
+            'capacidad': capacidad_nodo, 'subtipo': subtipo,
+        },
+        'aristas': {
+            'inicio': inicio, 'destino': destino, 'distancia': distancia,
+            'capacidad': capacidad, 'estado': estado_arista,
+        },
+    }
+
+def comprimir(datos, codificaciones_aceptadas):
+    """Compress ``datos`` with the best accepted encoding; returns ``(datos, codificacion)``."""
+    if brotli is not None and 'br' in codificaciones_aceptadas:
+        return brotli.compress(datos, quality=5), 'br'
+    if 'gzip' in codificaciones_aceptadas:
+        return gzip.compress(datos, compresslevel=6), 'gzip'
+    return datos, None
@@ -0,0 +1,218 @@
+import io
+import os
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+# Tipos explícitos por tabla; 'categoria' se guarda como códigos + categorías
+ESQUEMAS = {
+    'embalses': {
+        'Nombre': 'texto', 'nombre': 'texto',
+        'Latitud': 'float', 'latitud': 'float',
+        'Longitud': 'float', 'longitud': 'float',
+        'Volumen_Almacenado_m3': 'float', 'volumen_almacenado_m3': 'float',
+    },
+    'puntos_criticos': {
+        'Nombre': 'texto', 'nombre': 'texto',
+        'Latitud': 'float', 'latitud': 'float',
+        'Longitud': 'float', 'longitud': 'float',
+        'Tipo': 'categoria', 'tipo': 'categoria',
+        'Prioridad': 'categoria', 'prioridad': 'categoria',
+        'Poblacion_Afectada': 'float', 'poblacion_afectada': 'float',
+    },
+    'nodos': {
+        'id_nodo': 'texto', 'latitud': 'float', 'longitud': 'float',
+        'tipo': 'categoria', 'estado': 'categoria',
+    },
+    'aristas': {
+        'origen': 'texto', 'destino': 'texto', 'distancia': 'float',
+        'estado': 'categoria', 'capacidad': 'float',
+    },
+}
+
+# Un CSV modificado hasta este margen antes de leerlo pudo reescribirse después
+# con el mismo mtime (según la resolución del sistema de archivos) y el mismo
+# tamaño: su .npz se valida además por el contenido
+MARGEN_MTIME_NS = 2 * 10**9
+
+def ruta_columnar(ruta_csv):
+    """Path of the columnar file stored next to ``ruta_csv``."""
+    return os.path.splitext(ruta_csv)[0] + '.npz'
+
+def aplicar_esquema(df, tabla):
+    """Cast the known columns of ``df`` to the explicit dtypes of ``tabla``."""
+    esquema = ESQUEMAS.get(tabla, {})
+    for columna in df.columns:
+        tipo = esquema.get(columna)
+        if tipo == 'float':
+            df[columna] = pd.to_numeric(df[columna], errors='coerce').astype('float64')
+        elif tipo == 'categoria':
+            df[columna] = df[columna].astype('category')
+    return df
+
+def _huella(contenido):
+    return hashlib.blake2b(contenido, digest_size=16).hexdigest()
+
+def leer_fuente(ruta_csv):
+    """CSV bytes, the signature to store with its columnar copy and their content hash.
+
+    The signature is ``[mtime_ns, size, instante_ns]``, taken before reading:
+    a write that lands during the read changes the stat, so the copy is
+    never considered fresh for contents it does not hold.
+    """
+    with open(ruta_csv, 'rb') as f:
+        st = os.fstat(f.fileno())
+        firma = np.array([st.st_mtime_ns, st.st_size, time.time_ns()], dtype=np.int64)
+        contenido = f.read()
+    return contenido, firma, _huella(contenido)
+
+def guardar_columnar(df, ruta_npz, firma_csv=None, huella_csv=None):
+    """Write ``df`` column by column to an uncompressed ``.npz``.
+
+    Numeric columns keep their dtype; every other column is stored as integer
+    codes plus a unicode categories array, so no pickling is needed to load it.
+    The file is written under a unique temporary name and moved into place,
+    so concurrent writers never interleave or publish a partial file.
+    """
+    arrays = {'__columnas__': np.array(list(df.columns), dtype=str)}
+    if firma_csv is not None:
+        arrays['__fuente__'] = firma_csv
+    if huella_csv is not None:
+        arrays['__huella__'] = np.array(huella_csv)
+    for i, columna in enumerate(df.columns):
+        serie = df[columna]
+        if pd.api.types.is_numeric_dtype(serie.dtype) and not isinstance(serie.dtype, pd.CategoricalDtype):
+            arrays[f'{i}.valores'] = serie.to_numpy()
+        else:
+            categorica = pd.Categorical(serie.astype(object).where(serie.notna(), None))
+            codigos = categorica.codes
+            arrays[f'{i}.codigos'] = codigos.astype(np.int32 if len(categorica.categories) > 32000 else np.int16)
+            arrays[f'{i}.categorias'] = np.array([str(c) for c in categorica.categories], dtype=str)
+            arrays[f'{i}.es_categoria'] = np.array(isinstance(serie.dtype, pd.CategoricalDtype))
+
+    directorio, nombre = os.path.split(os.path.abspath(ruta_npz))
+    with tempfile.NamedTemporaryFile(dir=directorio, prefix=nombre + '.', suffix='.tmp', delete=False) as f:
+        temporal = f.name
+        try:
+            np.savez(f, **arrays)
+        except BaseException:
+            f.close()
+            os.remove(temporal)
+            raise
+    os.replace(temporal, ruta_npz)
+
+def leer_columnar(ruta_npz):
+    """Load a DataFrame written by ``guardar_columnar``."""
+    with np.load(ruta_npz, allow_pickle=False) as datos:
+        columnas = [str(c) for c in datos['__columnas__']]
+        df = {}
+        for i, columna in enumerate(columnas):
+            if f'{i}.valores' in datos:
+                df[columna] = datos[f'{i}.valores']
+                continue
+            codigos = datos[f'{i}.codigos']
+            categorias = datos[f'{i}.categorias'].astype(object)
+            if bool(datos[f'{i}.es_categoria']):
+                df[columna] = pd.Categorical.from_codes(codigos, categorias)
+            else:
+                validos = codigos >= 0
+                valores = np.full(len(codigos), np.nan, dtype=object)
+                valores[validos] = categorias[codigos[validos]]
+                df[columna] = valores
+    return pd.DataFrame(df, columns=columnas)
+
+def es_fresco(ruta_csv):
+    """True if the ``.npz`` next to ``ruta_csv`` was generated from its current contents.
+
+    Stat and size must match the stored signature. If the CSV had been
+    modified less than ``MARGEN_MTIME_NS`` before it was read, the stored
+    content hash must match as well.
+    """
+    ruta_npz = ruta_columnar(ruta_csv)
+    if not os.path.exists(ruta_npz):
+        return False
+    if not os.path.exists(ruta_csv):
+        return True
+    try:
+        with np.load(ruta_npz, allow_pickle=False) as datos:
+            if '__fuente__' not in datos or len(datos['__fuente__']) != 3:
+                return False
+            mtime_ns, tamano, instante_ns = datos['__fuente__'].tolist()
+            st = os.stat(ruta_csv)
+            if (st.st_mtime_ns, st.st_size) != (mtime_ns, tamano):
+                return False
+            if mtime_ns + MARGEN_MTIME_NS < instante_ns:
+                return True
+            with open(ruta_csv, 'rb') as f:
+                return '__huella__' in datos and str(datos['__huella__']) == _huella(f.read())
+    except Exception:
+        return False
+
+def cargar_tabla(tabla, ruta_csv):
+    """Load one data table, from the columnar file when fresh, else from CSV.
+
+    A CSV load regenerates the columnar file so the next load is fast.
+    """
+    if es_fresco(ruta_csv):
+        try:
+            return leer_columnar(ruta_columnar(ruta_csv))
+        except Exception as e:
+            logging.warning(f"Columnar file for {tabla} unreadable, falling back to CSV: {e}")
+
+    contenido, firma, huella = leer_fuente(ruta_csv)
+    df = aplicar_esquema(pd.read_csv(io.BytesIO(contenido)), tabla)
+    try:
+        guardar_columnar(df, ruta_columnar(ruta_csv), firma, huella)
+    except OSError as e:
+        logging.warning(f"Could not write columnar file for {tabla}: {e}")
+    return df
+
+def csv_a_columnar(archivos):
+    for tabla, ruta_csv in archivos.items():
+        contenido, firma, huella = leer_fuente(ruta_csv)
+        df = aplicar_esquema(pd.read_csv(io.BytesIO(contenido)), tabla)
+        guardar_columnar(df, ruta_columnar(ruta_csv), firma, huella)
+        print(f"✓ {ruta_csv} -> {ruta_columnar(ruta_csv)} ({len(df)} filas)")
+
+def columnar_a_csv(archivos):
+    for tabla, ruta_csv in archivos.items():
+        df = leer_columnar(ruta_columnar(ruta_csv))
+        df.to_csv(ruta_csv, index=False)
+        # El CSV recién escrito corresponde exactamente al .npz
+        _, firma, huella = leer_fuente(ruta_csv)
+        guardar_columnar(df, ruta_columnar(ruta_csv), firma, huella)
+        print(f"✓ {ruta_columnar(ruta_csv)} -> {ruta_csv} ({len(df)} filas)")
+
+def comparar(archivos):
+    for tabla, ruta_csv in archivos.items():
+        inicio = time.perf_counter()
+        df_csv = pd.read_csv(ruta_csv)
+        t_csv = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        df_npz = leer_columnar(ruta_columnar(ruta_csv))
+        t_npz = time.perf_counter() - inicio
+        print(f"{tabla:>16}: CSV {t_csv * 1000:8.1f} ms {df_csv.memory_usage(deep=True).sum() / 1e6:8.2f} MB | "
+              f"npz {t_npz * 1000:8.1f} ms {df_npz.memory_usage(deep=True).sum() / 1e6:8.2f} MB")
+
+def main(argv=None):
+    from grafo_agua import ARCHIVOS_DATOS
+
+    parser = argparse.ArgumentParser(description="Convierte los datos de la red entre CSV y formato columnar (.npz)")
+    parser.add_argument('accion', choices=['a-npz', 'a-csv', 'comparar'])
+    parser.add_argument('tablas', nargs='*', help=f"Tablas a convertir: {', '.join(ARCHIVOS_DATOS)} (por defecto todas)")
+    args = parser.parse_args(argv)
+    desconocidas = set(args.tablas) - set(ARCHIVOS_DATOS)
+    if desconocidas:
+        parser.error(f"tablas desconocidas: {', '.join(sorted(desconocidas))}")
+
+    archivos = {t: r for t, r in ARCHIVOS_DATOS.items() if not args.tablas or t in args.tablas}
+    {'a-npz': csv_a_columnar, 'a-csv': columnar_a_csv, 'comparar': comparar}[args.accion](archivos)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 import random
-from geopy.distance import geodesic
+from distancias import distancia_km
+from indice_espacial import IndiceGrilla
 
 def generar_coordenadas_arequipa():
     """Genera coordenadas dentro del área urbana de Arequipa"""
@@ -11,7 +12,7 @@ def generar_coordenadas_arequipa():
 
 def calcular_distancia(coord1, coord2):
     """Calcula distancia en km entre dos coordenadas"""
-    return geodesic(coord1, coord2).kilometers
+    return distancia_km(coord1, coord2)
 
 def generar_nodos_distribucion(num_nodos=500):
     """Genera nodos de distribución de agua por toda Arequipa"""
@@ -72,35 +73,41 @@ def generar_aristas_red(nodos_existentes, nodos_nuevos, puntos_criticos):
     for embalse in embalses:
         coords_nodos[embalse['id']] = embalse['coords']
 
+    ids_red = list(coords_nodos.keys())
+    coords_red = np.array(list(coords_nodos.values()), dtype=float)
+    posicion = {nodo_id: i for i, nodo_id in enumerate(ids_red)}
+    ids_obstaculo = {n['id_nodo'] for n in todos_nodos if n['estado'] == 'obstaculo'}
+
+    # Índice de cubetas para vecinos a menos de 5 km y la exclusión de 0.5 km alrededor de puntos críticos
+    indice_red = IndiceGrilla(coords_red, tam_celda_km=0.5)
+    cerca_de_critico = np.zeros(len(ids_red), dtype=bool)
+    for pc in puntos_criticos:
+        cercanos, _ = indice_red.dentro_de_radio((pc['latitud'], pc['longitud']), 0.5)
+        cerca_de_critico[cercanos] = True
+
     for nodo in todos_nodos:
         if nodo['estado'] == 'obstaculo':
             continue
 
         nodo_coords = (nodo['latitud'], nodo['longitud'])
         nodo_id = nodo['id_nodo']
+        num_conexiones = random.randint(3, 5)
+        if cerca_de_critico[posicion[nodo_id]]:
+            continue
 
-        distancias = [
-            (otro_id, calcular_distancia(nodo_coords, otras_coords))
-            for otro_id, otras_coords in coords_nodos.items()
-            if otro_id != nodo_id and calcular_distancia(nodo_coords, otras_coords) < 5.0
-        ]
-
-        distancias.sort(key=lambda x: x[1])
-        num_conexiones = min(random.randint(3, 5), len(distancias))
+        vecinos, dist_vecinos = indice_red.mas_cercanos(
+            nodo_coords, num_conexiones, 5.0, excluir=(posicion[nodo_id],)
+        )
 
-        for i in range(num_conexiones):
-            destino_id, distancia = distancias[i]
+        for i, distancia in zip(vecinos, dist_vecinos):
+            destino_id = ids_red[i]
+            distancia = float(distancia)
 
-            if destino_id in [n['id_nodo'] for n in todos_nodos if n['estado'] == 'obstaculo']:
+            if destino_id in ids_obstaculo:
                 continue
 
-            pasa_por_critico = any(
-                min(calcular_distancia(nodo_coords, (pc['latitud'], pc['longitud'])),
-                    calcular_distancia(coords_nodos[destino_id], (pc['latitud'], pc['longitud']))) < 0.5
-                for pc in puntos_criticos
-            )
-
-            if pasa_por_critico:
+            # La arista pasa por un punto crítico si su destino está a menos de 0.5 km de uno
+            if cerca_de_critico[i]:
                 continue
 
             estado_arista = 'transitable'
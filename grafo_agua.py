@@ -1,8 +1,33 @@
 import pandas as pd
 import networkx as nx
-from geopy.distance import geodesic
+import numpy as np
 import logging
 import os
+import threading
+from heapq import heappush, heappop
+from itertools import count
+from networkx.algorithms.flow import build_residual_network, preflow_push
+from distancias import haversine_km
+from indice_espacial import IndiceKD
+from formato_columnar import cargar_tabla
+from motor_csr import GrafoCSR
+
+MODOS_FLUJO = ('por_destino', 'super_sumidero')
+MOTORES = ('networkx', 'csr')
+SUMIDERO_VIRTUAL = '__sumidero__'
+DEMANDA_POR_DEFECTO = 1000.0
+
+# Límites aproximados de la ciudad de Arequipa
+LAT_MIN, LAT_MAX = -16.45, -16.30
+LON_MIN, LON_MAX = -71.60, -71.45
+MAX_RUTAS_DESTACADAS = 5
+
+ARCHIVOS_DATOS = {
+    'embalses': 'data/embalses.csv',
+    'puntos_criticos': 'data/puntos_criticos.csv',
+    'nodos': 'data/nodos.csv',
+    'aristas': 'data/aristas.csv',
+}
 
 def cargar_datos():
     try:
@@ -10,10 +35,11 @@ def cargar_datos():
         if not os.path.exists(data_dir):
             raise FileNotFoundError(f"Data directory '{data_dir}' not found")
         
-        embalses = pd.read_csv('data/embalses.csv')
-        puntos = pd.read_csv('data/puntos_criticos.csv')
-        nodos = pd.read_csv('data/nodos.csv')
-        aristas = pd.read_csv('data/aristas.csv')
+        # Formato columnar (.npz) cuando está al día con el CSV; si no, CSV
+        embalses = cargar_tabla('embalses', ARCHIVOS_DATOS['embalses'])
+        puntos = cargar_tabla('puntos_criticos', ARCHIVOS_DATOS['puntos_criticos'])
+        nodos = cargar_tabla('nodos', ARCHIVOS_DATOS['nodos'])
+        aristas = cargar_tabla('aristas', ARCHIVOS_DATOS['aristas'])
         
         logging.info(f"Loaded data: {len(embalses)} reservoirs, {len(puntos)} critical points, {len(nodos)} nodes, {len(aristas)} edges")
         
@@ -26,109 +52,343 @@ def cargar_datos():
         logging.error(f"Error loading data: {e}")
         raise
 
+def _columna(df, nombres, defecto):
+    """Return the first column of ``nombres`` present in ``df``, else a default per row.
+
+    ``defecto`` may be a callable that receives the row index label.
+    """
+    for nombre in nombres:
+        if nombre in df.columns:
+            return df[nombre]
+    if callable(defecto):
+        return pd.Series([defecto(i) for i in df.index], index=df.index, dtype=object)
+    return pd.Series(defecto, index=df.index)
+
+def _aristas_bidireccionales(origen, destino):
+    """Resolve the edge list into directed pairs as if added one at a time.
+
+    Each input edge ``i`` is added as ``origen -> destino`` (overwriting) and
+    then as ``destino -> origen`` only if that pair does not exist yet.
+    Returns ``(u, v, fila)`` arrays in first-insertion order, where ``fila``
+    is the input edge whose attributes the pair ends up with.
+    """
+    n = len(origen)
+    fila = np.arange(n)
+    todas = pd.concat([
+        pd.DataFrame({'u': origen, 'v': destino, 'clave': 2 * fila, 'prioridad': 2 * n + fila, 'fila': fila}),
+        # Una inversa solo vale si el par nunca aparece como directa; gana la primera
+        pd.DataFrame({'u': destino, 'v': origen, 'clave': 2 * fila + 1, 'prioridad': -fila, 'fila': fila}),
+    ], ignore_index=True)
+    todas['primera'] = todas.groupby(['u', 'v'], sort=False)['clave'].transform('min')
+    elegidas = (todas.sort_values('prioridad', kind='stable')
+                .drop_duplicates(['u', 'v'], keep='last')
+                .sort_values('primera', kind='stable'))
+    return elegidas['u'].to_numpy(), elegidas['v'].to_numpy(), elegidas['fila'].to_numpy()
+
 def construir_grafo(embalses, puntos, nodos, aristas):
     G = nx.DiGraph()
 
-    for _, e in embalses.iterrows():
-        nombre = e.get('Nombre', e.get('nombre', f'Embalse_{_}'))
-        latitud = e.get('Latitud', e.get('latitud', 0))
-        longitud = e.get('Longitud', e.get('longitud', 0))
-        capacidad = e.get('Volumen_Almacenado_m3', e.get('volumen_almacenado_m3', 1000000))
-        
-        G.add_node(
-            nombre, 
-            pos=(latitud, longitud), 
-            tipo='embalse', 
-            capacidad=capacidad,
-            estado='transitable'
+    # Columnas normalizadas una sola vez; los nodos se insertan por lotes
+    G.add_nodes_from(
+        (nombre, {'pos': (lat, lon), 'tipo': 'embalse', 'capacidad': capacidad, 'estado': 'transitable'})
+        for nombre, lat, lon, capacidad in zip(
+            _columna(embalses, ['Nombre', 'nombre'], lambda i: f'Embalse_{i}').tolist(),
+            _columna(embalses, ['Latitud', 'latitud'], 0).tolist(),
+            _columna(embalses, ['Longitud', 'longitud'], 0).tolist(),
+            _columna(embalses, ['Volumen_Almacenado_m3', 'volumen_almacenado_m3'], 1000000).tolist(),
         )
-        logging.debug(f"Added reservoir: {nombre}")
-    
-    for _, p in puntos.iterrows():
-        nombre = p.get('Nombre', p.get('nombre', f'PC_{_}'))
-        latitud = p.get('Latitud', p.get('latitud', 0))
-        longitud = p.get('Longitud', p.get('longitud', 0))
-        tipo = p.get('Tipo', p.get('tipo', 'critico'))
-        
-        G.add_node(
-            nombre, 
-            pos=(latitud, longitud), 
-            tipo='punto_critico',
-            subtipo=tipo,
-            estado='obstaculo' 
+    )
+
+    G.add_nodes_from(
+        (nombre, {'pos': (lat, lon), 'tipo': 'punto_critico', 'subtipo': tipo, 'estado': 'obstaculo'})
+        for nombre, lat, lon, tipo in zip(
+            _columna(puntos, ['Nombre', 'nombre'], lambda i: f'PC_{i}').tolist(),
+            _columna(puntos, ['Latitud', 'latitud'], 0).tolist(),
+            _columna(puntos, ['Longitud', 'longitud'], 0).tolist(),
+            _columna(puntos, ['Tipo', 'tipo'], 'critico').tolist(),
         )
-        logging.debug(f"Added critical point: {nombre}")
-    
-    for _, n in nodos.iterrows():
-        G.add_node(
-            n['id_nodo'], 
-            pos=(n['latitud'], n['longitud']), 
-            tipo=n['tipo'], 
-            estado=n['estado']
+    )
+
+    G.add_nodes_from(
+        (id_nodo, {'pos': (lat, lon), 'tipo': tipo, 'estado': estado})
+        for id_nodo, lat, lon, tipo, estado in zip(
+            nodos['id_nodo'].tolist(), nodos['latitud'].tolist(), nodos['longitud'].tolist(),
+            nodos['tipo'].tolist(), nodos['estado'].tolist(),
         )
-        logging.debug(f"Added node: {n['id_nodo']}")
-        
-    edges_added = 0
-    for _, a in aristas.iterrows():
-        if a['origen'] in G.nodes and a['destino'] in G.nodes:
-            
-            origen_estado = G.nodes[a['origen']].get('estado', 'transitable')
-            destino_estado = G.nodes[a['destino']].get('estado', 'transitable')
-
-            if (origen_estado == 'obstaculo' or destino_estado == 'obstaculo' or 
-                a['estado'] == 'bloqueado'):
-                logging.debug(f"Skipping edge {a['origen']} -> {a['destino']} (obstacle/blocked)")
-                continue
-            
-            pos1 = G.nodes[a['origen']]['pos']
-            pos2 = G.nodes[a['destino']]['pos']
+    )
 
-            if 'distancia' in a and pd.notna(a['distancia']) and a['distancia'] > 0:
-                dist = float(a['distancia'])
-            else:
-                dist = geodesic(pos1, pos2).kilometers
-
-            color = 'blue'  
-            capacidad = float(a.get('capacidad', 1000))
-            
-            G.add_edge(
-                a['origen'], 
-                a['destino'], 
-                weight=dist, 
-                estado=a['estado'], 
-                color=color,
-                capacidad=capacidad,
-                distancia=dist
-            )
-            # Agregar arista inversa si no existe
-            if not G.has_edge(a['destino'], a['origen']):
-                G.add_edge(
-                    a['destino'],
-                    a['origen'],
-                    weight=dist,
-                    estado=a['estado'],
-                    color=color,
-                    capacidad=capacidad,
-                    distancia=dist
-                )
-            edges_added += 1
-            logging.debug(f"Added edge: {a['origen']} <-> {a['destino']} (distance: {dist:.2f}km)")
-    
+    edges_added = len(agregar_aristas(G, aristas))
     logging.info(f"Graph constructed with {len(G.nodes)} nodes and {edges_added} edges")
     return G
 
-def calcular_rutas_y_flujos(G, fuente):
-    """Calculate optimal routes and maximum flows from source to distribution nodes."""
-    rutas = {}
-    flujos = {}
+def agregar_aristas(G, aristas):
+    """Add the valid rows of ``aristas`` to ``G`` in both directions.
+
+    Rows whose endpoints are missing or obstacles, and blocked rows, are
+    skipped. Returns the accepted rows of ``aristas``.
+    """
+    # Máscaras vectorizadas: extremos existentes, sin obstáculos y aristas no bloqueadas.
+    # Solo se consultan los extremos de estas filas, no todo el grafo.
+    extremos = pd.unique(pd.concat([aristas['origen'], aristas['destino']]))
+    presentes = [n for n in extremos if n in G]
+    obstaculos = [n for n in presentes if G.nodes[n].get('estado', 'transitable') == 'obstaculo']
+    validas = (aristas['origen'].isin(presentes) & aristas['destino'].isin(presentes)
+               & ~aristas['origen'].isin(obstaculos) & ~aristas['destino'].isin(obstaculos)
+               & (aristas['estado'] != 'bloqueado'))
+    seleccion = aristas[validas]
+    origen = seleccion['origen'].to_numpy(dtype=object)
+    destino = seleccion['destino'].to_numpy(dtype=object)
+
+    # Distancias de respaldo para aristas sin 'distancia', en un solo cálculo vectorizado
+    latitud = {n: G.nodes[n]['pos'][0] for n in presentes}
+    longitud = {n: G.nodes[n]['pos'][1] for n in presentes}
+    dist = haversine_km(
+        seleccion['origen'].map(latitud).to_numpy(dtype=float),
+        seleccion['origen'].map(longitud).to_numpy(dtype=float),
+        seleccion['destino'].map(latitud).to_numpy(dtype=float),
+        seleccion['destino'].map(longitud).to_numpy(dtype=float),
+    )
+    if 'distancia' in seleccion.columns:
+        dist_csv = pd.to_numeric(seleccion['distancia'], errors='coerce').to_numpy(dtype=float)
+        dist = np.where(dist_csv > 0, dist_csv, dist)
+
+    if 'capacidad' in seleccion.columns:
+        capacidad = seleccion['capacidad'].to_numpy(dtype=float)
+    else:
+        capacidad = np.full(len(seleccion), 1000.0)
+    estado = seleccion['estado'].tolist()
+    dist = dist.tolist()
+    capacidad = capacidad.tolist()
+
+    u, v, fila = _aristas_bidireccionales(origen, destino)
+    G.add_edges_from(
+        (a, b, {'weight': dist[i], 'estado': estado[i], 'color': 'blue',
+                'capacidad': capacidad[i], 'distancia': dist[i]})
+        for a, b, i in zip(u.tolist(), v.tolist(), fila.tolist())
+    )
+    return seleccion
+
+def arbol_caminos_minimos(G, fuente, weight='weight'):
+    """Run one Dijkstra pass from ``fuente`` and return its shortest-path tree.
+
+    Returns ``(distancias, predecesores)``: the distance to every reachable node
+    and the predecessor of each node on its shortest path (``None`` for the
+    source). Ties are broken the same way as ``nx.dijkstra_path``.
+    """
+    distancias = {}
+    predecesores = {}
+    if fuente not in G:
+        return distancias, predecesores
+
+    vistos = {fuente: 0}
+    predecesores[fuente] = None
+    contador = count()
+    cola = [(0, next(contador), fuente)]
+    while cola:
+        d, _, v = heappop(cola)
+        if v in distancias:
+            continue
+        distancias[v] = d
+        for u, datos in G.adj[v].items():
+            if u in distancias:
+                continue
+            d_u = d + datos.get(weight, 1)
+            if u not in vistos or d_u < vistos[u]:
+                vistos[u] = d_u
+                predecesores[u] = v
+                heappush(cola, (d_u, next(contador), u))
+
+    return distancias, predecesores
+
+def reconstruir_ruta(predecesores, destino):
+    """Walk the predecessor tree back from ``destino``; ``None`` if unreachable."""
+    if destino not in predecesores:
+        return None
+    ruta = []
+    nodo = destino
+    while nodo is not None:
+        ruta.append(nodo)
+        nodo = predecesores[nodo]
+    ruta.reverse()
+    return ruta
+
+def flujo_multidestino(G, fuente, destinos, demandas=None, capacity='capacidad'):
+    """Solve one max-flow from ``fuente`` to all ``destinos`` through a virtual sink.
+
+    Every destination is linked to the sink by an arc whose capacity is its
+    demand (``demandas[destino]``, the node's ``demanda`` attribute or
+    ``DEMANDA_POR_DEFECTO``). The result is the water the network can deliver
+    to all destinations at the same time, broken down per destination.
+    Returns ``(flujo_total, flujos)``.
+    """
+    demandas = demandas or {}
+    if fuente not in G:
+        return 0, {destino: 0 for destino in destinos}
+
+    red = nx.DiGraph()
+    red.add_edges_from(
+        (u, v, {capacity: c}) for u, v, c in G.edges(data=capacity, default=float('inf'))
+    )
+    red.add_node(fuente)
+    for destino in destinos:
+        demanda = demandas.get(destino, G.nodes[destino].get('demanda', DEMANDA_POR_DEFECTO))
+        red.add_edge(destino, SUMIDERO_VIRTUAL, **{capacity: demanda})
+
+    flujo_total, flujo = nx.maximum_flow(red, fuente, SUMIDERO_VIRTUAL, capacity=capacity)
+    flujos = {destino: round(flujo[destino].get(SUMIDERO_VIRTUAL, 0), 2) for destino in destinos}
+    return round(flujo_total, 2), flujos
+
+def es_transitable(datos_nodo):
+    """True if water can flow through a node with these attributes."""
+    return datos_nodo.get("estado") != "obstaculo" and datos_nodo.get("tipo") != "punto_critico"
+
+def vista_transitable(G):
+    """Zero-copy view of ``G`` without obstacle/critical nodes and blocked edges.
+
+    The filters read the live node and edge attributes, so the view follows
+    every later change to ``G`` without being rebuilt.
+    """
+    nodos = G.nodes
+    adyacencia = G.adj
+    return nx.subgraph_view(
+        G,
+        filter_node=lambda n: es_transitable(nodos[n]),
+        filter_edge=lambda u, v: adyacencia[u][v].get('estado') != 'bloqueado',
+    )
+
+def filtrar_transitable(G):
+    """Return a copy of ``G`` without obstacle/critical nodes and blocked edges.
+
+    Prefer ``vista_transitable`` unless an independent graph is needed.
+    """
+    G_transitable = G.copy()
+
+    nodos_obstaculo = [n for n, d in G_transitable.nodes(data=True) if not es_transitable(d)]
+    G_transitable.remove_nodes_from(nodos_obstaculo)
+
+    edges_to_remove = [(u, v) for u, v, d in G_transitable.edges(data=True) 
+                      if d.get('estado') == 'bloqueado']
+    G_transitable.remove_edges_from(edges_to_remove)
+    return G_transitable
+
+class _ArbolesPerezosos(dict):
+    """``{fuente: arbol}`` mapping that computes each tree on first access."""
+
+    def __init__(self, calcular):
+        super().__init__()
+        self._calcular = calcular
+
+    def __missing__(self, fuente):
+        arbol = self[fuente] = self._calcular(fuente)
+        return arbol
 
-    # Definir límites aproximados de la ciudad de Arequipa
-    LAT_MIN, LAT_MAX = -16.45, -16.30
-    LON_MIN, LON_MAX = -71.60, -71.45
+class MotorNetworkX:
+    """Compute engine running directly on the NetworkX graph.
 
-    def dentro_de_ciudad(pos):
-        lat, lon = pos
-        return LAT_MIN <= lat <= LAT_MAX and LON_MIN <= lon <= LON_MAX
+    Same interface as ``motor_csr.GrafoCSR`` so ``calcular_rutas_y_flujos``
+    can switch engines per request.
+    """
+
+    def __init__(self, G, weight='weight', capacity='capacidad'):
+        self.G = G
+        self.weight = weight
+        self.capacity = capacity
+        self._local = threading.local()
+
+    def _residual(self):
+        # La red residual se arma una vez por hilo y se reutiliza en cada flujo
+        residual = getattr(self._local, 'residual', None)
+        if residual is None:
+            residual = self._local.residual = build_residual_network(self.G, self.capacity)
+        return residual
+
+    def arbol(self, fuente):
+        return arbol_caminos_minimos(self.G, fuente, self.weight)
+
+    def arboles(self, fuentes):
+        return _ArbolesPerezosos(self.arbol)
+
+    def ruta(self, arbol, destino):
+        return reconstruir_ruta(arbol[1], destino)
+
+    def distancia(self, arbol, destino):
+        return arbol[0][destino]
+
+    def flujo_maximo(self, fuente, destino):
+        return nx.maximum_flow_value(self.G, fuente, destino, capacity=self.capacity,
+                                     flow_func=preflow_push, residual=self._residual())
+
+    def flujo_multidestino(self, fuente, demandas):
+        return flujo_multidestino(self.G, fuente, list(demandas), demandas, self.capacity)
+
+def crear_motor(G_transitable, motor='networkx'):
+    """Build the ``motor`` compute engine over an already filtered graph."""
+    if motor not in MOTORES:
+        raise ValueError(f"Unknown engine '{motor}', expected one of {MOTORES}")
+    if motor == 'csr':
+        return GrafoCSR(G_transitable)
+    return MotorNetworkX(G_transitable)
+
+def dentro_de_ciudad(pos):
+    lat, lon = pos
+    return LAT_MIN <= lat <= LAT_MAX and LON_MIN <= lon <= LON_MAX
+
+def nodos_destacables(G_transitable):
+    """Transitable nodes inside the city, the candidates for highlighted routes."""
+    return [n for n, d in G_transitable.nodes(data=True)
+            if d.get("estado") == "transitable" and dentro_de_ciudad(d.get("pos", (0, 0)))]
+
+def ruta_destacada(motor, indice, origen, pos_origen, arbol_origen, usados):
+    """Highlighted route from ``origen`` to its nearest connected unused node, or ``None``."""
+    # Buscar el nodo transitable más cercano que no haya sido usado y que esté conectado
+    for destino in indice.vecinos(pos_origen):
+        if destino == origen or destino in usados:
+            continue
+        ruta = motor.ruta(arbol_origen, destino)
+        if ruta is None:
+            continue
+        try:
+            flujo = motor.flujo_maximo(origen, destino)
+        except Exception as e:
+            logging.error(f"Error calculating connected highlighted route {origen} -> {destino}: {e}")
+            continue
+        return {
+            'inicio': origen,
+            'fin': destino,
+            'ruta': ruta,
+            'flujo_maximo': round(flujo, 2)
+        }
+    return None
+
+def calcular_rutas_y_flujos(G, fuente, modo_flujo='por_destino', max_destinos=10, demandas=None,
+                            G_transitable=None, motor='networkx', progreso=None, paralelo=None):
+    """Calculate optimal routes and maximum flows from source to distribution nodes.
+
+    ``modo_flujo='por_destino'`` solves one max-flow per destination (each node
+    in isolation); ``'super_sumidero'`` solves a single flow to every
+    destination at once, see ``flujo_multidestino``. ``max_destinos=None``
+    evaluates every distribution node in the city. ``G_transitable`` defaults to
+    a zero-copy ``vista_transitable`` of ``G``.
+
+    ``motor`` picks the compute engine: ``'networkx'`` or ``'csr'``
+    (``scipy.sparse.csgraph``, see ``motor_csr``). A prebuilt engine from
+    ``crear_motor`` may be passed instead of its name. ``progreso(etapa, avance)``
+    is called as the ``'rutas'`` and ``'rutas_destacadas'`` stages advance.
+    ``paralelo`` (a ``paralelo.EvaluadorParalelo`` over the same graph and
+    engine) spreads the per-destination flows and the highlighted-route
+    search across processes with results identical to the serial run.
+
+    Returns ``(rutas, flujos, rutas_destacadas, distancias)`` where ``distancias``
+    holds the total route length in km for every reachable destination.
+    """
+    if modo_flujo not in MODOS_FLUJO:
+        raise ValueError(f"Unknown flow mode '{modo_flujo}', expected one of {MODOS_FLUJO}")
+    if isinstance(motor, str) and motor not in MOTORES:
+        raise ValueError(f"Unknown engine '{motor}', expected one of {MOTORES}")
+
+    rutas = {}
+    flujos = {}
+    distancias = {}
 
     # Filtrar destinos solo dentro de la ciudad
     destinos = [
@@ -140,108 +400,92 @@ def calcular_rutas_y_flujos(G, fuente):
 
     if not destinos:
         logging.warning("No accessible distribution nodes found for route calculation")
-        return rutas, flujos, None
+        return rutas, flujos, None, distancias
 
-    destinos = destinos[:10]
+    if max_destinos is not None:
+        destinos = destinos[:max_destinos]
     logging.info(f"Calculating routes from {fuente} to {len(destinos)} distribution nodes")
 
-    G_transitable = G.copy()
-
-    nodos_obstaculo = [n for n, d in G_transitable.nodes(data=True) 
-                       if d.get("estado") == "obstaculo" or d.get("tipo") == "punto_critico"]
-    G_transitable.remove_nodes_from(nodos_obstaculo)
-
-    edges_to_remove = [(u, v) for u, v, d in G_transitable.edges(data=True) 
-                      if d.get('estado') == 'bloqueado']
-    G_transitable.remove_edges_from(edges_to_remove)
+    if G_transitable is None:
+        G_transitable = vista_transitable(G)
+    if isinstance(motor, str):
+        motor = crear_motor(G_transitable, motor)
 
+    # Un solo Dijkstra desde la fuente: rutas, alcanzabilidad y distancias salen del árbol
+    arbol_fuente = motor.arbol(fuente)
     for destino in destinos:
+        rutas[destino] = motor.ruta(arbol_fuente, destino)
+
+    if modo_flujo == 'super_sumidero':
+        demandas = demandas or {}
+        alcanzables = {
+            d: demandas.get(d, G_transitable.nodes[d].get('demanda', DEMANDA_POR_DEFECTO))
+            for d in destinos if rutas[d] is not None
+        }
         try:
-            if nx.has_path(G_transitable, fuente, destino):
-                ruta = nx.dijkstra_path(G_transitable, fuente, destino, weight='weight')
-                rutas[destino] = ruta
-                logging.debug(f"Route to {destino}: {' -> '.join(ruta)}")
-            else:
-                rutas[destino] = None
-                logging.warning(f"No path found from {fuente} to {destino}")
+            flujo_total, flujos = motor.flujo_multidestino(fuente, alcanzables)
+            logging.debug(f"Super-sink max flow from {fuente}: {flujo_total}")
         except Exception as e:
-            logging.error(f"Error calculating route to {destino}: {e}")
-            rutas[destino] = None
+            logging.error(f"Error calculating super-sink flow from {fuente}: {e}")
+            flujos = {destino: 0 for destino in alcanzables}
+    elif paralelo is not None:
+        flujos_paralelos = paralelo.flujos(fuente, [d for d in destinos if rutas[d] is not None])
+
+    for i, destino in enumerate(destinos):
+        if progreso is not None:
+            progreso('rutas', i / len(destinos))
+        ruta = rutas[destino]
+        if ruta is None:
+            logging.warning(f"No path found from {fuente} to {destino}")
+            flujos[destino] = 0
+            continue
+
+        distancias[destino] = motor.distancia(arbol_fuente, destino)
+        logging.debug(f"Route to {destino}: {' -> '.join(ruta)}")
+
+        if modo_flujo == 'super_sumidero':
+            continue
 
         try:
-            if nx.has_path(G_transitable, fuente, destino):
-                flujo = nx.maximum_flow_value(G_transitable, fuente, destino, capacity='capacidad')
-                flujos[destino] = round(flujo, 2)
-                logging.debug(f"Max flow to {destino}: {flujo}")
+            if paralelo is not None:
+                flujo = flujos_paralelos[destino]
+                if isinstance(flujo, Exception):
+                    raise flujo
             else:
-                flujos[destino] = 0
+                flujo = motor.flujo_maximo(fuente, destino)
+            flujos[destino] = round(flujo, 2)
+            logging.debug(f"Max flow to {destino}: {flujo}")
         except Exception as e:
             logging.error(f"Error calculating flow to {destino}: {e}")
             flujos[destino] = 0
 
     # Seleccionar rutas conectadas entre nodos transitables más cercanos
-    nodos_transitables = [n for n, d in G_transitable.nodes(data=True)
-                         if d.get("estado") == "transitable" and dentro_de_ciudad(d.get("pos", (0, 0)))]
+    nodos_transitables = nodos_destacables(G_transitable)
     rutas_destacadas = []
     usados = set()
+    if progreso is not None:
+        progreso('rutas_destacadas', 0.0)
+    if not nodos_transitables:
+        return rutas, flujos, rutas_destacadas, distancias
+
+    # Índice espacial construido una sola vez; los candidatos se piden de k en k
+    indice = IndiceKD(nodos_transitables, [G_transitable.nodes[n]["pos"] for n in nodos_transitables])
+    if paralelo is not None:
+        rutas_destacadas = paralelo.rutas_destacadas(motor, indice, G_transitable, nodos_transitables, progreso)
+        return rutas, flujos, rutas_destacadas, distancias
+
+    arboles = motor.arboles(nodos_transitables)
     for origen in nodos_transitables:
         if origen in usados:
             continue
         pos_origen = G_transitable.nodes[origen]["pos"]
-        # Buscar el nodo transitable más cercano que no haya sido usado y que esté conectado
-        candidatos = [n for n in nodos_transitables if n != origen and n not in usados]
-        candidatos = sorted(candidatos, key=lambda n: geodesic(pos_origen, G_transitable.nodes[n]["pos"]).meters)
-        for destino in candidatos:
-            try:
-                if nx.has_path(G_transitable, origen, destino):
-                    ruta = nx.dijkstra_path(G_transitable, origen, destino, weight='weight')
-                    flujo = nx.maximum_flow_value(G_transitable, origen, destino, capacity='capacidad')
-                    rutas_destacadas.append({
-                        'inicio': origen,
-                        'fin': destino,
-                        'ruta': ruta,
-                        'flujo_maximo': round(flujo, 2)
-                    })
-                    usados.add(origen)
-                    usados.add(destino)
-                    break  # Solo una ruta por origen
-            except Exception as e:
-                logging.error(f"Error calculating connected highlighted route {origen} -> {destino}: {e}")
-                continue
-        if len(rutas_destacadas) >= 5:
-            break
-    return rutas, flujos, rutas_destacadas
-
-    # Rutas conectadas partiendo desde el embalse (fuente)
-    rutas_destacadas = []
-    usados = set([fuente])
-    actual = fuente
-    rutas_optimas_panel = {}
-    for _ in range(3):  # Hasta 3 rutas conectadas
-        pos_actual = G_transitable.nodes[actual]["pos"]
-        candidatos = [n for n in nodos_transitables if n != actual and n not in usados]
-        candidatos = sorted(candidatos, key=lambda n: geodesic(pos_actual, G_transitable.nodes[n]["pos"]).meters)
-        encontrado = False
-        for destino in candidatos:
-            try:
-                if nx.has_path(G_transitable, actual, destino):
-                    ruta = nx.dijkstra_path(G_transitable, actual, destino, weight='weight')
-                    flujo = nx.maximum_flow_value(G_transitable, actual, destino, capacity='capacidad')
-                    rutas_destacadas.append({
-                        'inicio': actual,
-                        'fin': destino,
-                        'ruta': ruta,
-                        'flujo_maximo': round(flujo, 2)
-                    })
-                    usados.add(destino)
-                    rutas_optimas_panel[destino] = ruta
-                    actual = destino
-                    encontrado = True
-                    break
-            except Exception as e:
-                logging.error(f"Error calculating connected highlighted route {actual} -> {destino}: {e}")
-                continue
-        if not encontrado:
+        destacada = ruta_destacada(motor, indice, origen, pos_origen, arboles[origen], usados)
+        if destacada is not None:
+            rutas_destacadas.append(destacada)
+            usados.add(origen)
+            usados.add(destacada['fin'])
+            if progreso is not None:
+                progreso('rutas_destacadas', len(rutas_destacadas) / MAX_RUTAS_DESTACADAS)
+        if len(rutas_destacadas) >= MAX_RUTAS_DESTACADAS:
             break
-    flujos_panel = {r['fin']: r['flujo_maximo'] for r in rutas_destacadas}
-    return rutas_optimas_panel, flujos_panel, rutas_destacadas
\ No newline at end of file
+    return rutas, flujos, rutas_destacadas, distancias
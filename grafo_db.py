@@ -0,0 +1,324 @@
+import zlib
+import logging
+import threading
+from collections import Counter
+
+import networkx as nx
+import pandas as pd
+from sqlalchemy import select, func, or_, tuple_
+
+from extensions import db
+from distancias import distancia_km
+from perfil_db import fecha_comparable
+from models import Embalse, PuntoCritico, Nodo, Arista
+
+TAM_LOTE_LECTURA = 5000
+# Nodos o pares por sentencia IN, lejos del límite de parámetros de SQLite
+TAM_LOTE_CONSULTA = 500
+# Pasado este margen tras la última fecha leída, ninguna escritura pendiente puede llevarla
+MARGEN_ASENTADO_S = 10
+
+# Tablas de nodos en el orden de construir_grafo: ante nombres repetidos gana la última
+TABLAS_NODOS = {
+    'embalses': (Embalse, (Embalse.nombre, Embalse.latitud, Embalse.longitud, Embalse.volumen_almacenado_m3)),
+    'puntos_criticos': (PuntoCritico, (PuntoCritico.nombre, PuntoCritico.latitud, PuntoCritico.longitud,
+                                       PuntoCritico.tipo)),
+    'nodos': (Nodo, (Nodo.id_nodo, Nodo.latitud, Nodo.longitud, Nodo.tipo, Nodo.estado)),
+}
+COLUMNAS_ARISTAS = (Arista.origen, Arista.destino, Arista.distancia, Arista.estado, Arista.capacidad)
+
+def _consulta(modelo, columnas):
+    # Toda fila leída empieza por (id, fecha_actualizacion)
+    return select(modelo.id, modelo.fecha_actualizacion, *columnas)
+
+def _desde(columna, fecha, estricto=False):
+    """``columna >= fecha``, or ``>`` if ``estricto``."""
+    columna, fecha = fecha_comparable(db.engine, columna, fecha)
+    return columna > fecha if estricto else columna >= fecha
+
+def _atributos_nodo(tabla, fila):
+    """Node name and attributes of one row of a node table, as ``construir_grafo`` sets them."""
+    _, _, nombre, lat, lon, *resto = fila
+    if tabla == 'embalses':
+        return nombre, {'pos': (lat, lon), 'tipo': 'embalse', 'capacidad': resto[0], 'estado': 'transitable'}
+    if tabla == 'puntos_criticos':
+        return nombre, {'pos': (lat, lon), 'tipo': 'punto_critico', 'subtipo': resto[0], 'estado': 'obstaculo'}
+    tipo, estado = resto
+    return nombre, {'pos': (lat, lon), 'tipo': tipo, 'estado': estado or 'transitable'}
+
+def agregar_filas_aristas(G, filas):
+    """Add ``aristas`` rows, in id order, to ``G`` with the rules of ``agregar_aristas``.
+
+    The result is that of adding the rows one at a time: a row's direction
+    overwrites, its reverse only fills a gap. Returns the accepted rows.
+    """
+    nuevas = {}
+    aceptadas = 0
+    for _, _, origen, destino, distancia, estado, capacidad in filas:
+        if estado == 'bloqueado' or origen not in G or destino not in G:
+            continue
+        datos_origen, datos_destino = G.nodes[origen], G.nodes[destino]
+        if datos_origen.get('estado') == 'obstaculo' or datos_destino.get('estado') == 'obstaculo':
+            continue
+        if not (distancia is not None and distancia > 0):
+            distancia = distancia_km(datos_origen['pos'], datos_destino['pos'])
+        datos = {'weight': distancia, 'estado': estado or 'transitable', 'color': 'blue',
+                 'capacidad': 1000.0 if capacidad is None else capacidad, 'distancia': distancia}
+        nuevas[(origen, destino)] = datos
+        if (destino, origen) not in nuevas and not G.has_edge(destino, origen):
+            nuevas[(destino, origen)] = dict(datos)
+        aceptadas += 1
+    G.add_edges_from((u, v, datos) for (u, v), datos in nuevas.items())
+    return aceptadas
+
+def _huella(fila):
+    # Estable entre procesos, a diferencia de hash()
+    return zlib.crc32(repr(tuple(fila)).encode())
+
+def _registrar(marcas, tabla, fila):
+    """Advance ``marcas[tabla]``, the newest ``fecha_actualizacion`` and the rows read with it."""
+    fecha = fila[1]
+    if fecha is None:
+        return
+    marca = marcas.get(tabla)
+    if marca is None or fecha > marca[0]:
+        marcas[tabla] = (fecha, {fila[0]: _huella(fila)})
+    elif fecha == marca[0]:
+        marca[1][fila[0]] = _huella(fila)
+
+def _lotes(valores, tam=TAM_LOTE_CONSULTA):
+    valores = list(valores)
+    for inicio in range(0, len(valores), tam):
+        yield valores[inicio:inicio + tam]
+
+class CambiosDB:
+    """Rows read by ``CargadorGrafoDB.leer_cambios``, ready to be applied."""
+
+    def __init__(self, generacion):
+        self.generacion = generacion
+        self.nodos = {tabla: [] for tabla in TABLAS_NODOS}
+        self.aristas = []
+        # Todas las filas de los pares afectados, por id
+        self.filas_pares = {}
+        self.pares = set()
+        self.marcas = {}
+        self.conteos = {}
+
+    def __bool__(self):
+        return bool(self.aristas) or any(self.nodos.values())
+
+class CargadorGrafoDB:
+    """Routing graph built from the ``Embalse``, ``PuntoCritico``, ``Nodo`` and ``Arista`` tables.
+
+    ``construir`` streams every table with ``yield_per`` (a server-side
+    cursor where the driver has one) and builds the graph row by row with
+    the same attributes and edge rules as ``construir_grafo``, without
+    pandas. ``leer_cambios`` then reads only the rows whose
+    ``fecha_actualizacion`` is not older than the newest one already seen,
+    plus the edge rows of the pairs they touch, and ``aplicar`` updates
+    the graph in place from them. Rows seen with the newest timestamp are
+    remembered by a checksum, so the second-resolution clock of SQLite
+    neither misses nor repeats them.
+
+    Deleted rows, rows that change their key and node names shared by
+    two tables are not applied incrementally: ``leer_cambios`` returns
+    ``None`` and the graph must be rebuilt.
+    """
+
+    def __init__(self, app, tam_lote=TAM_LOTE_LECTURA):
+        self.app = app
+        self.tam_lote = tam_lote
+        self.grafo = None
+        self.generacion = 0
+        self.conteos = {}
+        self._claves = {}
+        self._marcas = {}
+        self._apariciones = Counter()
+        # Suma de las huellas de las filas aplicadas: distingue cambios dentro del mismo segundo
+        self._sello = 0
+        self._lock = threading.Lock()
+
+    def firma(self):
+        """Signature of the rows loaded so far, stable across restarts; ``None`` before the first build."""
+        if self.grafo is None:
+            return None
+        marcas = tuple(str(self._marcas[t][0]) if t in self._marcas else None for t in (*TABLAS_NODOS, 'aristas'))
+        return tuple(sorted(self.conteos.items())), marcas, self._sello
+
+    def embalses(self):
+        """Reservoir names in table order, as the ``embalses`` table of the snapshot."""
+        return pd.DataFrame({'nombre': list(self._claves.get('embalses', {}).values())})
+
+    def _filas(self, sentencia):
+        # Filas de Core, sin la capa ORM, en lotes de tam_lote
+        return db.session.connection().execute(sentencia.execution_options(yield_per=self.tam_lote))
+
+    def construir(self):
+        """Build the graph from every row of the four tables; returns it."""
+        with self._lock, self.app.app_context():
+            G = nx.DiGraph()
+            claves, marcas, conteos = {}, {}, {}
+            try:
+                # Una sola transacción: las cuatro tablas se leen de la misma versión
+                for tabla, (modelo, columnas) in TABLAS_NODOS.items():
+                    claves[tabla] = {}
+                    for fila in self._filas(_consulta(modelo, columnas).order_by(modelo.id)):
+                        nombre, atributos = _atributos_nodo(tabla, fila)
+                        G.add_node(nombre, **atributos)
+                        claves[tabla][fila[0]] = nombre
+                        _registrar(marcas, tabla, fila)
+                    conteos[tabla] = len(claves[tabla])
+
+                claves['aristas'] = {}
+                aceptadas = 0
+                for lote in self._filas(_consulta(Arista, COLUMNAS_ARISTAS).order_by(Arista.id)).partitions():
+                    aceptadas += agregar_filas_aristas(G, lote)
+                    for fila in lote:
+                        claves['aristas'][fila[0]] = (fila[2], fila[3])
+                        _registrar(marcas, 'aristas', fila)
+                conteos['aristas'] = len(claves['aristas'])
+            finally:
+                db.session.rollback()
+
+            self.grafo = G
+            self.generacion += 1
+            self.conteos = conteos
+            self._claves = claves
+            self._marcas = marcas
+            self._sello = sum(sum(huellas.values()) for _, huellas in marcas.values()) % 2**32
+            self._apariciones = Counter(n for tabla in TABLAS_NODOS for n in claves[tabla].values())
+            logging.info(f"Graph built from database with {len(G.nodes)} nodes and {G.number_of_edges()} edges "
+                         f"({aceptadas} of {conteos['aristas']} edge rows accepted)")
+            return G
+
+    def _nuevas(self, modelo, columnas, tabla, ahora):
+        """Rows of ``tabla`` changed since the last read, and their ``_registrar`` marks.
+
+        Rows stamped with the newest date already read are read again until
+        the database clock is ``MARGEN_ASENTADO_S`` past it, in case a slower
+        transaction commits one more; the checksums skip those already seen.
+        """
+        sentencia = _consulta(modelo, columnas)
+        marca = self._marcas.get(tabla)
+        if marca is not None:
+            asentada = (ahora - marca[0]).total_seconds() > MARGEN_ASENTADO_S
+            sentencia = sentencia.where(_desde(modelo.fecha_actualizacion, marca[0], estricto=asentada))
+        else:
+            sentencia = sentencia.where(modelo.fecha_actualizacion.is_not(None))
+        filas, marcas = [], {}
+        for fila in self._filas(sentencia.order_by(modelo.id)):
+            if marca is not None and fila[1] == marca[0] and marca[1].get(fila[0]) == _huella(fila):
+                continue
+            filas.append(fila)
+            _registrar(marcas, tabla, fila)
+        return filas, marcas.get(tabla)
+
+    def leer_cambios(self):
+        """Read the rows changed since the last build or read, without touching the graph.
+
+        Returns a ``CambiosDB`` for ``aplicar`` (empty when nothing changed),
+        or ``None`` if the change needs a full rebuild.
+        """
+        with self._lock, self.app.app_context():
+            cambios = CambiosDB(self.generacion)
+            try:
+                ahora = db.session.scalar(select(func.now()))
+                afectados, nombres_nuevos = set(), set()
+                for tabla, (modelo, columnas) in TABLAS_NODOS.items():
+                    filas, cambios.marcas[tabla] = self._nuevas(modelo, columnas, tabla, ahora)
+                    claves = self._claves[tabla]
+                    for fila in filas:
+                        nombre = fila[2]
+                        anterior = claves.get(fila[0])
+                        if anterior is not None and anterior != nombre:
+                            return None
+                        if anterior is None:
+                            if self._apariciones[nombre] or nombre in nombres_nuevos:
+                                return None
+                            nombres_nuevos.add(nombre)
+                        afectados.add(nombre)
+                    cambios.nodos[tabla] = filas
+
+                filas, cambios.marcas['aristas'] = self._nuevas(Arista, COLUMNAS_ARISTAS, 'aristas', ahora)
+                cambios.aristas = filas
+                for fila in filas:
+                    anterior = self._claves['aristas'].get(fila[0])
+                    for origen, destino in filter(None, (anterior, (fila[2], fila[3]))):
+                        cambios.pares.add((origen, destino) if origen <= destino else (destino, origen))
+
+                # Filas borradas o insertadas sin fecha: el conteo no cuadra
+                for tabla, modelo in (*((t, m) for t, (m, _) in TABLAS_NODOS.items()), ('aristas', Arista)):
+                    nuevas = {f[0] for f in (cambios.aristas if tabla == 'aristas' else cambios.nodos[tabla])}
+                    esperado = len(self._claves[tabla]) + len(nuevas - self._claves[tabla].keys())
+                    cambios.conteos[tabla] = db.session.scalar(select(func.count()).select_from(modelo))
+                    if cambios.conteos[tabla] != esperado:
+                        return None
+
+                if not cambios:
+                    return cambios
+
+                # Un nodo nuevo o modificado rehace los pares que lo tocan
+                for lote in _lotes(afectados):
+                    for fila in self._filas(_consulta(Arista, COLUMNAS_ARISTAS).where(
+                            or_(Arista.origen.in_(lote), Arista.destino.in_(lote)))):
+                        origen, destino = fila[2], fila[3]
+                        cambios.pares.add((origen, destino) if origen <= destino else (destino, origen))
+                        cambios.filas_pares[fila[0]] = fila
+
+                pendientes = [p for p in cambios.pares if p[0] not in afectados and p[1] not in afectados]
+                for lote in _lotes(pendientes):
+                    sentidos = lote + [(destino, origen) for origen, destino in lote]
+                    for fila in self._filas(_consulta(Arista, COLUMNAS_ARISTAS).where(
+                            tuple_(Arista.origen, Arista.destino).in_(sentidos))):
+                        cambios.filas_pares[fila[0]] = fila
+                return cambios
+            finally:
+                db.session.rollback()
+
+    def aplicar(self, cambios):
+        """Apply ``cambios`` to the graph in place; returns the changed nodes and edge pairs.
+
+        Run it while no one walks the graph. Changes read before a rebuild
+        are dropped; the next read starts from the rebuilt state.
+        """
+        with self._lock:
+            if cambios.generacion != self.generacion or not cambios:
+                return []
+            G = self.grafo
+            elementos = []
+            for tabla, filas in cambios.nodos.items():
+                claves = self._claves[tabla]
+                for fila in filas:
+                    nombre, atributos = _atributos_nodo(tabla, fila)
+                    if nombre in G:
+                        G.nodes[nombre].update(atributos)
+                    else:
+                        G.add_node(nombre, **atributos)
+                    if fila[0] not in claves:
+                        self._apariciones[nombre] += 1
+                    claves[fila[0]] = nombre
+                    elementos.append(nombre)
+
+            for fila in cambios.aristas:
+                self._claves['aristas'][fila[0]] = (fila[2], fila[3])
+
+            # Cada par afectado se recalcula desde todas sus filas, en orden de id
+            for origen, destino in cambios.pares:
+                G.remove_edges_from([(origen, destino), (destino, origen)])
+            agregar_filas_aristas(G, [cambios.filas_pares[i] for i in sorted(cambios.filas_pares)])
+            elementos.extend(cambios.pares)
+
+            for tabla, marca in cambios.marcas.items():
+                if marca is None:
+                    continue
+                actual = self._marcas.get(tabla)
+                if actual is None or marca[0] > actual[0]:
+                    self._marcas[tabla] = marca
+                else:
+                    actual[1].update(marca[1])
+            self.conteos = dict(cambios.conteos)
+            filas = [f for tabla in cambios.nodos.values() for f in tabla] + cambios.aristas
+            self._sello = (self._sello + sum(map(_huella, filas))) % 2**32
+            logging.info(f"Graph refreshed from database: {sum(map(len, cambios.nodos.values()))} node rows, "
+                         f"{len(cambios.aristas)} edge rows, {len(cambios.pares)} edge pairs recomputed")
+            return elementos
@@ -0,0 +1,268 @@
+import json
+import queue
+import base64
+import atexit
+import logging
+import threading
+
+from datetime import datetime
+
+from sqlalchemy import select, func, tuple_, cast, Date
+from sqlalchemy.orm import defer
+
+from extensions import db
+from models import Procesamiento, HistorialRuta
+from perfil_db import fecha_comparable
+
+# Filas de rutas calculadas: las de destinos inalcanzables no tienen ruta_json
+CON_RUTA = HistorialRuta.ruta_json.is_not(None)
+
+def filas_historial(fuente, rutas, flujos, distancias):
+    """``historial_rutas`` rows of one run, without ``procesamiento_id``.
+
+    ``distancias`` are the route lengths from the shortest-path trees, so
+    nothing is summed again over the graph. Unreachable destinations get a
+    row with a null ``ruta_json``, only read by ``destinos_inalcanzables``;
+    listings and counts keep to ``CON_RUTA``.
+    """
+    filas = []
+    for destino, ruta in rutas.items():
+        if ruta is None:
+            # Destino inalcanzable: fila sin ruta, para contarlo en SQL
+            filas.append({
+                'origen': fuente,
+                'destino': destino,
+                'ruta_json': None,
+                'flujo_maximo': 0,
+                'distancia_total': None,
+                'tiempo_estimado_h': None,
+            })
+            continue
+        distancia_total = distancias.get(destino, 0)
+        filas.append({
+            'origen': fuente,
+            'destino': destino,
+            'ruta_json': json.dumps(ruta),
+            'flujo_maximo': flujos.get(destino, 0),
+            'distancia_total': distancia_total,
+            'tiempo_estimado_h': distancia_total / 50.0 if distancia_total > 0 else 0,
+        })
+    return filas
+
+def guardar_procesamiento(procesamiento, filas):
+    """Insert one run and its route rows in a single transaction; returns the run id.
+
+    ``procesamiento`` holds the ``procesamientos`` columns. The route rows
+    go in one ``executemany``. Needs an application context.
+    """
+    try:
+        resultado = db.session.execute(Procesamiento.__table__.insert().values(**procesamiento))
+        id_procesamiento = resultado.inserted_primary_key[0]
+        if filas:
+            db.session.execute(HistorialRuta.__table__.insert(),
+                               [dict(fila, procesamiento_id=id_procesamiento) for fila in filas])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    contadores.sumar(1, sum(1 for fila in filas if fila.get('ruta_json') is not None))
+    return id_procesamiento
+
+class ContadoresHistorial:
+    """Row counts of ``procesamientos`` and ``historial_rutas`` (routes only) kept in memory.
+
+    Counted once with ``contar`` and then advanced by every
+    ``guardar_procesamiento``, so reading them never queries the database.
+    While the count has not succeeded (database locked, tables missing),
+    ``listos`` retries it. Rows written by other processes only show up
+    on the next ``contar``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.procesamientos = None
+        self.historial_rutas = None
+        self.error = None
+
+    def contar(self):
+        """Count both tables; needs an application context. Errors are kept in ``error``."""
+        try:
+            procesamientos = db.session.scalar(select(func.count()).select_from(Procesamiento))
+            historial_rutas = db.session.scalar(select(func.count()).select_from(HistorialRuta).where(CON_RUTA))
+        except Exception as e:
+            self.error = str(e)
+            logging.warning(f"History row count failed: {e}")
+            return
+        with self._lock:
+            self.procesamientos, self.historial_rutas, self.error = procesamientos, historial_rutas, None
+
+    def sumar(self, procesamientos, historial_rutas):
+        with self._lock:
+            if self.procesamientos is not None:
+                self.procesamientos += procesamientos
+                self.historial_rutas += historial_rutas
+
+    def listos(self):
+        """True once both tables are counted; retries ``contar`` until then (needs an application context)."""
+        if self.procesamientos is None:
+            self.contar()
+        return self.procesamientos is not None
+
+    def resumen(self):
+        with self._lock:
+            return {'procesamientos': self.procesamientos, 'historial_rutas': self.historial_rutas}
+
+contadores = ContadoresHistorial()
+
+class EscritorHistorial:
+    """Write-behind queue that saves processing runs off the request thread.
+
+    ``encolar`` returns at once (it only blocks when ``max_pendientes`` runs
+    are already waiting); one background thread saves them in order with
+    ``guardar_procesamiento`` inside ``app``'s context. The queue is drained
+    at interpreter exit.
+    """
+
+    def __init__(self, app, max_pendientes=1000):
+        self.app = app
+        self._cola = queue.Queue(maxsize=max_pendientes)
+        self._hilo = None
+        self._lock = threading.Lock()
+        self.estadisticas = {'guardados': 0, 'errores': 0}
+        atexit.register(self.vaciar)
+
+    def encolar(self, procesamiento, filas):
+        with self._lock:
+            if self._hilo is None:
+                self._hilo = threading.Thread(target=self._ejecutar, name='historial', daemon=True)
+                self._hilo.start()
+        self._cola.put((procesamiento, filas))
+
+    def pendientes(self):
+        return self._cola.unfinished_tasks
+
+    def vaciar(self):
+        """Block until every queued run has been written."""
+        if self._hilo is not None:
+            self._cola.join()
+
+    def _ejecutar(self):
+        while True:
+            procesamiento, filas = self._cola.get()
+            try:
+                with self.app.app_context():
+                    id_procesamiento = guardar_procesamiento(procesamiento, filas)
+                self.estadisticas['guardados'] += 1
+                logging.info(f"Processing results saved to database (ID: {id_procesamiento}, write-behind)")
+            except Exception as e:
+                self.estadisticas['errores'] += 1
+                logging.warning(f"Failed to save to database: {e}")
+            finally:
+                self._cola.task_done()
+
+def codificar_cursor(fecha, id_procesamiento):
+    """Opaque keyset cursor for the run after ``(fecha, id_procesamiento)``."""
+    texto = f"{fecha.isoformat()}|{id_procesamiento}"
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+def decodificar_cursor(cursor):
+    """``(fecha, id)`` of a ``codificar_cursor`` cursor; raises ``ValueError`` if malformed."""
+    try:
+        texto = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        fecha, id_procesamiento = texto.split('|')
+        return datetime.fromisoformat(fecha), int(id_procesamiento)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Cursor inválido: {cursor}") from e
+
+def _filtrar(sentencia, fuente=None, desde=None, hasta=None):
+    """Restrict ``sentencia`` to runs of ``fuente`` with ``desde <= fecha_procesamiento < hasta``."""
+    if fuente is not None:
+        sentencia = sentencia.where(Procesamiento.fuente_principal == fuente)
+    if desde is not None:
+        columna, valor = fecha_comparable(db.engine, Procesamiento.fecha_procesamiento, desde)
+        sentencia = sentencia.where(columna >= valor)
+    if hasta is not None:
+        columna, valor = fecha_comparable(db.engine, Procesamiento.fecha_procesamiento, hasta)
+        sentencia = sentencia.where(columna < valor)
+    return sentencia
+
+def _dia(columna):
+    # CAST(... AS DATE) en SQLite da un número: date() devuelve 'AAAA-MM-DD'
+    if db.engine.dialect.name in ('sqlite', 'mysql'):
+        return func.date(columna)
+    return cast(columna, Date)
+
+def pagina_procesamientos(limite, cursor=None, **filtros):
+    """One page of runs, newest first, and the cursor of the next page (``None`` on the last).
+
+    Keyset pagination on ``(fecha_procesamiento, id)``: each page is an
+    index range scan that starts after ``cursor`` whatever its depth.
+    ``filtros`` are those of ``_filtrar``.
+    """
+    sentencia = _filtrar(select(Procesamiento).options(defer(Procesamiento.detalles_json)), **filtros)
+    if cursor is not None:
+        fecha, id_procesamiento = cursor
+        columna, valor = fecha_comparable(db.engine, Procesamiento.fecha_procesamiento, fecha)
+        sentencia = sentencia.where(tuple_(columna, Procesamiento.id) < tuple_(valor, id_procesamiento))
+    sentencia = sentencia.order_by(Procesamiento.fecha_procesamiento.desc(), Procesamiento.id.desc())
+    procesamientos = db.session.scalars(sentencia.limit(limite + 1)).all()
+
+    siguiente = None
+    if len(procesamientos) > limite:
+        procesamientos = procesamientos[:limite]
+        siguiente = codificar_cursor(procesamientos[-1].fecha_procesamiento, procesamientos[-1].id)
+    return [p.to_dict() for p in procesamientos], siguiente
+
+def pagina_rutas(procesamiento_id, limite, despues=None):
+    """One page of a run's routes in id order, starting after id ``despues``, and the next cursor.
+
+    Unreachable destinations are left out, as before they were stored.
+    """
+    sentencia = select(HistorialRuta).where(HistorialRuta.procesamiento_id == procesamiento_id, CON_RUTA)
+    if despues is not None:
+        sentencia = sentencia.where(HistorialRuta.id > despues)
+    rutas = db.session.scalars(sentencia.order_by(HistorialRuta.id).limit(limite + 1)).all()
+
+    siguiente = None
+    if len(rutas) > limite:
+        rutas = rutas[:limite]
+        siguiente = rutas[-1].id
+    return [r.to_dict() for r in rutas], siguiente
+
+def tiempo_promedio(**filtros):
+    """Count and average, minimum and maximum processing time of the matching runs."""
+    tiempo = Procesamiento.tiempo_procesamiento_ms
+    cantidad, promedio, minimo, maximo = db.session.execute(_filtrar(
+        select(func.count(Procesamiento.id), func.avg(tiempo), func.min(tiempo), func.max(tiempo)), **filtros
+    )).one()
+    return {
+        'procesamientos': cantidad,
+        'tiempo_promedio_ms': float(promedio) if promedio is not None else None,
+        'tiempo_minimo_ms': minimo,
+        'tiempo_maximo_ms': maximo,
+    }
+
+def flujo_por_dia(**filtros):
+    """Runs and total maximum flow per calendar day of the matching runs, oldest day first."""
+    dia = _dia(Procesamiento.fecha_procesamiento).label('dia')
+    sentencia = _filtrar(
+        select(dia, func.count(Procesamiento.id), func.sum(Procesamiento.total_flujo_maximo)), **filtros
+    ).group_by(dia).order_by(dia)
+    return [
+        {'dia': str(d), 'procesamientos': cantidad, 'flujo_total': flujo}
+        for d, cantidad, flujo in db.session.execute(sentencia)
+    ]
+
+def destinos_inalcanzables(limite, **filtros):
+    """Destinations most often unreachable in the matching runs, with how often and when last."""
+    veces = func.count().label('veces')
+    sentencia = _filtrar(
+        select(HistorialRuta.destino, veces, func.max(Procesamiento.fecha_procesamiento))
+        .join(Procesamiento, HistorialRuta.procesamiento_id == Procesamiento.id)
+        .where(HistorialRuta.ruta_json.is_(None)),
+        **filtros
+    ).group_by(HistorialRuta.destino).order_by(veces.desc(), HistorialRuta.destino).limit(limite)
+    return [
+        {'destino': destino, 'veces': cantidad, 'ultima_vez': ultima.isoformat() if ultima else None}
+        for destino, cantidad, ultima in db.session.execute(sentencia)
+    ]
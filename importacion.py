@@ -0,0 +1,203 @@
+import math
+import logging
+
+import numpy as np
+
+from sqlalchemy import UniqueConstraint, and_, bindparam, exists, insert, select
+from sqlalchemy.dialects.sqlite import insert as insert_sqlite
+
+from extensions import db
+from distancias import haversine_km
+from models import Embalse, PuntoCritico, Nodo, Arista
+
+TAM_LOTE_IMPORTACION = 5000
+
+# Tabla -> (modelo, columnas clave, {columna del modelo: nombres aceptados en el CSV})
+TABLAS_IMPORTACION = {
+    'embalses': (Embalse, ('nombre',), {
+        'nombre': ('Nombre', 'nombre'),
+        'latitud': ('Latitud', 'latitud'),
+        'longitud': ('Longitud', 'longitud'),
+        'volumen_almacenado_m3': ('Volumen_Almacenado_m3', 'volumen_almacenado_m3'),
+    }),
+    'puntos_criticos': (PuntoCritico, ('nombre',), {
+        'nombre': ('Nombre', 'nombre'),
+        'latitud': ('Latitud', 'latitud'),
+        'longitud': ('Longitud', 'longitud'),
+        'tipo': ('Tipo', 'tipo'),
+        'prioridad': ('Prioridad', 'prioridad'),
+        'poblacion_afectada': ('Poblacion_Afectada', 'poblacion_afectada'),
+    }),
+    'nodos': (Nodo, ('id_nodo',), {
+        'id_nodo': ('id_nodo',),
+        'latitud': ('latitud',),
+        'longitud': ('longitud',),
+        'tipo': ('tipo',),
+        'estado': ('estado',),
+    }),
+    'aristas': (Arista, ('origen', 'destino'), {
+        'origen': ('origen',),
+        'destino': ('destino',),
+        'distancia': ('distancia',),
+        'estado': ('estado',),
+        'capacidad': ('capacidad',),
+    }),
+}
+
+def _valor(valor):
+    if valor is None or (isinstance(valor, float) and math.isnan(valor)):
+        return None
+    return valor
+
+def _columna_csv(df, nombres):
+    return next((df[n] for n in nombres if n in df.columns), None)
+
+def filas_desde_tabla(df, modelo, columnas):
+    """Rows of ``df`` as dicts of ``modelo`` columns, plus the count of invalid rows.
+
+    CSV columns are matched by any of their accepted names and missing
+    optional ones are left out. Rows lacking a required (non-nullable)
+    value, e.g. the empty rows of a damaged CSV, are dropped.
+    """
+    presentes = {}
+    for columna, nombres in columnas.items():
+        serie = _columna_csv(df, nombres)
+        if serie is not None:
+            presentes[columna] = [_valor(v) for v in serie.tolist()]
+    tabla = modelo.__table__
+    requeridas = [c.name for c in tabla.columns
+                  if not c.nullable and not c.primary_key and c.default is None]
+    faltantes = [c for c in requeridas if c not in presentes]
+    if faltantes:
+        raise ValueError(f"Faltan columnas para {tabla.name}: {', '.join(faltantes)}")
+
+    filas, invalidas = [], 0
+    enteras = {c.name for c in tabla.columns if c.type.python_type is int and not c.primary_key}
+    for valores in zip(*presentes.values()):
+        fila = dict(zip(presentes, valores))
+        if any(fila[c] is None for c in requeridas):
+            invalidas += 1
+            continue
+        for c in enteras.intersection(fila):
+            if fila[c] is not None:
+                fila[c] = int(fila[c])
+        filas.append(fila)
+    return filas, invalidas
+
+def completar_distancias(aristas, *tablas):
+    """Copy of ``aristas`` with missing or non-positive distances computed from endpoint coordinates.
+
+    ``tablas`` are ``(nombre, DataFrame)`` pairs of the node tables; the
+    haversine fallback is the one ``construir_grafo`` uses.
+    """
+    latitud, longitud = {}, {}
+    for nombre, df in tablas:
+        _, claves, columnas = TABLAS_IMPORTACION[nombre]
+        ids = _columna_csv(df, columnas[claves[0]])
+        lat = _columna_csv(df, columnas['latitud'])
+        lon = _columna_csv(df, columnas['longitud'])
+        if ids is not None and lat is not None and lon is not None:
+            latitud.update(zip(ids.tolist(), lat.tolist()))
+            longitud.update(zip(ids.tolist(), lon.tolist()))
+
+    aristas = aristas.copy()
+    calculada = haversine_km(
+        aristas['origen'].map(latitud).to_numpy(dtype=float),
+        aristas['origen'].map(longitud).to_numpy(dtype=float),
+        aristas['destino'].map(latitud).to_numpy(dtype=float),
+        aristas['destino'].map(longitud).to_numpy(dtype=float),
+    )
+    if 'distancia' in aristas.columns:
+        distancia = aristas['distancia'].to_numpy(dtype=float)
+        aristas['distancia'] = np.where(distancia > 0, distancia, calculada)
+    else:
+        aristas['distancia'] = calculada
+    return aristas
+
+def _clave_unica(tabla, claves):
+    """True if a unique constraint or index of ``tabla`` covers exactly ``claves``."""
+    claves = set(claves)
+    unicas = [r.columns for r in tabla.constraints if isinstance(r, UniqueConstraint)]
+    unicas += [i.columns for i in tabla.indexes if i.unique]
+    return any({c.name for c in columnas} == claves for columnas in unicas)
+
+def _claves_existentes(tabla, claves):
+    """Set of the ``claves`` tuples already stored in ``tabla``."""
+    existentes = {tuple(fila) for fila in db.session.execute(select(*(tabla.c[c] for c in claves)))}
+    db.session.commit()
+    return existentes
+
+def _sentencia_insercion(tabla, claves, columnas):
+    """Insert statement for rows of ``columnas`` that skips keys already in ``tabla``.
+
+    A key backed by a unique constraint uses ``ON CONFLICT DO NOTHING`` on
+    SQLite. Otherwise (``aristas`` has no unique pair) each row is inserted
+    through ``INSERT ... SELECT ... WHERE NOT EXISTS`` on its key.
+    """
+    if _clave_unica(tabla, claves):
+        if db.engine.dialect.name == 'sqlite':
+            return insert_sqlite(tabla).on_conflict_do_nothing()
+        return insert(tabla)
+    parametros = {c: bindparam(c, type_=tabla.c[c].type) for c in columnas}
+    repetida = exists().where(and_(*(tabla.c[c] == parametros[c] for c in claves)))
+    fuente = select(*parametros.values()).where(~repetida)
+    return insert(tabla).from_select(columnas, fuente)
+
+def importar_filas(modelo, claves, filas, tam_lote=TAM_LOTE_IMPORTACION, progreso=None):
+    """Insert the rows of ``filas`` whose key is not in the table yet.
+
+    Existing keys are read in one query and the difference is taken in
+    memory, also dropping repeated keys within ``filas``. New rows go in
+    ``tam_lote`` at a time, one ``executemany`` and one commit per chunk,
+    so an interrupted import keeps its finished chunks and a rerun skips
+    them. The insert itself re-checks the key (see ``_sentencia_insercion``)
+    so a row added concurrently is skipped instead of duplicated.
+    Returns ``(insertadas, omitidas)``.
+    """
+    tabla = modelo.__table__
+    existentes = _claves_existentes(tabla, claves)
+
+    nuevas = []
+    for fila in filas:
+        clave = tuple(fila[c] for c in claves)
+        if clave not in existentes:
+            existentes.add(clave)
+            nuevas.append(fila)
+    if not nuevas:
+        return 0, len(filas)
+
+    sentencia = _sentencia_insercion(tabla, claves, list(nuevas[0]))
+
+    insertadas = 0
+    for inicio in range(0, len(nuevas), tam_lote):
+        lote = nuevas[inicio:inicio + tam_lote]
+        try:
+            resultado = db.session.execute(sentencia, lote)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        insertadas += resultado.rowcount if resultado.rowcount >= 0 else len(lote)
+        if progreso is not None:
+            progreso(tabla.name, (inicio + len(lote)) / len(nuevas))
+    return insertadas, len(filas) - insertadas
+
+def importar_tablas(tablas, tam_lote=TAM_LOTE_IMPORTACION, progreso=None):
+    """Bulk-import ``{nombre: DataFrame}`` into the tables of ``TABLAS_IMPORTACION``.
+
+    Returns, per table, the rows read and how many were inserted, skipped
+    as already present and dropped as invalid.
+    """
+    informe = {}
+    for nombre, df in tablas.items():
+        modelo, claves, columnas = TABLAS_IMPORTACION[nombre]
+        filas, invalidas = filas_desde_tabla(df, modelo, columnas)
+        insertadas, omitidas = importar_filas(modelo, claves, filas, tam_lote, progreso)
+        informe[nombre] = {
+            'leidas': len(df),
+            'insertadas': insertadas,
+            'omitidas': omitidas,
+            'invalidas': invalidas,
+        }
+        logging.info(f"Imported {nombre}: {insertadas} inserted, {omitidas} skipped, {invalidas} invalid")
+    return informe
@@ -0,0 +1,151 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+from distancias import RADIO_TIERRA_KM, distancias_uno_a_muchos
+
+# Factor con que se agrandan en el plano proyectado los radios y distancias que deben
+# cubrir una distancia haversine. El error relativo del plano crece como
+# tan(lat_ref) * Δlat (en radianes): en la red incluida (lat -16°, 25 km de norte a sur)
+# no pasa de 0.05 %; el 1 % cubre redes que se alejen hasta ~2° de lat_ref a esa latitud
+MARGEN_PROYECCION = 1.01
+
+def proyectar_km(coords, lat_ref=None):
+    """Project ``(lat, lon)`` pairs to a local equirectangular plane in km.
+
+    At city scale this keeps nearest-neighbour order consistent with the
+    haversine distance, so Euclidean indexes can be built on the result.
+    """
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if lat_ref is None:
+        lat_ref = float(np.mean(coords[:, 0])) if len(coords) else 0.0
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+    return np.column_stack((RADIO_TIERRA_KM * lon * np.cos(np.radians(lat_ref)),
+                            RADIO_TIERRA_KM * lat))
+
+class IndiceKD:
+    """KD-tree over node positions, built once and queried many times."""
+
+    def __init__(self, ids, coords):
+        self.ids = list(ids)
+        coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        self.lat_ref = float(np.mean(coords[:, 0])) if len(coords) else 0.0
+        self.arbol = cKDTree(proyectar_km(coords, self.lat_ref))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def vecinos(self, pos, lote=16):
+        """Yield ids ordered by distance to ``pos``, querying ``lote`` at a time.
+
+        Each round doubles ``k`` and only yields the new neighbours, so callers
+        that stop after the first acceptable candidate never touch the rest.
+        """
+        n = len(self.ids)
+        punto = proyectar_km([pos], self.lat_ref)[0]
+        entregados = 0
+        k = lote
+        while entregados < n:
+            k = min(k, n)
+            _, indices = self.arbol.query(punto, k=k)
+            for i in np.atleast_1d(indices)[entregados:]:
+                yield self.ids[i]
+            entregados = k
+            k *= 2
+
+class IndiceGrilla:
+    """Uniform grid (spatial hash) over node positions with square cells in km.
+
+    Cheap to build and exact for radius and k-nearest queries: candidates are
+    gathered ring by ring around the query cell and the final distances are
+    haversine, so results match a brute-force scan.
+    """
+
+    def __init__(self, coords, tam_celda_km=0.5, lat_ref=None):
+        self.coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+        if lat_ref is None:
+            lat_ref = float(np.mean(self.coords[:, 0])) if len(self.coords) else 0.0
+        self.lat_ref = lat_ref
+        self.tam_celda_km = float(tam_celda_km)
+        self.celdas = {}
+
+        if not len(self.coords):
+            return
+        xy = proyectar_km(self.coords, self.lat_ref)
+        ix = np.floor(xy[:, 0] / self.tam_celda_km).astype(np.int64)
+        iy = np.floor(xy[:, 1] / self.tam_celda_km).astype(np.int64)
+        orden = np.lexsort((iy, ix))
+        cortes = np.flatnonzero((np.diff(ix[orden]) != 0) | (np.diff(iy[orden]) != 0)) + 1
+        for grupo in np.split(orden, cortes):
+            self.celdas[(int(ix[grupo[0]]), int(iy[grupo[0]]))] = grupo
+
+    def __len__(self):
+        return len(self.coords)
+
+    def _celda(self, pos):
+        x, y = proyectar_km([pos], self.lat_ref)[0]
+        return int(np.floor(x / self.tam_celda_km)), int(np.floor(y / self.tam_celda_km))
+
+    def _anillo(self, cx, cy, r):
+        """Indices stored in the cells at Chebyshev distance ``r`` from ``(cx, cy)``."""
+        if r == 0:
+            claves = [(cx, cy)]
+        else:
+            claves = [(cx + dx, cy + dy) for dx in range(-r, r + 1) for dy in (-r, r)]
+            claves += [(cx + dx, cy + dy) for dx in (-r, r) for dy in range(-r + 1, r)]
+        return [self.celdas[c] for c in claves if c in self.celdas]
+
+    def _distancias(self, pos, indices):
+        return distancias_uno_a_muchos(pos, self.coords[indices])
+
+    def dentro_de_radio(self, pos, radio_km):
+        """Return ``(indices, distancias)`` of every point closer than ``radio_km``."""
+        cx, cy = self._celda(pos)
+        anillos = int(np.ceil(radio_km * MARGEN_PROYECCION / self.tam_celda_km))
+        grupos = []
+        for r in range(anillos + 1):
+            grupos.extend(self._anillo(cx, cy, r))
+        if not grupos:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        indices = np.concatenate(grupos)
+        dist = self._distancias(pos, indices)
+        dentro = dist < radio_km
+        return indices[dentro], dist[dentro]
+
+    def hay_dentro_de_radio(self, pos, radio_km):
+        """True if at least one point is closer than ``radio_km``."""
+        return len(self.dentro_de_radio(pos, radio_km)[0]) > 0
+
+    def mas_cercanos(self, pos, k, radio_km, excluir=()):
+        """Return ``(indices, distancias)`` of up to ``k`` nearest points within ``radio_km``.
+
+        Rings are added until the k-th candidate is closer than the radius the
+        rings already cover, so far-away cells are never visited.
+        """
+        cx, cy = self._celda(pos)
+        excluir = set(excluir)
+        grupos = []
+        r = 0
+        while True:
+            grupos.extend(self._anillo(cx, cy, r))
+            cubierto = r * self.tam_celda_km
+            if cubierto >= radio_km * MARGEN_PROYECCION:
+                break
+            if grupos:
+                indices = np.concatenate(grupos)
+                if len(indices) - len(excluir) >= k:
+                    dist = np.sort(self._distancias(pos, indices))
+                    if dist[min(k + len(excluir), len(dist)) - 1] * MARGEN_PROYECCION <= cubierto:
+                        break
+            r += 1
+
+        if not grupos:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        indices = np.concatenate(grupos)
+        if excluir:
+            indices = indices[~np.isin(indices, list(excluir))]
+        dist = self._distancias(pos, indices)
+        dentro = dist < radio_km
+        indices, dist = indices[dentro], dist[dentro]
+        orden = np.lexsort((indices, dist))[:k]
+        return indices[orden], dist[orden]
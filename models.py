@@ -1,7 +1,15 @@
 from sqlalchemy.sql import func
+from sqlalchemy.dialects import sqlite
 from datetime import datetime
 from extensions import db  # Importa db desde extensions.py
 
+# En SQLite func.now() guarda 'AAAA-MM-DD HH:MM:SS': las fechas explícitas se guardan
+# igual, sin '.ffffff', para que el orden como texto sea el cronológico
+FechaHora = db.DateTime().with_variant(
+    sqlite.DATETIME(storage_format='%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d'),
+    'sqlite'
+)
+
 # Define los modelos aquí, fuera de cualquier función
 class Embalse(db.Model):
     __tablename__ = 'embalses'
@@ -13,8 +21,8 @@ class Embalse(db.Model):
     volumen_almacenado_m3 = db.Column(db.BigInteger, nullable=False)
     capacidad_maxima_m3 = db.Column(db.BigInteger, nullable=True)
     estado = db.Column(db.String(20), default='operativo')
-    fecha_creacion = db.Column(db.DateTime, default=func.now())
-    fecha_actualizacion = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    fecha_creacion = db.Column(FechaHora, default=func.now())
+    fecha_actualizacion = db.Column(FechaHora, default=func.now(), onupdate=func.now(), index=True)
         
     def to_dict(self):
         return {
@@ -38,8 +46,8 @@ class PuntoCritico(db.Model):
     prioridad = db.Column(db.String(20), default='media') 
     poblacion_afectada = db.Column(db.Integer, nullable=True)
     estado = db.Column(db.String(20), default='activo')
-    fecha_creacion = db.Column(db.DateTime, default=func.now())
-    fecha_actualizacion = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    fecha_creacion = db.Column(FechaHora, default=func.now())
+    fecha_actualizacion = db.Column(FechaHora, default=func.now(), onupdate=func.now(), index=True)
         
     def to_dict(self):
         return {
@@ -63,8 +71,8 @@ class Nodo(db.Model):
     tipo = db.Column(db.String(50), nullable=False)  # tubo, cuadra, bomba, etc.
     estado = db.Column(db.String(20), default='transitable')  # transitable, obstaculo, mantenimiento
     capacidad = db.Column(db.Float, nullable=True)
-    fecha_creacion = db.Column(db.DateTime, default=func.now())
-    fecha_actualizacion = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    fecha_creacion = db.Column(FechaHora, default=func.now())
+    fecha_actualizacion = db.Column(FechaHora, default=func.now(), onupdate=func.now(), index=True)
         
     def to_dict(self):
         return {
@@ -79,6 +87,9 @@ class Nodo(db.Model):
 
 class Arista(db.Model):
     __tablename__ = 'aristas'
+    # Pares de una arista y filas que tocan un nodo, en ambos sentidos
+    __table_args__ = (db.Index('ix_aristas_origen_destino', 'origen', 'destino'),
+                      db.Index('ix_aristas_destino', 'destino'))
         
     id = db.Column(db.Integer, primary_key=True)
     origen = db.Column(db.String(100), nullable=False)
@@ -88,8 +99,8 @@ class Arista(db.Model):
     capacidad = db.Column(db.Float, default=1000.0)
     tipo_tuberia = db.Column(db.String(50), nullable=True)
     diametro_mm = db.Column(db.Float, nullable=True)
-    fecha_creacion = db.Column(db.DateTime, default=func.now())
-    fecha_actualizacion = db.Column(db.DateTime, default=func.now(), onupdate=func.now())
+    fecha_creacion = db.Column(FechaHora, default=func.now())
+    fecha_actualizacion = db.Column(FechaHora, default=func.now(), onupdate=func.now(), index=True)
         
     def to_dict(self):
         return {
@@ -105,9 +116,13 @@ class Arista(db.Model):
 
 class Procesamiento(db.Model):
     __tablename__ = 'procesamientos'
+    # Historial ordenado por fecha (más reciente primero) con el id como desempate
+    __table_args__ = (db.Index('ix_procesamientos_fecha_id', 'fecha_procesamiento', 'id'),
+                      # Páginas y agregados filtrados por fuente
+                      db.Index('ix_procesamientos_fuente_fecha_id', 'fuente_principal', 'fecha_procesamiento', 'id'))
         
     id = db.Column(db.Integer, primary_key=True)
-    fecha_procesamiento = db.Column(db.DateTime, default=func.now())
+    fecha_procesamiento = db.Column(FechaHora, default=func.now())
     fuente_principal = db.Column(db.String(100), nullable=False)
     total_rutas_calculadas = db.Column(db.Integer, nullable=False)
     total_flujo_maximo = db.Column(db.Float, nullable=False)
@@ -128,9 +143,13 @@ class Procesamiento(db.Model):
 
 class HistorialRuta(db.Model):
     __tablename__ = 'historial_rutas'
+    # Índice parcial: solo los destinos inalcanzables (sin ruta)
+    __table_args__ = (db.Index('ix_historial_rutas_inalcanzables', 'procesamiento_id', 'destino',
+                               sqlite_where=db.text('ruta_json IS NULL'),
+                               postgresql_where=db.text('ruta_json IS NULL')),)
         
     id = db.Column(db.Integer, primary_key=True)
-    procesamiento_id = db.Column(db.Integer, db.ForeignKey('procesamientos.id'), nullable=False)
+    procesamiento_id = db.Column(db.Integer, db.ForeignKey('procesamientos.id'), nullable=False, index=True)
     origen = db.Column(db.String(100), nullable=False)
     destino = db.Column(db.String(100), nullable=False)
     ruta_json = db.Column(db.Text, nullable=True) 
@@ -0,0 +1,147 @@
+import numpy as np
+from scipy.sparse import csr_array
+from scipy.sparse.csgraph import dijkstra, connected_components, maximum_flow
+
+# maximum_flow solo admite capacidades enteras: se trabaja en centésimas
+ESCALA_CAPACIDAD = 100
+_CAPACIDAD_MAXIMA = np.iinfo(np.int32).max
+# Valor que usa scipy para "sin predecesor"
+_SIN_PREDECESOR = -9999
+
+class _ArbolesPorLotes(dict):
+    """Shortest-path trees keyed by source, computed ``lote`` sources at a time.
+
+    A miss runs a single multi-source Dijkstra for the missing source and the
+    ones that follow it in ``fuentes``; only the latest batch is kept.
+    """
+
+    def __init__(self, motor, fuentes, lote):
+        super().__init__()
+        self._motor = motor
+        self._fuentes = list(fuentes)
+        self._posicion = {f: i for i, f in enumerate(self._fuentes)}
+        self._lote = lote
+
+    def __missing__(self, fuente):
+        inicio = self._posicion.get(fuente)
+        if inicio is None:
+            return self._motor.arbol(fuente)
+        self.clear()
+        bloque = self._fuentes[inicio:inicio + self._lote]
+        self.update(zip(bloque, self._motor._arboles(bloque)))
+        return dict.__getitem__(self, fuente)
+
+class GrafoCSR:
+    """Compute engine over a CSR copy of a graph with integer node ids.
+
+    Shortest paths, connected components and max flow run on
+    ``scipy.sparse.csgraph``; results are mapped back to the original ids.
+    Build it from the transitable graph (see ``grafo_agua.filtrar_transitable``)
+    and treat it as read-only: it does not follow later changes to ``G``.
+    """
+
+    def __init__(self, G, weight='weight', capacity='capacidad'):
+        self.ids = list(G.nodes)
+        self.indice = {n: i for i, n in enumerate(self.ids)}
+        n = len(self.ids)
+
+        num_aristas = G.number_of_edges()
+        filas = np.empty(num_aristas, dtype=np.int32)
+        columnas = np.empty(num_aristas, dtype=np.int32)
+        pesos = np.empty(num_aristas, dtype=float)
+        capacidades = np.empty(num_aristas, dtype=float)
+        indice = self.indice
+        for k, (u, v, datos) in enumerate(G.edges(data=True)):
+            filas[k] = indice[u]
+            columnas[k] = indice[v]
+            pesos[k] = datos.get(weight, 1)
+            capacidades[k] = datos.get(capacity, np.inf)
+
+        self.pesos = csr_array((pesos, (filas, columnas)), shape=(n, n))
+        capacidades = np.nan_to_num(capacidades * ESCALA_CAPACIDAD, nan=0.0, posinf=_CAPACIDAD_MAXIMA)
+        self._filas, self._columnas = filas, columnas
+        self._capacidades = np.clip(np.round(capacidades), 0, _CAPACIDAD_MAXIMA).astype(np.int32)
+        self.capacidades = self._matriz_capacidad(n)
+
+        # Componentes débiles: sin camino entre componentes distintas no hay flujo
+        _, self.componentes = connected_components(self.pesos, directed=True, connection='weak')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _matriz_capacidad(self, n, extra=None):
+        filas, columnas, valores = self._filas, self._columnas, self._capacidades
+        if extra is not None:
+            filas = np.concatenate([filas, extra[0]])
+            columnas = np.concatenate([columnas, extra[1]])
+            valores = np.concatenate([valores, extra[2]])
+        matriz = csr_array((valores, (filas, columnas)), shape=(n, n), dtype=np.int32)
+        matriz.sum_duplicates()
+        return matriz
+
+    def conectados(self, a, b):
+        """True if ``a`` and ``b`` lie in the same weakly connected component."""
+        ia, ib = self.indice.get(a), self.indice.get(b)
+        return ia is not None and ib is not None and self.componentes[ia] == self.componentes[ib]
+
+    def _arboles(self, fuentes):
+        indices = [self.indice[f] for f in fuentes]
+        distancias, predecesores = dijkstra(self.pesos, directed=True, indices=indices,
+                                            return_predecessors=True)
+        return list(zip(distancias, predecesores))
+
+    def arbol(self, fuente):
+        """Shortest-path tree from ``fuente`` as ``(distancias, predecesores)`` arrays."""
+        if fuente not in self.indice:
+            return None
+        return self._arboles([fuente])[0]
+
+    def arboles(self, fuentes, lote=32):
+        """Lazy ``{fuente: arbol}`` mapping that runs Dijkstra for ``lote`` sources at once."""
+        return _ArbolesPorLotes(self, fuentes, lote)
+
+    def ruta(self, arbol, destino):
+        """Node ids from the tree root to ``destino``; ``None`` if unreachable."""
+        i = self.indice.get(destino)
+        if arbol is None or i is None or not np.isfinite(arbol[0][i]):
+            return None
+        predecesores = arbol[1]
+        ruta = []
+        while i != _SIN_PREDECESOR:
+            ruta.append(self.ids[i])
+            i = predecesores[i]
+        ruta.reverse()
+        return ruta
+
+    def distancia(self, arbol, destino):
+        return float(arbol[0][self.indice[destino]])
+
+    def flujo_maximo(self, fuente, destino):
+        """Max-flow value from ``fuente`` to ``destino``."""
+        if fuente == destino or not self.conectados(fuente, destino):
+            return 0
+        resultado = maximum_flow(self.capacidades, self.indice[fuente], self.indice[destino])
+        return resultado.flow_value / ESCALA_CAPACIDAD
+
+    def flujo_multidestino(self, fuente, demandas):
+        """Max flow from ``fuente`` to every destination in ``demandas`` through a virtual sink.
+
+        Returns ``(flujo_total, flujos)`` like ``grafo_agua.flujo_multidestino``.
+        """
+        destinos = list(demandas)
+        if fuente not in self.indice or not destinos:
+            return 0, {destino: 0 for destino in destinos}
+
+        sumidero = len(self.ids)
+        origenes = np.array([self.indice[d] for d in destinos], dtype=np.int32)
+        capacidad = np.clip(np.round(np.array([demandas[d] for d in destinos], dtype=float)
+                                     * ESCALA_CAPACIDAD), 0, _CAPACIDAD_MAXIMA).astype(np.int32)
+        red = self._matriz_capacidad(
+            sumidero + 1, (origenes, np.full(len(destinos), sumidero, dtype=np.int32), capacidad)
+        )
+        resultado = maximum_flow(red, self.indice[fuente], sumidero)
+
+        # Flujo neto de cada destino hacia el sumidero virtual
+        flujo = resultado.flow.tocsc()[:, [sumidero]].toarray().ravel()
+        flujos = {d: round(max(flujo[i], 0) / ESCALA_CAPACIDAD, 2) for d, i in zip(destinos, origenes)}
+        return round(resultado.flow_value / ESCALA_CAPACIDAD, 2), flujos
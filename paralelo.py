@@ -0,0 +1,152 @@
+import os
+import logging
+import multiprocessing
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+
+import networkx as nx
+
+from grafo_agua import crear_motor, nodos_destacables, ruta_destacada, MAX_RUTAS_DESTACADAS
+from indice_espacial import IndiceKD
+
+# Estado de cada proceso trabajador, preparado una sola vez por el inicializador
+_trabajador = {}
+
+def _contexto():
+    """Start method for the workers: never ``fork`` from the threaded server.
+
+    A forked child inherits every lock held by another thread at that
+    moment (logging, the graph cache, the SQLAlchemy pool) and the open
+    SQLite connections. ``forkserver`` forks from a clean single-threaded
+    process that has already imported this module; ``spawn`` elsewhere.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        contexto = multiprocessing.get_context('forkserver')
+        contexto.set_forkserver_preload(['paralelo'])
+        return contexto
+    return multiprocessing.get_context('spawn')
+
+def _inicializar(grafo, motor):
+    nodos = nodos_destacables(grafo)
+    _trabajador['grafo'] = grafo
+    _trabajador['motor'] = crear_motor(grafo, motor)
+    _trabajador['indice'] = IndiceKD(nodos, [grafo.nodes[n]['pos'] for n in nodos]) if nodos else None
+
+def _flujo(fuente, destino):
+    """Max-flow value, or the exception raised computing it."""
+    try:
+        return _trabajador['motor'].flujo_maximo(fuente, destino)
+    except Exception as e:
+        return e
+
+def _candidatos(origen, usados, limite):
+    """Up to ``limite`` connected unused nodes nearest to ``origen``, with their routes.
+
+    Also returns the flow to the first candidate and whether the list holds
+    every candidate (``False`` if it was cut at ``limite``).
+    """
+    motor, indice = _trabajador['motor'], _trabajador['indice']
+    arbol = motor.arbol(origen)
+    candidatos = []
+    for destino in indice.vecinos(_trabajador['grafo'].nodes[origen]['pos']):
+        if destino == origen or destino in usados:
+            continue
+        ruta = motor.ruta(arbol, destino)
+        if ruta is None:
+            continue
+        if len(candidatos) == limite:
+            return candidatos, _flujo(origen, candidatos[0][0]), False
+        candidatos.append((destino, ruta))
+    flujo = _flujo(origen, candidatos[0][0]) if candidatos else None
+    return candidatos, flujo, True
+
+class EvaluadorParalelo:
+    """Process pool that evaluates routes and flows over one transitable graph.
+
+    The graph is sent to each worker once, through the pool initializer, and
+    every worker builds its own ``motor`` engine over it. Tasks only carry
+    node ids. Results are merged in the serial order, so they are identical
+    to ``calcular_rutas_y_flujos`` without ``paralelo``.
+    """
+
+    def __init__(self, G_transitable, motor='networkx', trabajadores=None):
+        self.motor = motor
+        self.trabajadores = trabajadores or os.cpu_count() or 1
+        # Una vista no se puede enviar a otro proceso: se materializa una vez
+        grafo = nx.DiGraph(G_transitable) if nx.is_frozen(G_transitable) else G_transitable
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.trabajadores, mp_context=_contexto(),
+            initializer=_inicializar, initargs=(grafo, motor)
+        )
+        logging.info(f"Parallel evaluator started with {self.trabajadores} workers ({motor} engine)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def cerrar(self, esperar=True):
+        """Stop the workers; with ``esperar=False`` tasks already queued still finish."""
+        self._pool.shutdown(wait=esperar)
+
+    def flujos(self, fuente, destinos):
+        """``{destino: flujo}`` from ``fuente``; a failed flow maps to its exception."""
+        if not destinos:
+            return {}
+        tamano = max(1, len(destinos) // (4 * self.trabajadores))
+        return dict(zip(destinos, self._pool.map(_flujo, repeat(fuente), destinos, chunksize=tamano)))
+
+    def rutas_destacadas(self, motor, indice, G_transitable, nodos_transitables, progreso=None):
+        """Highlighted routes as chosen by the serial greedy search.
+
+        Origins are sent in batches of one per worker, each computing its
+        candidates against the nodes used before the batch. The merge walks
+        the batch in order; the rare origin that exhausts a truncated list is
+        finished serially with ``motor``.
+        """
+        rutas_destacadas = []
+        usados = set()
+        i = 0
+        while i < len(nodos_transitables) and len(rutas_destacadas) < MAX_RUTAS_DESTACADAS:
+            lote = []
+            while i < len(nodos_transitables) and len(lote) < self.trabajadores:
+                if nodos_transitables[i] not in usados:
+                    lote.append(nodos_transitables[i])
+                i += 1
+            # Cada origen anterior del lote puede gastar dos candidatos más
+            limite = 2 * len(lote) + 1
+            resultados = self._pool.map(_candidatos, lote, repeat(frozenset(usados)), repeat(limite))
+
+            for origen, (candidatos, primer_flujo, completo) in zip(lote, resultados):
+                if origen in usados:
+                    continue
+                destacada = self._elegir(origen, candidatos, primer_flujo, usados)
+                if destacada is None and not completo:
+                    destacada = ruta_destacada(motor, indice, origen, G_transitable.nodes[origen]['pos'],
+                                               motor.arbol(origen), usados)
+                if destacada is not None:
+                    rutas_destacadas.append(destacada)
+                    usados.add(origen)
+                    usados.add(destacada['fin'])
+                    if progreso is not None:
+                        progreso('rutas_destacadas', len(rutas_destacadas) / MAX_RUTAS_DESTACADAS)
+                if len(rutas_destacadas) >= MAX_RUTAS_DESTACADAS:
+                    break
+        return rutas_destacadas
+
+    def _elegir(self, origen, candidatos, primer_flujo, usados):
+        for k, (destino, ruta) in enumerate(candidatos):
+            if destino in usados:
+                continue
+            flujo = primer_flujo if k == 0 else self._pool.submit(_flujo, origen, destino).result()
+            if isinstance(flujo, Exception):
+                logging.error(f"Error calculating connected highlighted route {origen} -> {destino}: {flujo}")
+                continue
+            return {
+                'inicio': origen,
+                'fin': destino,
+                'ruta': ruta,
+                'flujo_maximo': round(flujo, 2)
+            }
+        return None
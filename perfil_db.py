@@ -0,0 +1,72 @@
+import logging
+
+from sqlalchemy import event, type_coerce, String
+
+# PRAGMA aplicados a cada conexión SQLite nueva
+PRAGMAS_SQLITE = {
+    # Los lectores no bloquean al escritor ni el escritor a los lectores
+    'journal_mode': 'WAL',
+    # Con WAL sigue siendo seguro ante caídas de la aplicación; solo un corte de energía
+    # puede perder las últimas transacciones
+    'synchronous': 'NORMAL',
+    # Espera ante un bloqueo (ms) en lugar de fallar con "database is locked"
+    'busy_timeout': 5000,
+    # 64 MiB de caché de páginas por conexión (negativo: KiB)
+    'cache_size': -65536,
+    'mmap_size': 256 * 2**20,
+    'temp_store': 'MEMORY',
+}
+
+def opciones_motor(uri):
+    """SQLAlchemy engine options for ``uri``.
+
+    A SQLite file gets a pool of reusable connections sized for the job
+    and request threads; server databases keep recycling and pre-ping.
+    """
+    if uri.startswith('sqlite') and ':memory:' not in uri and uri.rstrip('/') != 'sqlite:':
+        return {'pool_size': 8, 'max_overflow': 8, 'pool_timeout': 30}
+    if uri.startswith('sqlite'):
+        return {}
+    return {'pool_recycle': 300, 'pool_pre_ping': True}
+
+def aplicar_perfil_sqlite(engine, pragmas=None):
+    """Run ``pragmas`` (``PRAGMAS_SQLITE`` by default) on every new connection of ``engine``.
+
+    Does nothing for other databases.
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+    pragmas = PRAGMAS_SQLITE if pragmas is None else pragmas
+
+    @event.listens_for(engine, 'connect')
+    def _aplicar(conexion, _registro):
+        cursor = conexion.cursor()
+        for nombre, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nombre}={valor}")
+        cursor.close()
+
+    # Las conexiones abiertas antes del perfil se reabren con él
+    engine.dispose()
+    logging.info(f"SQLite profile applied: {', '.join(f'{k}={v}' for k, v in pragmas.items())}")
+
+def crear_indices(engine, metadata):
+    """Create the indexes declared in ``metadata`` that the database still lacks.
+
+    ``create_all`` skips tables that already exist, so indexes added to
+    existing models are only created here.
+    """
+    for tabla in metadata.sorted_tables:
+        for indice in tabla.indexes:
+            indice.create(engine, checkfirst=True)
+
+def fecha_comparable(engine, columna, fecha):
+    """``(columna, fecha)`` ready to compare a ``func.now()`` DateTime column with ``fecha``.
+
+    On SQLite ``func.now()`` stores 'AAAA-MM-DD HH:MM:SS' (as does
+    ``models.FechaHora``) while a plain DateTime parameter is bound with
+    '.ffffff' and sorts after it, so both sides are compared as text there.
+    The column stays bare, so its indexes apply.
+    """
+    if engine.dialect.name != 'sqlite':
+        return columna, fecha
+    return type_coerce(columna, String), fecha.isoformat(' ', 'seconds' if fecha.microsecond == 0 else 'microseconds')
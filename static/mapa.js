@@ -3,6 +3,9 @@ let markersLayer;
 let routesLayer;
 let connectionLayer;
 let loadingModal;
+let renderizador;
+// Índice id -> [lat, lng] de los nodos vistos en las teselas cargadas
+const coordenadasNodos = new Map();
 
 document.addEventListener('DOMContentLoaded', function() {
     initializeMap();
@@ -17,6 +20,8 @@ function formatNumber(num) {
 
 function initializeMap() {
     map = L.map('map').setView([-16.4090, -71.5375], 12);
+    // Un solo canvas para nodos y aristas: miles de trazos sin un elemento SVG por cada uno
+    renderizador = L.canvas({ padding: 0.5 });
 
     L.tileLayer('https://tile.openstreetmap.org/{z}/{x}/{y}.png', {
         attribution: '© OpenStreetMap contributors'
@@ -26,8 +31,11 @@ function initializeMap() {
     connectionLayer = L.layerGroup().addTo(map);
     routesLayer = L.layerGroup().addTo(map);
 
+    map.on('moveend', actualizarTeselas);
+
     map.whenReady(function() {
         document.getElementById('map-loading').style.display = 'none';
+        actualizarTeselas();
     });
     
     console.log('Map initialized successfully');
@@ -72,23 +80,176 @@ function verificarEstado() {
         });
 }
 
+const ETIQUETAS_ETAPA = {
+    grafo: 'Cargando la red',
+    rutas: 'Calculando rutas y flujos',
+    rutas_destacadas: 'Buscando rutas destacadas',
+    guardado: 'Guardando historial'
+};
+
+function actualizarProgreso(trabajo) {
+    const mensaje = document.getElementById('loading-mensaje');
+    if (!mensaje) {
+        return;
+    }
+    if (trabajo.estado === 'pendiente') {
+        mensaje.textContent = 'En cola...';
+    } else if (trabajo.etapa) {
+        const avance = Math.round((trabajo.etapas[trabajo.etapa] || 0) * 100);
+        mensaje.textContent = `${ETIQUETAS_ETAPA[trabajo.etapa] || trabajo.etapa}... ${avance}%`;
+    }
+}
+
+function esperarTrabajo(url, intervaloMs = 500) {
+    return new Promise((resolve, reject) => {
+        const consultar = () => {
+            fetch(url)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error(`HTTP error! status: ${response.status}`);
+                    }
+                    return response.json();
+                })
+                .then(trabajo => {
+                    actualizarProgreso(trabajo);
+                    if (trabajo.estado === 'completado') {
+                        resolve(trabajo.resultado);
+                    } else if (trabajo.estado === 'error') {
+                        reject(new Error(trabajo.error || 'Error procesando datos'));
+                    } else {
+                        setTimeout(consultar, intervaloMs);
+                    }
+                })
+                .catch(reject);
+        };
+        consultar();
+    });
+}
+
+// La red se pide por teselas (z/x/y, como el mapa base): solo las visibles más un
+// margen, y las que salen de la vista se descartan
+const TAM_TESELA = 256;
+const MARGEN_TESELAS = 1;
+const teselas = new Map();
+// Una arista entre dos teselas llega con cada una: se dibuja una vez y se cuenta
+// cuántas teselas cargadas la traen
+const aristasDibujadas = new Map();
+let versionGrafo = null;
+
+function clavesTeselasVisibles() {
+    const z = map.getZoom();
+    const limites = map.getPixelBounds();
+    const maximo = Math.pow(2, z) - 1;
+    const x0 = Math.max(0, Math.floor(limites.min.x / TAM_TESELA) - MARGEN_TESELAS);
+    const x1 = Math.min(maximo, Math.floor(limites.max.x / TAM_TESELA) + MARGEN_TESELAS);
+    const y0 = Math.max(0, Math.floor(limites.min.y / TAM_TESELA) - MARGEN_TESELAS);
+    const y1 = Math.min(maximo, Math.floor(limites.max.y / TAM_TESELA) + MARGEN_TESELAS);
+
+    const claves = [];
+    for (let x = x0; x <= x1; x++) {
+        for (let y = y0; y <= y1; y++) {
+            claves.push(`${z}/${x}/${y}`);
+        }
+    }
+    return claves;
+}
+
+function actualizarTeselas() {
+    const visibles = new Set(clavesTeselasVisibles());
+    Array.from(teselas.keys()).forEach(clave => {
+        if (!visibles.has(clave)) {
+            quitarTesela(clave);
+        }
+    });
+    visibles.forEach(clave => {
+        if (!teselas.has(clave)) {
+            cargarTesela(clave);
+        }
+    });
+}
+
+function quitarTesela(clave) {
+    const tesela = teselas.get(clave);
+    tesela.marcadores.forEach(marcador => markersLayer.removeLayer(marcador));
+    tesela.aristas.forEach(id => {
+        const dibujada = aristasDibujadas.get(id);
+        dibujada.usos -= 1;
+        if (dibujada.usos === 0) {
+            connectionLayer.removeLayer(dibujada.linea);
+            aristasDibujadas.delete(id);
+        }
+    });
+    teselas.delete(clave);
+}
+
+function recargarTeselas(version = null) {
+    versionGrafo = version;
+    coordenadasNodos.clear();
+    Array.from(teselas.keys()).forEach(quitarTesela);
+    actualizarTeselas();
+}
+
+function cargarTesela(clave) {
+    const tesela = { marcadores: [], aristas: [] };
+    teselas.set(clave, tesela);
+
+    const consulta = versionGrafo === null ? '' : `?version=${versionGrafo}`;
+    fetch(`/api/teselas/${clave}${consulta}`)
+        .then(response => {
+            if (response.status === 409) {
+                // El grafo cambió: se vuelven a pedir todas las teselas de la nueva versión
+                return response.json().then(data => {
+                    recargarTeselas(data.version_grafo);
+                    return null;
+                });
+            }
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(data => {
+            // La tesela pudo salir de la vista mientras llegaba
+            if (!data || teselas.get(clave) !== tesela) {
+                return;
+            }
+            if (versionGrafo === null) {
+                versionGrafo = data.version_grafo;
+            } else if (data.version_grafo !== versionGrafo) {
+                recargarTeselas(data.version_grafo);
+                return;
+            }
+            tesela.aristas = visualizarAristas(data.aristas);
+            tesela.marcadores = visualizarGrupos(data.grupos).concat(visualizarNodos(data.nodos));
+        })
+        .catch(error => {
+            console.error(`Error loading tile ${clave}:`, error);
+            // Se reintenta en el próximo movimiento del mapa
+            if (teselas.get(clave) === tesela) {
+                teselas.delete(clave);
+            }
+        });
+}
+
 function procesar() {
     const btnProcesar = document.getElementById('btn-procesar');
     const resultadosDiv = document.getElementById('resultados');
 
     btnProcesar.classList.add('btn-loading');
     btnProcesar.innerHTML = '<i class="fas fa-spinner fa-spin me-1"></i>Procesando...';
+    document.getElementById('loading-mensaje').textContent = 'Procesando datos del sistema...';
     loadingModal.show();
 
-    markersLayer.clearLayers();
     routesLayer.clearLayers();
     resultadosDiv.innerHTML = '<p class="text-muted small">Procesando datos...</p>';
     
-    fetch('/procesar', {
+    // El cálculo corre como trabajo en segundo plano; se consulta su avance
+    fetch('/api/jobs/procesar', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
-        }
+        },
+        body: JSON.stringify({})
     })
     .then(response => {
         if (!response.ok) {
@@ -96,6 +257,7 @@ function procesar() {
         }
         return response.json();
     })
+    .then(trabajo => esperarTrabajo(trabajo.url))
     .then(data => {
         console.log('Processing successful:', data);
         
@@ -107,9 +269,9 @@ function procesar() {
         const resultadosDiv = document.getElementById('resultados');
         resultadosDiv.innerHTML = '';
 
-        visualizarNodos(data.nodos);
-
-        visualizarAristas(data.nodos, data.aristas);
+        if (data.version_grafo !== versionGrafo) {
+            recargarTeselas(data.version_grafo);
+        }
 
         // Filtrar flujos para que el panel muestre todos los nodos relevantes de las rutas rojas activas (no solo el destino final)
         let flujosRutasRojas = {};
@@ -153,23 +315,24 @@ function procesar() {
             mostrarResultados(data.rutas_destacadas, flujosRutasRojas, data.fuente);
         }
 
-        // Pintar todas las rutas destacadas si existen
+        // Pintar todas las rutas destacadas si existen; traen sus coordenadas porque
+        // el índice solo conoce los nodos de las teselas cargadas
         if (data.rutas_destacadas && Array.isArray(data.rutas_destacadas)) {
-            const nodos = obtenerCoordenadasNodos();
             data.rutas_destacadas.forEach(rutaObj => {
-                if (rutaObj && Array.isArray(rutaObj.ruta) && rutaObj.ruta.length > 1) {
-                    const coords = rutaObj.ruta.map(nodo => nodos[nodo] ? [nodos[nodo].lat, nodos[nodo].lng] : null).filter(Boolean);
-                    if (coords.length > 1) {
-                        L.polyline(coords, {
-                            color: '#FF0000',
-                            weight: 8,
-                            opacity: 1,
-                            dashArray: null
-                        }).addTo(routesLayer).bindPopup(
-                            `<b>Ruta óptima ${rutaObj.inicio} → ${rutaObj.fin}</b><br>` +
-                            (rutaObj.flujo_maximo !== undefined ? `<b>Flujo máximo:</b> ${formatNumber(rutaObj.flujo_maximo)} unidades/h` : '')
-                        );
-                    }
+                if (!rutaObj || !Array.isArray(rutaObj.ruta)) {
+                    return;
+                }
+                const coords = rutaObj.coordenadas || coordenadasDeRuta(rutaObj.ruta);
+                if (coords.length > 1) {
+                    L.polyline(coords, {
+                        color: '#FF0000',
+                        weight: 8,
+                        opacity: 1,
+                        dashArray: null
+                    }).addTo(routesLayer).bindPopup(
+                        `<b>Ruta óptima ${rutaObj.inicio} → ${rutaObj.fin}</b><br>` +
+                        (rutaObj.flujo_maximo !== undefined ? `<b>Flujo máximo:</b> ${formatNumber(rutaObj.flujo_maximo)} unidades/h` : '')
+                    );
                 }
             });
         }
@@ -194,118 +357,140 @@ function procesar() {
     });
 }
 
-function visualizarNodos(nodos) {
-    nodos.forEach(nodo => {
-        const pos = nodo.pos || [nodo.latitud, nodo.longitud];
+function estiloNodo(nodo) {
+    switch (nodo.tipo) {
+        case 'embalse':
+            return { color: '#198754', icon: '🏛️' };
+        case 'punto_critico':
+            return { color: '#fd7e14', icon: '⚠️' };
+        default:
+            if (nodo.estado === 'obstaculo' || nodo.estado === 'bloqueado') {
+                return { color: '#dc3545', icon: '🚫' };
+            }
+            return { color: '#0dcaf0', icon: '🔵' };
+    }
+}
 
-        let color, icon, className;
-        
-        switch(nodo.tipo) {
-            case 'embalse':
-                color = '#198754';
-                icon = '🏛️';
-                className = 'marker-embalse';
-                break;
-            case 'punto_critico':
-                color = '#fd7e14'; 
-                icon = '⚠️';
-                className = 'marker-critico';
-                break;
-            default:
-                if (nodo.estado === 'obstaculo' || nodo.estado === 'bloqueado') {
-                    color = '#dc3545';
-                    icon = '🚫';
-                    className = 'marker-obstaculo';
-                } else {
-                    color = '#0dcaf0'; 
-                    icon = '🔵';
-                    className = 'marker-normal';
-                }
-        }
+function popupNodo(nodo) {
+    let popupContent = `
+        <div class="p-2">
+            <h6 class="mb-2">${estiloNodo(nodo).icon} ${nodo.id}</h6>
+            <div class="small">
+                <div><strong>Tipo:</strong> ${nodo.tipo}</div>
+                <div><strong>Estado:</strong> ${nodo.estado || 'transitable'}</div>
+    `;
+
+    if (nodo.capacidad) {
+        popupContent += `<div><strong>Capacidad:</strong> ${nodo.capacidad.toLocaleString()} m³</div>`;
+    }
 
-        const marker = L.circleMarker([pos[0], pos[1]], {
+    if (nodo.subtipo) {
+        popupContent += `<div><strong>Subtipo:</strong> ${nodo.subtipo}</div>`;
+    }
+
+    popupContent += `
+                <div><strong>Coordenadas:</strong> ${nodo.pos[0].toFixed(4)}, ${nodo.pos[1].toFixed(4)}</div>
+            </div>
+        </div>
+    `;
+    return popupContent;
+}
+
+function visualizarNodos(nodos) {
+    // El contenido del popup se arma al abrirlo, no por cada nodo dibujado
+    return nodos.map(nodo => {
+        const color = estiloNodo(nodo).color;
+        const marker = L.circleMarker(nodo.pos, {
+            renderer: renderizador,
             radius: nodo.tipo === 'embalse' ? 10 : 6,
             color: color,
             fillColor: color,
             fillOpacity: 0.8,
-            weight: 2,
-            className: className,
-            title: nodo.id,
-            nodeId: nodo.id
+            weight: 2
         });
+        coordenadasNodos.set(nodo.id, nodo.pos);
 
-        let popupContent = `
-            <div class="p-2">
-                <h6 class="mb-2">${icon} ${nodo.id}</h6>
-                <div class="small">
-                    <div><strong>Tipo:</strong> ${nodo.tipo}</div>
-                    <div><strong>Estado:</strong> ${nodo.estado || 'transitable'}</div>
-        `;
-        
-        if (nodo.capacidad) {
-            popupContent += `<div><strong>Capacidad:</strong> ${nodo.capacidad.toLocaleString()} m³</div>`;
-        }
-        
-        if (nodo.subtipo) {
-            popupContent += `<div><strong>Subtipo:</strong> ${nodo.subtipo}</div>`;
-        }
-        
-        popupContent += `
-                    <div><strong>Coordenadas:</strong> ${pos[0].toFixed(4)}, ${pos[1].toFixed(4)}</div>
-                </div>
-            </div>
-        `;
-        
-        marker.bindPopup(popupContent);
+        marker.bindPopup(() => popupNodo(nodo));
         markersLayer.addLayer(marker);
+        return marker;
     });
-    
-    console.log(`Visualized ${nodos.length} nodes on the map`);
 }
 
-function visualizarAristas(nodos, aristas) {
-    // Limpiar conexiones anteriores
-    connectionLayer.clearLayers();
-    
-    aristas.forEach(arista => {
-        const nodoOrigen = nodos.find(n => n.id === arista.origen);
-        const nodoDestino = nodos.find(n => n.id === arista.destino);
-        
-        if (nodoOrigen && nodoDestino) {
-            const posOrigen = nodoOrigen.pos || [nodoOrigen.latitud, nodoOrigen.longitud];
-            const posDestino = nodoDestino.pos || [nodoDestino.latitud, nodoDestino.longitud];
-            
-            const color = arista.estado === 'bloqueado' ? '#dc3545' : '#6c757d';
-            const weight = arista.estado === 'bloqueado' ? 3 : 2;
-            const opacity = arista.estado === 'bloqueado' ? 0.8 : 0.5;
-            
-            const polyline = L.polyline([posOrigen, posDestino], {
-                color: color,
-                weight: weight,
-                opacity: opacity,
-                dashArray: arista.estado === 'bloqueado' ? '10, 5' : null
-            });
+function visualizarGrupos(grupos) {
+    // Grupos de nodos en zoom bajo: un clic acerca el mapa a los nodos del grupo
+    return grupos.map(grupo => {
+        const tamano = Math.min(48, 24 + 4 * Math.log10(grupo.cantidad));
+        const marcador = L.marker(grupo.pos, {
+            icon: L.divIcon({
+                className: 'marker-grupo',
+                html: `<span>${formatNumber(grupo.cantidad)}</span>`,
+                iconSize: [tamano, tamano]
+            })
+        });
 
-            const popupContent = `
-                <div class="p-2">
-                    <h6 class="mb-2">🔗 Conexión</h6>
-                    <div class="small">
-                        <div><strong>Origen:</strong> ${arista.origen}</div>
-                        <div><strong>Destino:</strong> ${arista.destino}</div>
-                        <div><strong>Distancia:</strong> ${arista.distancia?.toFixed(2) || 'N/A'} km</div>
-                        <div><strong>Estado:</strong> ${arista.estado}</div>
-                        <div><strong>Capacidad:</strong> ${arista.capacidad || 'N/A'}</div>
-                    </div>
-                </div>
-            `;
-            
-            polyline.bindPopup(popupContent);
-            connectionLayer.addLayer(polyline);
+        const detalle = Object.entries(grupo.tipos)
+            .map(([tipo, cantidad]) => `${formatNumber(cantidad)} ${tipo}`)
+            .join('<br>');
+        marcador.bindTooltip(detalle);
+        marcador.on('click', () => map.fitBounds(grupo.caja, { padding: [40, 40] }));
+        markersLayer.addLayer(marcador);
+        return marcador;
+    });
+}
+
+function popupArista(arista) {
+    if (arista.cantidad) {
+        return `
+            <div class="p-2">
+                <h6 class="mb-2">🔗 ${formatNumber(arista.cantidad)} conexiones</h6>
+                <div class="small">Acerque el mapa para ver cada conexión</div>
+            </div>
+        `;
+    }
+    return `
+        <div class="p-2">
+            <h6 class="mb-2">🔗 Conexión</h6>
+            <div class="small">
+                <div><strong>Origen:</strong> ${arista.origen}</div>
+                <div><strong>Destino:</strong> ${arista.destino}</div>
+                <div><strong>Distancia:</strong> ${arista.distancia?.toFixed(2) || 'N/A'} km</div>
+                <div><strong>Estado:</strong> ${arista.estado}</div>
+                <div><strong>Capacidad:</strong> ${arista.capacidad || 'N/A'}</div>
+            </div>
+        </div>
+    `;
+}
+
+function visualizarAristas(aristas) {
+    // Cada arista trae las coordenadas de sus extremos, que pueden estar en otra tesela.
+    // En zoom bajo una arista resume las conexiones entre dos grupos ('cantidad').
+    // Devuelve los ids; las que ya estaban dibujadas por otra tesela no se repiten.
+    return aristas.map(arista => {
+        const dibujada = aristasDibujadas.get(arista.id);
+        if (dibujada) {
+            dibujada.usos += 1;
+            return arista.id;
+        }
+        const bloqueada = arista.estado === 'bloqueado';
+        const polyline = L.polyline([arista.desde, arista.hasta], {
+            renderer: renderizador,
+            color: bloqueada ? '#dc3545' : '#6c757d',
+            weight: arista.cantidad ? Math.min(6, 1 + Math.log2(arista.cantidad)) : (bloqueada ? 3 : 2),
+            opacity: bloqueada ? 0.8 : 0.5,
+            dashArray: bloqueada ? '10, 5' : null
+        });
+        if (!arista.cantidad) {
+            coordenadasNodos.set(arista.origen, arista.desde);
+            coordenadasNodos.set(arista.destino, arista.hasta);
         }
+
+        polyline.bindPopup(() => popupArista(arista));
+        connectionLayer.addLayer(polyline);
+        aristasDibujadas.set(arista.id, { linea: polyline, usos: 1 });
+        return arista.id;
     });
-    
-    console.log(`Visualized ${aristas.length} connections on the map`);
 }
+
 function mostrarResultados(rutas, flujos, fuente) {
     const resultadosDiv = document.getElementById('resultados');
     let html = `
@@ -367,20 +552,13 @@ function visualizarRutasEnMapa(rutas, flujos) {
 
     routesLayer.clearLayers();
 
-    const nodos = obtenerCoordenadasNodos();
-    
     for (const [destino, ruta] of Object.entries(rutas)) {
         if (ruta && ruta.length > 1) {
             const flujo = flujos[destino] || 0;
             // Rojo para rutas activas, gris para inactivas
             const color = flujo > 0 ? '#FF0000' : '#6c757d';
 
-            const coordenadas = [];
-            for (const nodo of ruta) {
-                if (nodos[nodo]) {
-                    coordenadas.push([nodos[nodo].lat, nodos[nodo].lng]);
-                }
-            }
+            const coordenadas = coordenadasDeRuta(ruta);
             
             if (coordenadas.length > 1) {
                 const polyline = L.polyline(coordenadas, {
@@ -402,36 +580,9 @@ function visualizarRutasEnMapa(rutas, flujos) {
     }
 }
 
-function obtenerCoordenadasNodos() {
-    const nodos = {};
-
-    markersLayer.eachLayer(function(layer) {
-        if (layer.options && layer.options.nodeId) {
-            const nombre = layer.options.nodeId;
-            nodos[nombre] = {
-                lat: layer.getLatLng().lat,
-                lng: layer.getLatLng().lng
-            };
-        } else if (layer.options && layer.options.title) {
-            const nombre = layer.options.title;
-            nodos[nombre] = {
-                lat: layer.getLatLng().lat,
-                lng: layer.getLatLng().lng
-            };
-        } else if (layer._popup && layer._popup._content) {
-            const content = layer._popup._content;
-            const match = content.match(/<h6[^>]*>([^<]+)<\/h6>/);
-            if (match) {
-                const nombre = match[1].replace(/[🏛️⚠️🔵🚫]/g, '').trim();
-                nodos[nombre] = {
-                    lat: layer.getLatLng().lat,
-                    lng: layer.getLatLng().lng
-                };
-            }
-        }
-    });
-    
-    return nodos;
+function coordenadasDeRuta(ruta) {
+    // Solo se conocen los nodos de las teselas ya cargadas
+    return ruta.map(nodo => coordenadasNodos.get(nodo)).filter(Boolean);
 }
 
 function inicializarFormularioNodo() {
@@ -490,6 +641,7 @@ function agregarNodo(nuevoNodo) {
         document.getElementById('form-agregar-nodo').reset();
         generarNuevoIdSugerido();
         verificarEstado();
+        recargarTeselas();
         
     })
     .catch(error => {
@@ -563,6 +715,7 @@ function agregarPuntoCritico(nuevoPunto) {
 
             setTimeout(() => {
                 verificarEstado();
+                recargarTeselas();
             }, 1000);
         } else {
             mostrarMensaje(`Error: ${data.error}`, 'danger');
@@ -594,6 +747,7 @@ function generarRedCompleta() {
 
             setTimeout(() => {
                 verificarEstado();
+                recargarTeselas();
             }, 1000);
         } else {
             mostrarMensaje('❌ Error: ' + data.error, 'danger');
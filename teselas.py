@@ -0,0 +1,253 @@
+import math
+
+import numpy as np
+
+# Bits por eje de los códigos Morton: resolución de ~2 m en el ecuador
+PRECISION = 24
+# Desde este zoom las teselas llevan nodos y aristas sin agrupar
+ZOOM_DETALLE = 16
+# Cada tesela se divide en 2**NIVELES_GRUPO celdas por lado (64 px con teselas de 256 px)
+NIVELES_GRUPO = 2
+# Aristas agrupadas por tesela; se conservan los pares de celdas con más aristas
+MAX_ARISTAS_AGRUPADAS = 400
+# Zoom máximo servido; por encima los códigos ya no distinguen celdas
+ZOOM_MAXIMO = PRECISION - NIVELES_GRUPO
+LAT_MAX_MERCATOR = 85.05112878
+
+def _expandir_bits(v):
+    """Spread the low 32 bits of ``v`` to the even bit positions."""
+    v = v.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    for desplazamiento, mascara in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                                    (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                                    (1, 0x5555555555555555)):
+        v = (v | (v << np.uint64(desplazamiento))) & np.uint64(mascara)
+    return v
+
+def codigos_morton(lat, lng):
+    """Z-order codes of positions on the Web Mercator tile grid at ``PRECISION`` bits.
+
+    Tile ``(z, x, y)`` is exactly the code range of prefix ``(x, y)`` at
+    ``z``, so every tile and every cluster cell is a contiguous slice of the
+    nodes sorted by code.
+    """
+    lat = np.clip(np.asarray(lat, dtype=float), -LAT_MAX_MERCATOR, LAT_MAX_MERCATOR)
+    lng = np.asarray(lng, dtype=float)
+    escala = float(2 ** PRECISION)
+    mx = (lng + 180.0) / 360.0
+    my = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    ix = np.clip(np.floor(mx * escala), 0, escala - 1).astype(np.uint64)
+    iy = np.clip(np.floor(my * escala), 0, escala - 1).astype(np.uint64)
+    return _expandir_bits(ix) | (_expandir_bits(iy) << np.uint64(1))
+
+def _valido(valor):
+    return valor is not None and not (isinstance(valor, float) and not math.isfinite(valor))
+
+def _redondear(valores, decimales=5):
+    return np.round(valores, decimales).tolist()
+
+class IndiceTeselas:
+    """Spatial index of a graph for serving map tiles.
+
+    Nodes with a valid position are sorted by Morton code, with prefix sums
+    of their coordinates and per-``tipo`` counts, so the nodes of a tile and
+    the centroid and size of any cluster cell cost two binary searches.
+    Each edge pair is stored once and indexed under both endpoints in CSR
+    form, so an edge shows up in the tiles of both of its ends and the edges
+    of a tile are also one slice (deduplicated by edge id).
+    """
+
+    def __init__(self, G):
+        ids, lat, lng = [], [], []
+        for n, d in G.nodes(data=True):
+            pos = d.get('pos')
+            if pos and all(isinstance(c, (int, float)) and _valido(c) for c in pos):
+                ids.append(n)
+                lat.append(pos[0])
+                lng.append(pos[1])
+        codigos = codigos_morton(lat, lng)
+        orden = np.argsort(codigos, kind='stable')
+        self.codigos = codigos[orden]
+        self.ids = [ids[i] for i in orden]
+        self.lat = np.asarray(lat, dtype=float)[orden]
+        self.lng = np.asarray(lng, dtype=float)[orden]
+        posicion = {n: i for i, n in enumerate(self.ids)}
+        self._suma_lat = np.concatenate(([0.0], np.cumsum(self.lat)))
+        self._suma_lng = np.concatenate(([0.0], np.cumsum(self.lng)))
+
+        self.tipos, self.estados = [], []
+        tipo, estado = [], []
+        self.capacidad, self.subtipo = {}, {}
+        for i, n in enumerate(self.ids):
+            d = G.nodes[n]
+            tipo.append(self._codigo(self.tipos, d.get('tipo')))
+            estado.append(self._codigo(self.estados, d.get('estado')))
+            if _valido(d.get('capacidad')):
+                self.capacidad[i] = d['capacidad']
+            if _valido(d.get('subtipo')):
+                self.subtipo[i] = d['subtipo']
+        self.tipo = np.asarray(tipo, dtype=np.int32)
+        self.estado = np.asarray(estado, dtype=np.int32)
+        self._conteo_tipo = np.zeros((len(self.tipos), len(self.ids) + 1), dtype=np.int64)
+        for k in range(len(self.tipos)):
+            self._conteo_tipo[k, 1:] = np.cumsum(self.tipo == k)
+
+        a, b, distancia, capacidad, estado_arista = [], [], [], [], []
+        pares = set()
+        for u, v, d in G.edges(data=True):
+            i, j = posicion.get(u), posicion.get(v)
+            # Las aristas son bidireccionales: el par se guarda una vez, con la primera fila que lo trae
+            if i is None or j is None or i == j or (min(i, j), max(i, j)) in pares:
+                continue
+            pares.add((min(i, j), max(i, j)))
+            a.append(i)
+            b.append(j)
+            distancia.append(d.get('distancia', np.nan))
+            capacidad.append(d.get('capacidad', np.nan))
+            estado_arista.append(self._codigo(self.estados, d.get('estado')))
+        self.arista_a = np.asarray(a, dtype=np.int64)
+        self.arista_b = np.asarray(b, dtype=np.int64)
+        self.distancia = np.asarray(distancia, dtype=float)
+        self.capacidad_arista = np.asarray(capacidad, dtype=float)
+        self.estado_arista = np.asarray(estado_arista, dtype=np.int32)
+        # Cada arista se indexa bajo sus dos extremos: una arista entre dos teselas sale en ambas
+        extremos = np.concatenate((self.arista_a, self.arista_b))
+        orden = np.argsort(extremos, kind='stable')
+        self._incidentes = np.tile(np.arange(len(a), dtype=np.int64), 2)[orden]
+        self._inicio = np.searchsorted(extremos[orden], np.arange(len(self.ids) + 1))
+
+    @staticmethod
+    def _codigo(tabla, valor):
+        valor = valor if _valido(valor) else None
+        if valor not in tabla:
+            tabla.append(valor)
+        return tabla.index(valor)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _rango(self, prefijos, nivel):
+        """Node slices ``[inicio, fin)`` of the cells with Morton prefixes ``prefijos`` at ``nivel``."""
+        desplazamiento = np.uint64(2 * (PRECISION - nivel))
+        prefijos = np.asarray(prefijos, dtype=np.uint64)
+        inicio = np.searchsorted(self.codigos, prefijos << desplazamiento, side='left')
+        fin = np.searchsorted(self.codigos, (prefijos + np.uint64(1)) << desplazamiento, side='left')
+        return inicio, fin
+
+    def _aristas(self, inicio, fin):
+        """Ids of the edges with at least one endpoint in the node slice ``[inicio, fin)``."""
+        return np.unique(self._incidentes[self._inicio[inicio]:self._inicio[fin]])
+
+    def _centroides(self, inicio, fin):
+        n = fin - inicio
+        return ((self._suma_lat[fin] - self._suma_lat[inicio]) / n,
+                (self._suma_lng[fin] - self._suma_lng[inicio]) / n)
+
+    def tesela(self, z, x, y):
+        """Features of tile ``(z, x, y)``: nodes and edges, or clusters below ``ZOOM_DETALLE``."""
+        prefijo = int(_expandir_bits(np.asarray([x]))[0] | (_expandir_bits(np.asarray([y]))[0] << np.uint64(1)))
+        inicio, fin = self._rango([prefijo], z)
+        inicio, fin = int(inicio[0]), int(fin[0])
+        if z >= ZOOM_DETALLE:
+            return self._detalle(inicio, fin)
+        return self._agrupada(inicio, fin, z + NIVELES_GRUPO)
+
+    def _nodo(self, i):
+        registro = {
+            'id': self.ids[i],
+            'pos': [round(float(self.lat[i]), 5), round(float(self.lng[i]), 5)],
+            'tipo': self.tipos[self.tipo[i]],
+            'estado': self.estados[self.estado[i]],
+        }
+        if i in self.capacidad:
+            registro['capacidad'] = self.capacidad[i]
+        if i in self.subtipo:
+            registro['subtipo'] = self.subtipo[i]
+        return registro
+
+    def _detalle(self, inicio, fin):
+        ids = self._aristas(inicio, fin)
+        a, b = self.arista_a[ids], self.arista_b[ids]
+        distancia = self.distancia[ids]
+        capacidad = self.capacidad_arista[ids]
+        aristas = [
+            {
+                'id': k,
+                'origen': self.ids[i],
+                'destino': self.ids[j],
+                'desde': [round(float(self.lat[i]), 5), round(float(self.lng[i]), 5)],
+                'hasta': [round(float(self.lat[j]), 5), round(float(self.lng[j]), 5)],
+                'distancia': round(float(dist), 3) if math.isfinite(dist) else None,
+                'capacidad': float(cap) if math.isfinite(cap) else None,
+                'estado': self.estados[e],
+            }
+            for k, i, j, dist, cap, e in zip(ids.tolist(), a.tolist(), b.tolist(), distancia.tolist(),
+                                             capacidad.tolist(), self.estado_arista[ids].tolist())
+        ]
+        return {
+            'agrupada': False,
+            'nodos': [self._nodo(i) for i in range(inicio, fin)],
+            'grupos': [],
+            'aristas': aristas,
+            'aristas_omitidas': 0,
+        }
+
+    def _agrupada(self, inicio, fin, nivel):
+        """Cluster the slice into cells at ``nivel``; edges are merged per pair of cells.
+
+        Only the ``MAX_ARISTAS_AGRUPADAS`` pairs carrying most edges are
+        kept, the rest are counted in ``aristas_omitidas``. A merged edge is
+        identified by its pair of cells, the same in every tile that has it.
+        """
+        desplazamiento = np.uint64(2 * (PRECISION - nivel))
+        celdas = self.codigos[inicio:fin] >> desplazamiento
+        cortes = np.flatnonzero(np.diff(celdas)) + 1
+        grupo_inicio = np.concatenate(([0], cortes)).astype(np.int64) + inicio
+        grupo_fin = np.concatenate((cortes, [fin - inicio])).astype(np.int64) + inicio
+        if fin == inicio:
+            grupo_inicio = grupo_fin = np.empty(0, dtype=np.int64)
+
+        nodos, grupos = [], []
+        lat_c, lng_c = self._centroides(grupo_inicio, grupo_fin)
+        if len(grupo_inicio):
+            lat_min = np.minimum.reduceat(self.lat[inicio:fin], grupo_inicio - inicio)
+            lat_max = np.maximum.reduceat(self.lat[inicio:fin], grupo_inicio - inicio)
+            lng_min = np.minimum.reduceat(self.lng[inicio:fin], grupo_inicio - inicio)
+            lng_max = np.maximum.reduceat(self.lng[inicio:fin], grupo_inicio - inicio)
+        for k, (g0, g1) in enumerate(zip(grupo_inicio.tolist(), grupo_fin.tolist())):
+            if g1 - g0 == 1:
+                nodos.append(self._nodo(g0))
+                continue
+            conteo = self._conteo_tipo[:, g1] - self._conteo_tipo[:, g0]
+            grupos.append({
+                'pos': [round(float(lat_c[k]), 5), round(float(lng_c[k]), 5)],
+                'cantidad': g1 - g0,
+                'tipos': {self.tipos[t]: int(c) for t, c in enumerate(conteo.tolist()) if c},
+                'caja': [[round(float(lat_min[k]), 5), round(float(lng_min[k]), 5)],
+                         [round(float(lat_max[k]), 5), round(float(lng_max[k]), 5)]],
+            })
+
+        # Aristas entre celdas distintas, una por par de celdas; las internas a una celda se omiten
+        ids = self._aristas(inicio, fin)
+        celda_a = self.codigos[self.arista_a[ids]] >> desplazamiento
+        celda_b = self.codigos[self.arista_b[ids]] >> desplazamiento
+        celda_a, celda_b = np.minimum(celda_a, celda_b), np.maximum(celda_a, celda_b)
+        distintas = celda_a != celda_b
+        aristas, omitidas = [], 0
+        if distintas.any():
+            pares, cantidad = np.unique(np.column_stack((celda_a[distintas], celda_b[distintas])),
+                                        axis=0, return_counts=True)
+            if len(pares) > MAX_ARISTAS_AGRUPADAS:
+                conservar = np.sort(np.argsort(-cantidad, kind='stable')[:MAX_ARISTAS_AGRUPADAS])
+                omitidas = len(pares) - len(conservar)
+                pares, cantidad = pares[conservar], cantidad[conservar]
+            desde = self._centroides(*self._rango(pares[:, 0], nivel))
+            hasta = self._centroides(*self._rango(pares[:, 1], nivel))
+            aristas = [
+                {'id': f'{nivel}/{ca}/{cb}', 'desde': [la, lo], 'hasta': [lb, lob], 'cantidad': c}
+                for ca, cb, la, lo, lb, lob, c in zip(pares[:, 0].tolist(), pares[:, 1].tolist(),
+                                                      _redondear(desde[0]), _redondear(desde[1]),
+                                                      _redondear(hasta[0]), _redondear(hasta[1]),
+                                                      cantidad.tolist())
+            ]
+        return {'agrupada': True, 'nodos': nodos, 'grupos': grupos, 'aristas': aristas,
+                'aristas_omitidas': omitidas}
@@ -0,0 +1,56 @@
+import os
+import shutil
+import sys
+
+import pytest
+from flask import Flask
+
+# Los módulos del proyecto están en la raíz del repositorio
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+
+from extensions import db
+
+@pytest.fixture
+def app(tmp_path):
+    """Flask app on an empty SQLite file, without the tables; ``app.py`` is not imported."""
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{tmp_path / 'prueba.db'}"
+    db.init_app(app)
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def app_db(app):
+    """``app`` with every table created."""
+    import models  # noqa: F401  registra los modelos en db.metadata
+    db.create_all()
+    return app
+
+@pytest.fixture
+def mismo_grafo():
+    """Assertion of equal nodes and edges with their attributes, ignoring insertion order.
+
+    Compared by ``repr``: rows with missing values carry NaN, which is not equal to itself.
+    """
+    def comparar(G, H):
+        assert sorted(map(repr, G.nodes(data=True))) == sorted(map(repr, H.nodes(data=True)))
+        assert sorted(map(repr, G.edges(data=True))) == sorted(map(repr, H.edges(data=True)))
+    return comparar
+
+@pytest.fixture
+def datos(tmp_path, monkeypatch):
+    """Working directory holding a copy of the bundled ``data/`` CSV files."""
+    shutil.copytree(os.path.join(RAIZ, 'data'), tmp_path / 'data',
+                    ignore=shutil.ignore_patterns('*.npz', '*.lock'))
+    monkeypatch.chdir(tmp_path)
+    return tmp_path / 'data'
+
+@pytest.fixture
+def red(datos):
+    """Graph built from the bundled data, and its first reservoir as the source."""
+    from grafo_agua import cargar_datos, construir_grafo
+    embalses, puntos, nodos, aristas = cargar_datos()
+    return construir_grafo(embalses, puntos, nodos, aristas), embalses.iloc[0]['Nombre']
@@ -0,0 +1,61 @@
+import threading
+
+import pandas as pd
+
+from almacen_datos import ArchivoCSV, COLUMNAS_NODOS
+
+def _nodo(clave, estado='transitable'):
+    return {'id_nodo': clave, 'latitud': -16.4, 'longitud': -71.5, 'tipo': 'tubo', 'estado': estado}
+
+def test_anexar_en_paralelo_no_duplica_ni_pierde_filas(tmp_path):
+    ruta = str(tmp_path / 'nodos.csv')
+    # Dos instancias sobre el mismo archivo, como dos procesos del servidor
+    archivos = [ArchivoCSV(ruta, COLUMNAS_NODOS, 'id_nodo') for _ in range(2)]
+    claves = [f'N{i:03d}' for i in range(60)]
+    aceptadas = []
+    inicio = threading.Barrier(8)
+
+    def anexar(k):
+        inicio.wait()
+        archivo = archivos[k % 2]
+        for clave in claves[k % 3:] + claves[:k % 3]:
+            if archivo.agregar(_nodo(clave)):
+                aceptadas.append(clave)
+
+    hilos = [threading.Thread(target=anexar, args=(k,)) for k in range(8)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    assert sorted(aceptadas) == claves
+    df = pd.read_csv(ruta, dtype=str)
+    assert list(df.columns) == COLUMNAS_NODOS
+    assert sorted(df['id_nodo']) == claves
+    assert all(a.existe('N059') and not a.existe('N999') for a in archivos)
+
+def test_reescritura_externa_recarga_las_claves(tmp_path):
+    ruta = str(tmp_path / 'nodos.csv')
+    archivo = ArchivoCSV(ruta, COLUMNAS_NODOS, 'id_nodo')
+    assert archivo.agregar(_nodo('A')) and archivo.agregar(_nodo('B'))
+    assert not archivo.agregar(_nodo('A'))
+
+    # Otro proceso reescribe el archivo sin 'A' y otro anexa 'C'
+    pd.DataFrame([_nodo('B')]).to_csv(ruta, index=False)
+    assert ArchivoCSV(ruta, COLUMNAS_NODOS, 'id_nodo').agregar(_nodo('C'))
+    assert not archivo.existe('A')
+    assert archivo.existe('C')
+    assert archivo.agregar(_nodo('A'))
+
+def test_compactar_deja_la_ultima_fila_de_cada_clave(tmp_path):
+    ruta = tmp_path / 'nodos.csv'
+    ruta.write_text('id_nodo,latitud,longitud,tipo,estado\n'
+                    'A,-16.4,-71.5,tubo,transitable\n'
+                    'B,-16.4,-71.5,tubo,transitable\n'
+                    'A,-16.4,-71.5,tubo,obstaculo\n')
+    archivo = ArchivoCSV(str(ruta), COLUMNAS_NODOS, 'id_nodo', umbral_compactacion=1)
+    assert archivo.agregar(_nodo('C'))
+
+    df = pd.read_csv(ruta, dtype=str)
+    assert df['id_nodo'].tolist() == ['A', 'B', 'C']
+    assert df['estado'].tolist() == ['obstaculo', 'transitable', 'transitable']
@@ -0,0 +1,102 @@
+import threading
+import time
+
+from almacen_datos import ArchivoCSV, COLUMNAS_ARISTAS, COLUMNAS_NODOS
+from cache_grafo import CacheGrafo
+from grafo_agua import ARCHIVOS_DATOS, cargar_datos, construir_grafo
+
+def _reconstruido():
+    return construir_grafo(*cargar_datos())
+
+def _con_deltas():
+    cache = CacheGrafo()
+    cache.obtener()
+    return cache, ArchivoCSV(ARCHIVOS_DATOS['nodos'], COLUMNAS_NODOS, 'id_nodo')
+
+def test_instantanea_compartida_hasta_que_cambian_los_archivos(datos):
+    cache = CacheGrafo()
+    instantanea = cache.obtener()
+    assert cache.obtener() is instantanea
+    assert cache.firma_archivos() == CacheGrafo().firma_archivos()
+
+    # Una edición hecha fuera de la aplicación cambia la versión de los datos
+    with open(ARCHIVOS_DATOS['nodos'], 'a') as f:
+        f.write('N999,-16.3,-71.4,tubo,transitable\n')
+    nueva = cache.obtener()
+    assert nueva is not instantanea
+    assert nueva.version != instantanea.version
+    assert nueva.version_grafo == instantanea.version_grafo + 1
+    assert 'N999' in nueva.grafo and nueva.conteos['nodos'] == instantanea.conteos['nodos'] + 1
+
+    cache.invalidar()
+    assert cache.ultima() is nueva
+    assert cache.obtener().version_grafo == nueva.version_grafo + 1
+    assert [c.tipo for c in cache.cambios_desde(instantanea.version_grafo)] == ['reconstruccion'] * 2
+
+def test_agregar_y_quitar_nodo_igual_que_reconstruir(datos, mismo_grafo):
+    cache, nodos = _con_deltas()
+    vecino = 'N001'
+    assert cache.obtener().grafo.degree(vecino) > 0
+
+    with cache.escritura():
+        assert nodos.quitar({'id_nodo': vecino}) == 1
+        cache.quitar_nodo(vecino)
+    instantanea = cache.obtener()
+    assert cache.cambios_desde(instantanea.version_grafo - 1)[0].tipo == 'nodo_quitado'
+    assert vecino not in instantanea.grafo
+    mismo_grafo(instantanea.grafo, _reconstruido())
+
+    nodo = {'id_nodo': vecino, 'latitud': -16.23, 'longitud': -71.21, 'tipo': 'tubo', 'estado': 'transitable'}
+    with cache.escritura():
+        assert nodos.agregar(nodo)
+        cache.agregar_nodo(nodo)
+    assert cache.obtener().version_grafo == instantanea.version_grafo + 1
+    mismo_grafo(cache.obtener().grafo, _reconstruido())
+
+def test_cambios_de_estado_igual_que_reconstruir(datos, mismo_grafo):
+    cache, nodos = _con_deltas()
+    aristas = ArchivoCSV(ARCHIVOS_DATOS['aristas'], COLUMNAS_ARISTAS, None)
+    with cache.escritura():
+        assert nodos.actualizar({'id_nodo': 'N003'}, {'estado': 'obstaculo'})
+        cache.cambiar_estado_nodo('N003', 'obstaculo')
+    with cache.escritura():
+        assert aristas.actualizar({'origen': 'N001', 'destino': 'N005'}, {'estado': 'bloqueado'})
+        cache.cambiar_estado_arista('N001', 'N005', 'bloqueado')
+    # Un nodo que vuelve a ser transitable rehace sus aristas con el estado nuevo de cada una
+    for estado in ('obstaculo', 'transitable'):
+        with cache.escritura():
+            assert nodos.actualizar({'id_nodo': 'N005'}, {'estado': estado})
+            cache.cambiar_estado_nodo('N005', estado)
+    assert not cache.obtener().grafo.has_edge('N001', 'N005')
+    mismo_grafo(cache.obtener().grafo, _reconstruido())
+
+def test_escritor_en_espera_no_queda_tras_nuevos_lectores():
+    cache = CacheGrafo()
+    orden = []
+    escritor_esperando = threading.Event()
+
+    def escribir():
+        escritor_esperando.set()
+        with cache._rw.escritura():
+            orden.append('escritor')
+
+    def leer():
+        with cache.lectura():
+            orden.append('lector nuevo')
+
+    with cache.lectura():
+        escritor = threading.Thread(target=escribir)
+        escritor.start()
+        escritor_esperando.wait()
+        while not cache._rw._escritores_esperando:
+            time.sleep(0.001)
+        lector = threading.Thread(target=leer)
+        lector.start()
+        # El lector nuevo espera al escritor; una lectura anidada del mismo hilo no
+        with cache.lectura():
+            orden.append('lectura anidada')
+        time.sleep(0.05)
+        assert orden == ['lectura anidada']
+    escritor.join(1)
+    lector.join(1)
+    assert orden == ['lectura anidada', 'escritor', 'lector nuevo']
@@ -0,0 +1,54 @@
+import json
+import os
+
+from cache_resultados import CacheResultados
+
+def _tamano(resultado):
+    return len(json.dumps(resultado, separators=(',', ':')).encode())
+
+def test_memoria_acotada_por_bytes_descarta_lo_menos_usado():
+    resultado = {'rutas': ['x' * 100]}
+    cache = CacheResultados(max_bytes=3 * _tamano(resultado))
+    claves = [CacheResultados.clave('v1', fuente=f'E{i}') for i in range(4)]
+    for clave in claves[:3]:
+        cache.guardar(clave, resultado)
+    assert cache.obtener(claves[0]) == (resultado, 'memoria')
+
+    cache.guardar(claves[3], resultado)
+    resumen = cache.resumen()
+    assert resumen['bytes'] <= resumen['max_bytes']
+    assert resumen['entradas'] == 3 and resumen['descartes'] == 1
+    # Se descarta la menos usada (claves[1]), no la primera guardada
+    assert cache.obtener(claves[1]) == (None, None)
+    assert cache.obtener(claves[0])[0] == resultado
+
+    # Un resultado que no cabe nunca desplaza a los demás
+    cache.guardar(CacheResultados.clave('v1', fuente='grande'), {'rutas': ['x' * 1000]})
+    assert cache.resumen()['entradas'] == 3
+
+def test_clave_y_purgar_por_firma(tmp_path):
+    assert CacheResultados.clave('v1', a=1, b=2) == CacheResultados.clave('v1', b=2, a=1)
+    assert CacheResultados.clave('v1', a=1) != CacheResultados.clave('v2', a=1)
+
+    directorio = str(tmp_path / 'resultados')
+    cache = CacheResultados(directorio=directorio)
+    vieja, vigente = CacheResultados.clave('v1', a=1), CacheResultados.clave('v2', a=1)
+    cache.guardar(vieja, {'n': 1})
+    cache.guardar(vigente, {'n': 2})
+    cache.purgar('v2')
+    assert cache.obtener(vieja) == (None, None)
+    assert sorted(os.listdir(directorio)) == [f'{vigente}.json']
+
+    # Otra instancia (un reinicio) lee la entrada del disco y la sube a memoria
+    reiniciada = CacheResultados(directorio=directorio)
+    assert reiniciada.obtener(vigente) == ({'n': 2}, 'disco')
+    assert reiniciada.obtener(vigente) == ({'n': 2}, 'memoria')
+
+def test_disco_acotado_por_bytes(tmp_path):
+    directorio = str(tmp_path / 'resultados')
+    resultado = {'rutas': ['x' * 100]}
+    cache = CacheResultados(directorio=directorio, max_bytes_disco=2 * _tamano(resultado))
+    for i in range(5):
+        cache.guardar(CacheResultados.clave('v1', i=i), resultado)
+    tamanos = [os.path.getsize(os.path.join(directorio, n)) for n in os.listdir(directorio)]
+    assert len(tamanos) == 2 and sum(tamanos) <= 2 * _tamano(resultado)
@@ -0,0 +1,87 @@
+import gzip
+import json
+import math
+
+import pytest
+
+import exportacion
+from cache_grafo import CacheGrafo
+from exportacion import comprimir, grafo_columnar, lineas_ndjson
+
+def _valor(valor):
+    """Attribute as it reads back from JSON: NaN becomes None and tuples lists."""
+    if isinstance(valor, float) and not math.isfinite(valor):
+        return None
+    if isinstance(valor, tuple):
+        return [_valor(v) for v in valor]
+    return valor
+
+def _leer_ndjson(trozos):
+    lineas = [json.loads(linea) for linea in ''.join(trozos).splitlines()]
+    return lineas[0], lineas[1:-1], lineas[-1]
+
+@pytest.fixture
+def cache(datos):
+    cache = CacheGrafo()
+    cache.obtener()
+    return cache
+
+def test_ndjson_reproduce_el_grafo(cache):
+    instantanea = cache.obtener()
+    G = instantanea.grafo
+    cabecera, registros, fin = _leer_ndjson(lineas_ndjson(cache, instantanea, tam_lote=100))
+
+    assert cabecera == {'grafo': {'version_grafo': instantanea.version_grafo,
+                                  'version_datos': instantanea.version, 'nodos': len(G)}}
+    assert fin == {'fin': {'nodos': len(G), 'aristas': G.number_of_edges()}}
+    nodos = {r['nodo'].pop('id'): r['nodo'] for r in registros if 'nodo' in r}
+    aristas = {(r['arista'].pop('origen'), r['arista'].pop('destino')): r['arista']
+               for r in registros if 'arista' in r}
+    assert nodos == {n: {k: _valor(v) for k, v in d.items()} for n, d in G.nodes(data=True)}
+    assert aristas == {(u, v): {k: _valor(w) for k, w in d.items()} for u, v, d in G.edges(data=True)}
+
+def test_ndjson_termina_con_error_si_el_grafo_cambia(cache):
+    instantanea = cache.obtener()
+    lineas = lineas_ndjson(cache, instantanea, tam_lote=100)
+    next(lineas)
+    next(lineas)
+    with cache.escritura():
+        cache.cambiar_estado_nodo('N001', 'mantenimiento')
+    restantes = [json.loads(linea) for trozo in lineas for linea in trozo.splitlines()]
+    assert list(restantes[-1]) == ['error']
+
+def test_columnar_reproduce_el_grafo(cache):
+    instantanea = cache.obtener()
+    G = instantanea.grafo
+    datos = json.loads(json.dumps(grafo_columnar(cache, instantanea)))
+    nodos, aristas = datos['nodos'], datos['aristas']
+
+    assert nodos['id'] == list(G)
+    for i, (n, d) in enumerate(G.nodes(data=True)):
+        assert [nodos['lat'][i], nodos['lng'][i]] == pytest.approx(_valor(d['pos']), abs=1e-5)
+        assert datos['tipos'][nodos['tipo'][i]] == _valor(d['tipo'])
+        assert datos['estados'][nodos['estado'][i]] == _valor(d['estado'])
+        assert nodos['subtipo'].get(str(i)) == _valor(d.get('subtipo'))
+
+    leidas = {}
+    for i, origen in enumerate(nodos['id']):
+        for k in range(aristas['inicio'][i], aristas['inicio'][i + 1]):
+            leidas[origen, nodos['id'][aristas['destino'][k]]] = (
+                aristas['distancia'][k], aristas['capacidad'][k], datos['estados'][aristas['estado'][k]])
+    assert set(leidas) == set(G.edges())
+    for (u, v), (distancia, capacidad, estado) in leidas.items():
+        d = G.edges[u, v]
+        assert distancia == pytest.approx(d['distancia'], abs=5e-4)
+        assert capacidad == pytest.approx(d['capacidad'])
+        assert estado == d['estado']
+
+def test_comprimir_negocia_la_codificacion(monkeypatch):
+    datos = b'{"nodos": []}' * 100
+    comprimido, codificacion = comprimir(datos, 'gzip, deflate')
+    assert codificacion == 'gzip' and gzip.decompress(comprimido) == datos
+    assert comprimir(datos, 'identity') == (datos, None)
+    if exportacion.brotli is not None:
+        comprimido, codificacion = comprimir(datos, 'gzip, br')
+        assert codificacion == 'br' and exportacion.brotli.decompress(comprimido) == datos
+    monkeypatch.setattr(exportacion, 'brotli', None)
+    assert comprimir(datos, 'br, gzip')[1] == 'gzip'
@@ -0,0 +1,51 @@
+import os
+import threading
+
+import pandas as pd
+
+import formato_columnar
+from formato_columnar import aplicar_esquema, cargar_tabla, guardar_columnar, leer_columnar, ruta_columnar
+
+def _escribir(ruta, estados):
+    pd.DataFrame({'id_nodo': ['N1', 'N2'], 'latitud': [-16.4, -16.41], 'longitud': [-71.5, -71.51],
+                  'tipo': ['tubo', 'bomba'], 'estado': estados}).to_csv(ruta, index=False)
+
+def test_columnar_conserva_tipos_y_valores(tmp_path):
+    ruta = str(tmp_path / 'nodos.csv')
+    _escribir(ruta, ['transitable', 'obstaculo'])
+    esperado = aplicar_esquema(pd.read_csv(ruta), 'nodos')
+
+    cargado = cargar_tabla('nodos', ruta)
+    assert os.path.exists(ruta_columnar(ruta))
+    pd.testing.assert_frame_equal(cargado, esperado)
+    pd.testing.assert_frame_equal(cargar_tabla('nodos', ruta), esperado)
+
+def test_reescritura_del_mismo_tamano_y_mtime_no_sirve_el_npz_viejo(tmp_path, monkeypatch):
+    ruta = str(tmp_path / 'nodos.csv')
+    _escribir(ruta, ['transitable', 'obstaculo'])
+    assert list(cargar_tabla('nodos', ruta)['estado']) == ['transitable', 'obstaculo']
+    st = os.stat(ruta)
+
+    # Mismo tamaño y mismo mtime, como una reescritura dentro de la resolución del reloj
+    _escribir(ruta, ['obstaculo', 'transitable'])
+    os.utime(ruta, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(ruta).st_size == st.st_size
+    assert list(cargar_tabla('nodos', ruta)['estado']) == ['obstaculo', 'transitable']
+
+    # Fuera del margen basta la firma, sin volver a leer el CSV
+    monkeypatch.setattr(formato_columnar, 'MARGEN_MTIME_NS', -10**18)
+    monkeypatch.setattr(formato_columnar, '_huella', lambda contenido: 'otra')
+    assert formato_columnar.es_fresco(ruta)
+
+def test_escrituras_concurrentes_no_mezclan_archivos(tmp_path):
+    ruta = str(tmp_path / 'nodos.npz')
+    tablas = [pd.DataFrame({'id_nodo': [f'N{i}'] * 2000, 'latitud': [float(i)] * 2000}) for i in range(8)]
+    hilos = [threading.Thread(target=guardar_columnar, args=(df, ruta)) for df in tablas]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+
+    leido = leer_columnar(ruta)
+    assert any(leido.equals(df) for df in tablas)
+    assert os.listdir(tmp_path) == ['nodos.npz']
@@ -0,0 +1,62 @@
+import math
+
+import networkx as nx
+import pandas as pd
+import pytest
+
+from distancias import distancia_km
+from grafo_agua import (arbol_caminos_minimos, construir_grafo, flujo_multidestino, reconstruir_ruta,
+                        vista_transitable)
+
+def test_arbol_igual_que_dijkstra_por_destino(red):
+    G, fuente = red
+    T = vista_transitable(G)
+    distancias, predecesores = arbol_caminos_minimos(T, fuente)
+
+    assert len(distancias) > 1
+    assert distancias == pytest.approx(nx.single_source_dijkstra_path_length(T, fuente))
+    for destino in distancias:
+        assert reconstruir_ruta(predecesores, destino) == nx.dijkstra_path(T, fuente, destino)
+    inalcanzable = next(n for n in T if n not in distancias)
+    assert reconstruir_ruta(predecesores, inalcanzable) is None
+
+def test_flujo_multidestino_reparte_la_capacidad_compartida():
+    G = nx.DiGraph()
+    G.add_edge('F', 'A', capacidad=5)
+    G.add_edge('F', 'B', capacidad=3)
+    G.add_edge('A', 'B', capacidad=10)
+
+    # A toma 4 de los 5 de F->A; B recibe los 3 de F->B y el 1 que sobra por A
+    assert flujo_multidestino(G, 'F', ['A', 'B'], demandas={'A': 4, 'B': 6}) == (8, {'A': 4, 'B': 4})
+    # Con la demanda por defecto (1000) gana la capacidad de la red
+    total, flujos = flujo_multidestino(G, 'F', ['A', 'B'])
+    assert total == 8 and sum(flujos.values()) == 8
+    assert flujo_multidestino(G, 'X', ['A']) == (0, {'A': 0})
+
+def test_construir_grafo_aplica_las_reglas_de_aristas():
+    embalses = pd.DataFrame({'Nombre': ['E'], 'Latitud': [-16.40], 'Longitud': [-71.53],
+                             'Volumen_Almacenado_m3': [5000]})
+    puntos = pd.DataFrame({'Nombre': ['P'], 'Latitud': [-16.41], 'Longitud': [-71.54], 'Tipo': ['hospital']})
+    nodos = pd.DataFrame({'id_nodo': ['A', 'B', 'O'], 'latitud': [-16.40, -16.41, -16.42],
+                          'longitud': [-71.52, -71.52, -71.52], 'tipo': ['tubo'] * 3,
+                          'estado': ['transitable', 'transitable', 'obstaculo']})
+    aristas = pd.DataFrame({
+        'origen': ['E', 'A', 'B', 'A', 'E', 'X'],
+        'destino': ['A', 'B', 'A', 'O', 'B', 'A'],
+        'distancia': [0.5, math.nan, 2.0, 1.0, 1.0, 1.0],
+        'estado': ['transitable', 'transitable', 'transitable', 'transitable', 'bloqueado', 'transitable'],
+        'capacidad': [100.0, 200.0, 300.0, 400.0, 500.0, 600.0],
+    })
+    G = construir_grafo(embalses, puntos, nodos, aristas)
+
+    assert G.nodes['E'] == {'pos': (-16.40, -71.53), 'tipo': 'embalse', 'capacidad': 5000,
+                            'estado': 'transitable'}
+    assert G.nodes['P']['estado'] == 'obstaculo' and G.nodes['P']['subtipo'] == 'hospital'
+    # Ni extremos obstáculo o inexistentes ni aristas bloqueadas
+    assert set(G.edges()) == {('E', 'A'), ('A', 'E'), ('A', 'B'), ('B', 'A')}
+    # Cada fila se agrega en ambos sentidos; una fila directa posterior reemplaza a la inversa
+    assert G.edges['A', 'E']['distancia'] == 0.5
+    assert G.edges['B', 'A']['distancia'] == 2.0 and G.edges['B', 'A']['capacidad'] == 300.0
+    # Sin distancia en el CSV se usa la haversine entre los extremos
+    assert G.edges['A', 'B']['distancia'] == pytest.approx(distancia_km((-16.40, -71.52), (-16.41, -71.52)))
+    assert G.edges['A', 'B']['weight'] == G.edges['A', 'B']['distancia']
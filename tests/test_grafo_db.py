@@ -0,0 +1,50 @@
+from sqlalchemy import insert, update
+
+from benchmark_construir_grafo import generar_datos_sinteticos
+from extensions import db
+from grafo_agua import construir_grafo
+from grafo_db import CargadorGrafoDB
+from importacion import completar_distancias, importar_tablas
+from models import Arista, Nodo
+
+def _red_importada():
+    embalses, puntos, nodos, aristas = generar_datos_sinteticos(600)
+    # La tabla no distingue filas repetidas de un mismo par: se dejan solo las primeras
+    aristas = aristas.drop_duplicates(['origen', 'destino'])
+    aristas = completar_distancias(aristas, ('embalses', embalses), ('puntos_criticos', puntos), ('nodos', nodos))
+    importar_tablas({'embalses': embalses, 'puntos_criticos': puntos, 'nodos': nodos, 'aristas': aristas})
+    return embalses, puntos, nodos, aristas
+
+def test_construir_desde_la_base_igual_que_desde_tablas(app_db, mismo_grafo):
+    tablas = _red_importada()
+    mismo_grafo(CargadorGrafoDB(app_db).construir(), construir_grafo(*tablas))
+
+def test_refrescar_igual_que_reconstruir(app_db, mismo_grafo):
+    _red_importada()
+    cargador = CargadorGrafoDB(app_db)
+    G = cargador.construir()
+    assert not cargador.leer_cambios()
+
+    transitables = [n for n, in db.session.execute(
+        db.select(Nodo.id_nodo).where(Nodo.estado == 'transitable').order_by(Nodo.id).limit(3))]
+    origen, destino = db.session.execute(
+        db.select(Arista.origen, Arista.destino).where(Arista.estado == 'transitable').order_by(Arista.id)).first()
+    ahora = db.func.now()
+    db.session.execute(update(Nodo).where(Nodo.id_nodo == transitables[0])
+                       .values(estado='obstaculo', fecha_actualizacion=ahora))
+    db.session.execute(update(Arista).where(Arista.origen == origen, Arista.destino == destino)
+                       .values(estado='bloqueado', fecha_actualizacion=ahora))
+    db.session.execute(insert(Nodo).values(id_nodo='NUEVO', latitud=-16.4, longitud=-71.5,
+                                           tipo='tubo', estado='transitable'))
+    db.session.execute(insert(Arista).values(origen='NUEVO', destino=transitables[1], distancia=0.0,
+                                             estado='transitable'))
+    db.session.execute(insert(Arista).values(origen=transitables[2], destino='NUEVO', distancia=1.5,
+                                             estado='transitable'))
+    db.session.commit()
+
+    elementos = cargador.aplicar(cargador.leer_cambios())
+    assert 'NUEVO' in elementos
+    assert {(origen, destino), (destino, origen)} & set(elementos)
+    assert cargador.grafo is G
+    mismo_grafo(G, CargadorGrafoDB(app_db).construir())
+    assert not cargador.leer_cambios()
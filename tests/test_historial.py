@@ -0,0 +1,111 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from historial import (ContadoresHistorial, EscritorHistorial, contadores, decodificar_cursor, destinos_inalcanzables,
+                       filas_historial, guardar_procesamiento, pagina_procesamientos, pagina_rutas)
+from models import HistorialRuta, Procesamiento
+
+def _procesamiento(fuente='E1'):
+    return {'fuente_principal': fuente, 'total_rutas_calculadas': 1, 'total_flujo_maximo': 10.0,
+            'tiempo_procesamiento_ms': 5, 'estado': 'exitoso'}
+
+def _ruta(destino):
+    return {'origen': 'E1', 'destino': destino, 'ruta_json': f'["E1", "{destino}"]', 'flujo_maximo': 1.0}
+
+def test_contadores_reintentan_tras_un_primer_conteo_fallido(app):
+    contadores = ContadoresHistorial()
+    contadores.contar()
+    assert contadores.error is not None
+    assert contadores.resumen() == {'procesamientos': None, 'historial_rutas': None}
+
+    # Sin conteo previo, sumar no inventa totales
+    contadores.sumar(1, 3)
+    assert contadores.resumen()['procesamientos'] is None
+
+    db.create_all()
+    guardar_procesamiento(_procesamiento(), [_ruta('N1')])
+    assert contadores.listos()
+    assert contadores.error is None
+    assert contadores.resumen() == {'procesamientos': 1, 'historial_rutas': 1}
+
+    contadores.sumar(1, 2)
+    assert contadores.resumen() == {'procesamientos': 2, 'historial_rutas': 3}
+
+def _recorrer(pagina):
+    """Every item reached by following ``siguiente`` from the first page, and the pages read."""
+    elementos, cursor, paginas = [], None, 0
+    while True:
+        filas, cursor = pagina(cursor)
+        elementos += filas
+        paginas += 1
+        if cursor is None:
+            return elementos, paginas
+
+def test_paginas_por_cursor_recorren_todo_el_historial_una_vez(app_db):
+    # Fechas explícitas y fechas de func.now() dentro del mismo segundo: empates que desempata el id
+    fechas = [datetime(2026, 1, 1, 8, 0, 0)] * 4 + [datetime(2026, 1, 2, 9, 30)] * 3 + [None] * 4
+    for i, fecha in enumerate(fechas):
+        procesamiento = _procesamiento('E1' if i % 3 else 'E2')
+        if fecha is not None:
+            procesamiento['fecha_procesamiento'] = fecha
+        guardar_procesamiento(procesamiento, [_ruta(f'N{j}') for j in range(7)])
+
+    recientes_primero = (Procesamiento.fecha_procesamiento.desc(), Procesamiento.id.desc())
+    for filtros, condicion in (({}, True), ({'fuente': 'E1'}, Procesamiento.fuente_principal == 'E1')):
+        esperado = db.session.scalars(select(Procesamiento.id).where(condicion).order_by(*recientes_primero)).all()
+        procesamientos, paginas = _recorrer(lambda cursor: pagina_procesamientos(
+            3, decodificar_cursor(cursor) if cursor else None, **filtros))
+        assert [p['id'] for p in procesamientos] == esperado
+        assert paginas == -(-len(esperado) // 3)
+
+    rutas, paginas = _recorrer(lambda despues: pagina_rutas(esperado[0], 3, despues))
+    assert [r['destino'] for r in rutas] == [f'N{j}' for j in range(7)]
+    assert paginas == 3
+
+def test_destinos_inalcanzables_fuera_del_listado_y_del_conteo(app_db):
+    contadores.contar()
+    filas = filas_historial('E1', {'N1': ['E1', 'N1'], 'N2': None, 'N3': None}, {'N1': 5.0}, {'N1': 1.2})
+    id_procesamiento = guardar_procesamiento(_procesamiento(), filas)
+
+    rutas, _ = pagina_rutas(id_procesamiento, 10)
+    assert [r['destino'] for r in rutas] == ['N1']
+    assert contadores.resumen() == {'procesamientos': 1, 'historial_rutas': 1}
+    contadores.contar()
+    assert contadores.resumen() == {'procesamientos': 1, 'historial_rutas': 1}
+    assert [d['destino'] for d in destinos_inalcanzables(10)] == ['N2', 'N3']
+
+def test_contadores_se_leen_sin_consultar_la_base(app_db):
+    contadores = ContadoresHistorial()
+    contadores.contar()
+    contadores.sumar(2, 5)
+    # Sin tablas, una consulta fallaría: los contadores ya no la hacen
+    db.drop_all()
+    assert contadores.listos()
+    assert contadores.resumen() == {'procesamientos': 2, 'historial_rutas': 5}
+
+def test_procesamiento_y_rutas_en_una_sola_transaccion(app_db):
+    contadores.contar()
+    # La segunda fila no tiene destino (NOT NULL): falla la inserción de las rutas
+    with pytest.raises(IntegrityError):
+        guardar_procesamiento(_procesamiento(), [_ruta('N1'), dict(_ruta('N2'), destino=None)])
+    assert db.session.scalar(select(func.count()).select_from(Procesamiento)) == 0
+    assert db.session.scalar(select(func.count()).select_from(HistorialRuta)) == 0
+    assert contadores.resumen() == {'procesamientos': 0, 'historial_rutas': 0}
+
+    id_procesamiento = guardar_procesamiento(_procesamiento(), [_ruta('N1'), _ruta('N2')])
+    assert db.session.scalars(select(HistorialRuta.procesamiento_id)).all() == [id_procesamiento] * 2
+    assert contadores.resumen() == {'procesamientos': 1, 'historial_rutas': 2}
+
+def test_escritor_diferido_guarda_en_orden(app_db):
+    escritor = EscritorHistorial(app_db)
+    for fuente in ('E1', 'E2', 'E3'):
+        escritor.encolar(_procesamiento(fuente), [_ruta('N1')])
+    escritor.vaciar()
+    assert escritor.pendientes() == 0
+    assert escritor.estadisticas == {'guardados': 3, 'errores': 0}
+    fuentes = db.session.scalars(select(Procesamiento.fuente_principal).order_by(Procesamiento.id)).all()
+    assert fuentes == ['E1', 'E2', 'E3']
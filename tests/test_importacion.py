@@ -0,0 +1,49 @@
+import pandas as pd
+from sqlalchemy import func, select
+
+import importacion
+from extensions import db
+from models import Arista, Nodo
+from importacion import importar_tablas
+
+def _tablas():
+    nodos = pd.DataFrame({
+        'id_nodo': ['N1', 'N2', 'N3'],
+        'latitud': [-12.0, -12.01, -12.02],
+        'longitud': [-77.0, -77.01, -77.02],
+        'tipo': ['cuadra', 'tubo', 'bomba'],
+        'estado': ['activo', 'activo', 'activo'],
+    })
+    aristas = pd.DataFrame({
+        'origen': ['N1', 'N2', 'N1'],
+        'destino': ['N2', 'N3', 'N2'],
+        'distancia': [1.0, 2.0, 1.0],
+        'estado': ['transitable', 'transitable', 'transitable'],
+        'capacidad': [10.0, 20.0, 10.0],
+    })
+    return {'nodos': nodos, 'aristas': aristas}
+
+def _cuenta(modelo):
+    return db.session.execute(select(func.count()).select_from(modelo)).scalar()
+
+def test_importar_dos_veces_no_duplica(app_db):
+    primero = importar_tablas(_tablas())
+    assert primero['nodos']['insertadas'] == 3
+    assert primero['aristas'] == {'leidas': 3, 'insertadas': 2, 'omitidas': 1, 'invalidas': 0}
+
+    segundo = importar_tablas(_tablas())
+    assert segundo['nodos']['insertadas'] == 0
+    assert segundo['aristas']['insertadas'] == 0
+    assert _cuenta(Nodo) == 3
+    assert _cuenta(Arista) == 2
+
+def test_importar_omite_filas_agregadas_en_paralelo(app_db, monkeypatch):
+    importar_tablas(_tablas())
+    # Como si otro proceso hubiera insertado las filas tras leer las claves existentes
+    monkeypatch.setattr(importacion, '_claves_existentes', lambda tabla, claves: set())
+
+    informe = importar_tablas(_tablas())
+    assert informe['nodos']['insertadas'] == 0
+    assert informe['aristas']['insertadas'] == 0
+    assert _cuenta(Nodo) == 3
+    assert _cuenta(Arista) == 2
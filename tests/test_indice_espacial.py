@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from distancias import RADIO_TIERRA_KM, distancia_km, distancias_uno_a_muchos, haversine_km, matriz_distancias
+from indice_espacial import IndiceGrilla, IndiceKD
+
+@pytest.fixture
+def puntos():
+    """Random positions inside the Arequipa box used by the bundled data."""
+    generador = np.random.default_rng(7)
+    return np.column_stack((generador.uniform(-16.45, -16.23, 2000), generador.uniform(-71.60, -71.21, 2000)))
+
+def test_haversine_valores_conocidos():
+    # Un grado de meridiano y un cuarto de ecuador
+    assert distancia_km((0, 0), (1, 0)) == pytest.approx(RADIO_TIERRA_KM * np.pi / 180)
+    assert distancia_km((0, 0), (0, 90)) == pytest.approx(RADIO_TIERRA_KM * np.pi / 2)
+    assert distancia_km((-16.4, -71.5), (-16.4, -71.5)) == 0
+    # Arequipa - Lima, unos 765 km
+    assert distancia_km((-16.3989, -71.5350), (-12.0464, -77.0428)) == pytest.approx(765, abs=5)
+
+def test_formas_vectorizadas_coinciden(puntos):
+    a, b = puntos[:30], puntos[30:70]
+    matriz = matriz_distancias(a, b)
+    assert matriz.shape == (30, 40)
+    assert matriz[3] == pytest.approx(distancias_uno_a_muchos(a[3], b))
+    assert matriz[3, 5] == pytest.approx(distancia_km(a[3], b[5]))
+    assert haversine_km(b[:, 0], b[:, 1], a[3, 0], a[3, 1]) == pytest.approx(matriz[3])
+
+def test_kd_entrega_vecinos_en_orden_de_distancia(puntos):
+    indice = IndiceKD(range(len(puntos)), puntos)
+    pos = (-16.35, -71.40)
+    vecinos = list(indice.vecinos(pos, lote=8))
+
+    assert sorted(vecinos) == list(range(len(puntos)))
+    dist = distancias_uno_a_muchos(pos, puntos[vecinos])
+    # El orden en el plano proyectado sigue al de la haversine salvo empates dentro del margen
+    assert np.all(np.diff(dist) >= -dist[1:] * 1e-3)
+    assert vecinos[:20] == np.argsort(distancias_uno_a_muchos(pos, puntos), kind='stable')[:20].tolist()
+
+@pytest.mark.parametrize('radio_km', [0.3, 1.0, 4.0])
+def test_grilla_radio_igual_que_fuerza_bruta(puntos, radio_km):
+    indice = IndiceGrilla(puntos, tam_celda_km=0.5)
+    for pos in puntos[:50]:
+        indices, dist = indice.dentro_de_radio(pos, radio_km)
+        todas = distancias_uno_a_muchos(pos, puntos)
+        assert sorted(indices.tolist()) == np.flatnonzero(todas < radio_km).tolist()
+        assert dist == pytest.approx(todas[indices])
+        assert indice.hay_dentro_de_radio(pos, radio_km) == bool(len(indices))
+
+@pytest.mark.parametrize('k, radio_km', [(1, 5.0), (5, 1.0), (20, 50.0)])
+def test_grilla_mas_cercanos_igual_que_fuerza_bruta(puntos, k, radio_km):
+    indice = IndiceGrilla(puntos, tam_celda_km=0.5)
+    for i, pos in enumerate(puntos[:50]):
+        indices, dist = indice.mas_cercanos(pos, k, radio_km, excluir=(i,))
+        todas = distancias_uno_a_muchos(pos, puntos)
+        todas[i] = np.inf
+        candidatos = np.flatnonzero(todas < radio_km)
+        esperados = candidatos[np.lexsort((candidatos, todas[candidatos]))][:k]
+        assert indices.tolist() == esperados.tolist()
+        assert dist == pytest.approx(todas[esperados])
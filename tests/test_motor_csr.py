@@ -0,0 +1,16 @@
+import pytest
+
+from grafo_agua import calcular_rutas_y_flujos
+
+@pytest.mark.parametrize('modo_flujo', ['por_destino', 'super_sumidero'])
+def test_csr_igual_que_networkx(red, modo_flujo):
+    G, fuente = red
+    rutas, flujos, destacadas, distancias = calcular_rutas_y_flujos(G, fuente, modo_flujo, max_destinos=None)
+    rutas_csr, flujos_csr, destacadas_csr, distancias_csr = calcular_rutas_y_flujos(
+        G, fuente, modo_flujo, max_destinos=None, motor='csr')
+
+    assert rutas and any(flujos.values())
+    assert rutas_csr == rutas
+    assert destacadas_csr == destacadas
+    assert distancias_csr == pytest.approx(distancias)
+    assert flujos_csr == pytest.approx(flujos)
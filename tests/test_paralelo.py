@@ -0,0 +1,15 @@
+import pytest
+
+from grafo_agua import calcular_rutas_y_flujos, vista_transitable
+from paralelo import EvaluadorParalelo
+
+@pytest.mark.parametrize('motor', ['networkx', 'csr'])
+def test_paralelo_igual_que_serie(red, motor):
+    G, fuente = red
+    T = vista_transitable(G)
+    serie = calcular_rutas_y_flujos(G, fuente, G_transitable=T, motor=motor)
+    with EvaluadorParalelo(T, motor, trabajadores=2) as paralelo:
+        en_paralelo = calcular_rutas_y_flujos(G, fuente, G_transitable=T, motor=motor, paralelo=paralelo)
+
+    assert serie[2]
+    assert en_paralelo == serie
@@ -0,0 +1,42 @@
+from datetime import datetime
+
+from sqlalchemy import inspect, select, text
+
+from extensions import db
+from models import Procesamiento
+from perfil_db import PRAGMAS_SQLITE, aplicar_perfil_sqlite, crear_indices, fecha_comparable, opciones_motor
+
+def test_perfil_en_cada_conexion(app_db):
+    aplicar_perfil_sqlite(db.engine)
+    with db.engine.connect() as conexion:
+        assert conexion.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert conexion.execute(text('PRAGMA busy_timeout')).scalar() == PRAGMAS_SQLITE['busy_timeout']
+        assert conexion.execute(text('PRAGMA synchronous')).scalar() == 1  # NORMAL
+
+def test_opciones_motor_segun_la_base():
+    assert opciones_motor('sqlite:///sumaq_yaku.db')['pool_size'] == 8
+    assert opciones_motor('sqlite://') == {} and opciones_motor('sqlite:///:memory:') == {}
+    assert opciones_motor('postgresql://localhost/sumaq')['pool_pre_ping']
+
+def test_crear_indices_en_una_base_existente(app_db):
+    indice = 'ix_procesamientos_fuente_fecha_id'
+    db.session.execute(text(f'DROP INDEX {indice}'))
+    db.session.commit()
+    # create_all no agrega índices a tablas que ya existen
+    db.create_all()
+    assert indice not in {i['name'] for i in inspect(db.engine).get_indexes('procesamientos')}
+
+    crear_indices(db.engine, db.metadata)
+    assert indice in {i['name'] for i in inspect(db.engine).get_indexes('procesamientos')}
+    crear_indices(db.engine, db.metadata)
+
+def test_fecha_comparable_con_fechas_de_func_now(app_db):
+    db.session.execute(Procesamiento.__table__.insert().values(
+        fuente_principal='E1', total_rutas_calculadas=0, total_flujo_maximo=0))
+    db.session.commit()
+    guardada = db.session.scalar(select(Procesamiento.fecha_procesamiento))
+
+    # Con microsegundos el parámetro cae después de la fecha guardada en el mismo segundo
+    for fecha, esperado in ((guardada, 1), (guardada.replace(microsecond=1), 0), (datetime(2000, 1, 1), 1)):
+        columna, valor = fecha_comparable(db.engine, Procesamiento.fecha_procesamiento, fecha)
+        assert len(db.session.scalars(select(Procesamiento.id).where(columna >= valor)).all()) == esperado
@@ -0,0 +1,74 @@
+import math
+
+import networkx as nx
+
+from teselas import ZOOM_DETALLE, IndiceTeselas
+
+def _tesela_de(pos, z):
+    lat, lng = pos
+    n = 2 ** z
+    x = int((lng + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2.0 * n)
+    return x, y
+
+def _grafo():
+    G = nx.DiGraph()
+    G.add_node('A', pos=(-13.520, -71.970), tipo='reservorio', estado='activo')
+    G.add_node('B', pos=(-13.530, -71.950), tipo='vivienda', estado='activo')
+    G.add_node('C', pos=(-13.5201, -71.9701), tipo='vivienda', estado='activo')
+    for u, v in (('A', 'B'), ('B', 'A'), ('A', 'C')):
+        G.add_edge(u, v, distancia=1.0, capacidad=10.0, estado='activo')
+    return G
+
+def test_arista_en_las_teselas_de_ambos_extremos():
+    G = _grafo()
+    indice = IndiceTeselas(G)
+    z = ZOOM_DETALLE
+    tesela_a, tesela_b = _tesela_de(G.nodes['A']['pos'], z), _tesela_de(G.nodes['B']['pos'], z)
+    assert tesela_a != tesela_b
+
+    en_a = indice.tesela(z, *tesela_a)['aristas']
+    en_b = indice.tesela(z, *tesela_b)['aristas']
+    par = {'A', 'B'}
+    arista_a = [a for a in en_a if {a['origen'], a['destino']} == par]
+    arista_b = [a for a in en_b if {a['origen'], a['destino']} == par]
+    assert len(arista_a) == len(arista_b) == 1
+    assert arista_a[0] == arista_b[0]
+    # La arista interna a la tesela de A sale una sola vez
+    assert len(en_a) == 2
+    assert len({a['id'] for a in en_a}) == 2
+
+def test_aristas_agrupadas_con_el_mismo_id_en_ambas_teselas():
+    G = _grafo()
+    indice = IndiceTeselas(G)
+    z = ZOOM_DETALLE - 2
+    tesela_a, tesela_b = _tesela_de(G.nodes['A']['pos'], z), _tesela_de(G.nodes['B']['pos'], z)
+    assert tesela_a != tesela_b
+
+    en_a = indice.tesela(z, *tesela_a)
+    en_b = indice.tesela(z, *tesela_b)
+    assert en_a['agrupada'] and en_b['agrupada']
+    assert en_a['aristas'] == en_b['aristas']
+    assert len(en_a['aristas']) == 1
+
+def test_cada_arista_de_la_red_en_las_teselas_de_sus_extremos(red):
+    G, _ = red
+    indice = IndiceTeselas(G)
+    z = ZOOM_DETALLE
+    posiciones = dict(zip(indice.ids, zip(indice.lat.tolist(), indice.lng.tolist())))
+    teselas = {}
+    for n, pos in posiciones.items():
+        teselas.setdefault(_tesela_de(pos, z), None)
+    for clave in teselas:
+        teselas[clave] = {(a['origen'], a['destino']) for a in indice.tesela(z, *clave)['aristas']}
+
+    pares = {frozenset((u, v)) for u, v in G.edges() if u in posiciones and v in posiciones and u != v}
+    vistos = set()
+    for clave, aristas in teselas.items():
+        vistos.update(frozenset(par) for par in aristas)
+        for u, v in aristas:
+            assert clave in (_tesela_de(posiciones[u], z), _tesela_de(posiciones[v], z))
+    assert vistos == pares
+    for par in pares:
+        for extremo in par:
+            assert any(frozenset(a) == par for a in teselas[_tesela_de(posiciones[extremo], z)])
@@ -0,0 +1,67 @@
+import threading
+import time
+
+from trabajos import GestorTrabajos
+
+def _esperar(trabajo, segundos=5):
+    limite = time.monotonic() + segundos
+    while trabajo.activo:
+        assert time.monotonic() < limite, f"El trabajo {trabajo.id} sigue {trabajo.estado}"
+        time.sleep(0.01)
+
+def test_trabajo_completado_con_etapas_y_resultado():
+    gestor = GestorTrabajos(max_trabajadores=1)
+
+    def funcion(trabajo):
+        trabajo.avanzar('grafo', 0.5)
+        trabajo.avanzar('rutas', 0.25)
+        return {'total': 3}, 200
+
+    trabajo, nuevo = gestor.enviar('procesar', 'clave', {'fuente': 'E'}, funcion)
+    assert nuevo
+    _esperar(trabajo)
+    datos = gestor.obtener(trabajo.id).to_dict()
+    assert datos['estado'] == 'completado'
+    assert datos['etapas'] == {'grafo': 1.0, 'rutas': 1.0}
+    assert datos['resultado'] == {'total': 3} and datos['codigo'] == 200
+    assert 'resultado' not in trabajo.to_dict(con_resultado=False)
+
+def test_misma_clave_activa_reutiliza_el_trabajo():
+    gestor = GestorTrabajos(max_trabajadores=2)
+    liberar = threading.Event()
+
+    def lento(trabajo):
+        liberar.wait(5)
+        return {}, 200
+
+    primero, nuevo = gestor.enviar('procesar', 'misma', {}, lento)
+    segundo, repetido = gestor.enviar('procesar', 'misma', {}, lento)
+    otro, _ = gestor.enviar('procesar', 'otra', {}, lento)
+    assert nuevo and not repetido
+    assert segundo is primero and otro is not primero
+    liberar.set()
+    _esperar(primero)
+    _esperar(otro)
+
+    # Terminado, la misma clave vuelve a encolarse
+    tercero, nuevo = gestor.enviar('procesar', 'misma', {}, lambda trabajo: ({}, 200))
+    assert nuevo and tercero is not primero
+    _esperar(tercero)
+
+def test_errores_y_retencion():
+    gestor = GestorTrabajos(max_trabajadores=1, max_retenidos=2)
+
+    def falla(trabajo):
+        raise ValueError('sin embalses')
+
+    excepcion, _ = gestor.enviar('procesar', 'a', {}, falla)
+    rechazo, _ = gestor.enviar('procesar', 'b', {}, lambda trabajo: ({'error': 'fuente inválida'}, 400))
+    _esperar(excepcion)
+    _esperar(rechazo)
+    assert (excepcion.estado, excepcion.error) == ('error', 'sin embalses')
+    assert (rechazo.estado, rechazo.error) == ('error', 'fuente inválida')
+
+    ultimo, _ = gestor.enviar('procesar', 'c', {}, lambda trabajo: ({}, 200))
+    _esperar(ultimo)
+    assert gestor.obtener(excepcion.id) is None
+    assert gestor.obtener(rechazo.id) is rechazo and gestor.obtener(ultimo.id) is ultimo
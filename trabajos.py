@@ -0,0 +1,123 @@
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+ESTADOS_TRABAJO = ('pendiente', 'ejecutando', 'completado', 'error')
+
+class Trabajo:
+    """One background computation with its status, per-stage progress and result."""
+
+    def __init__(self, tipo, clave, parametros):
+        self.id = uuid.uuid4().hex
+        self.tipo = tipo
+        self.clave = clave
+        self.parametros = parametros
+        self.estado = 'pendiente'
+        self.etapa = None
+        self.etapas = {}
+        self.resultado = None
+        self.codigo = None
+        self.error = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.terminado = None
+        self._lock = threading.Lock()
+
+    @property
+    def activo(self):
+        return self.estado in ('pendiente', 'ejecutando')
+
+    def avanzar(self, etapa, avance=0.0):
+        """Record progress (0..1) of ``etapa``; earlier stages are marked done."""
+        with self._lock:
+            if self.etapa is not None and self.etapa != etapa:
+                self.etapas[self.etapa] = 1.0
+            self.etapa = etapa
+            self.etapas[etapa] = round(min(max(avance, 0.0), 1.0), 3)
+
+    def to_dict(self, con_resultado=True):
+        with self._lock:
+            datos = {
+                'id': self.id,
+                'tipo': self.tipo,
+                'estado': self.estado,
+                'parametros': self.parametros,
+                'etapa': self.etapa,
+                'etapas': dict(self.etapas),
+                'error': self.error,
+                'creado': self.creado,
+                'iniciado': self.iniciado,
+                'terminado': self.terminado,
+            }
+            if con_resultado and self.estado == 'completado':
+                datos['resultado'] = self.resultado
+                datos['codigo'] = self.codigo
+            return datos
+
+class GestorTrabajos:
+    """Bounded worker pool for long computations, with deduplication.
+
+    ``enviar`` returns at once; the job runs on one of ``max_trabajadores``
+    threads. A job whose ``clave`` matches a pending or running one is not
+    queued again, the existing job is returned instead. Finished jobs are
+    kept until ``max_retenidos`` newer ones have been submitted.
+    """
+
+    def __init__(self, max_trabajadores=2, max_retenidos=200):
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_trabajadores, thread_name_prefix='trabajo')
+        self._lock = threading.Lock()
+        self._trabajos = OrderedDict()
+        self._activos = {}
+        self.max_retenidos = max_retenidos
+
+    def enviar(self, tipo, clave, parametros, funcion):
+        """Queue ``funcion(trabajo)`` and return ``(trabajo, nuevo)``.
+
+        ``funcion`` returns ``(resultado, codigo)`` and may report progress
+        through ``trabajo.avanzar``.
+        """
+        with self._lock:
+            existente = self._activos.get(clave)
+            if existente is not None and existente.activo:
+                return existente, False
+
+            trabajo = Trabajo(tipo, clave, parametros)
+            self._trabajos[trabajo.id] = trabajo
+            self._activos[clave] = trabajo
+            while len(self._trabajos) > self.max_retenidos:
+                _, viejo = next(iter(self._trabajos.items()))
+                if viejo.activo:
+                    break
+                self._trabajos.popitem(last=False)
+
+        self._ejecutor.submit(self._ejecutar, trabajo, funcion)
+        return trabajo, True
+
+    def obtener(self, id_trabajo):
+        with self._lock:
+            return self._trabajos.get(id_trabajo)
+
+    def _ejecutar(self, trabajo, funcion):
+        trabajo.estado = 'ejecutando'
+        trabajo.iniciado = time.time()
+        try:
+            trabajo.resultado, trabajo.codigo = funcion(trabajo)
+            if trabajo.etapa is not None:
+                trabajo.avanzar(trabajo.etapa, 1.0)
+            trabajo.estado = 'completado' if trabajo.codigo < 400 else 'error'
+            if trabajo.estado == 'error':
+                trabajo.error = (trabajo.resultado or {}).get('error')
+        except Exception as e:
+            logging.error(f"Job {trabajo.id} ({trabajo.tipo}) failed: {e}")
+            trabajo.error = str(e)
+            trabajo.estado = 'error'
+        finally:
+            trabajo.terminado = time.time()
+            with self._lock:
+                if self._activos.get(trabajo.clave) is trabajo:
+                    del self._activos[trabajo.clave]
+            logging.info(f"Job {trabajo.id} ({trabajo.tipo}) {trabajo.estado} "
+                         f"in {trabajo.terminado - trabajo.iniciado:.2f}s")